@@ -0,0 +1,52 @@
+"""
+Micro-benchmark del parser: compara la extracción de campos en una sola
+pasada (parser._scan) con las ~25 búsquedas root.find(".//...") anteriores.
+
+Uso:
+    python benchmarks/bench_parse.py [carpeta] [-n repeticiones]
+"""
+import argparse
+import pathlib
+import timeit
+import xml.etree.ElementTree as ET
+
+from sii_xml_pdf.ns import x
+from sii_xml_pdf.parser import _HEADER_TAGS, _scan, parse_xml
+
+
+def _legacy_scan(root):
+    """Extracción como se hacía antes: un find/findall por campo."""
+    header = {}
+    for tag in _HEADER_TAGS.values():
+        el = root.find(f".//{x(tag)}")
+        if el is not None:
+            header[tag] = el
+    detalles = root.findall(f".//{x('Detalle')}")
+    referencias = root.findall(f".//{x('Referencia')}")
+    impuestos = root.findall(f".//{x('ImptoReten')}")
+    return header, detalles, referencias, impuestos
+
+
+def main():
+    here = pathlib.Path(__file__).resolve().parent
+    ap = argparse.ArgumentParser()
+    ap.add_argument("folder", nargs="?", default=str(here.parent / "examples" / "input"))
+    ap.add_argument("-n", "--number", type=int, default=2000)
+    args = ap.parse_args()
+
+    files = sorted(pathlib.Path(args.folder).glob("*.xml"))
+    print(f"{'archivo':32} {'nodos':>6} {'find x25 (µs)':>14} {'1 pasada (µs)':>14} {'speedup':>8} {'parse_xml (µs)':>15}")
+    for f in files:
+        root = ET.parse(str(f)).getroot()
+        assert _legacy_scan(root) == _scan(root), f"resultado distinto en {f.name}"
+
+        n = args.number
+        t_old = timeit.timeit(lambda: _legacy_scan(root), number=n) / n * 1e6
+        t_new = timeit.timeit(lambda: _scan(root), number=n) / n * 1e6
+        t_full = timeit.timeit(lambda: parse_xml(f), number=n // 10 or 1) / (n // 10 or 1) * 1e6
+        nodes = sum(1 for _ in root.iter())
+        print(f"{f.name:32} {nodes:>6} {t_old:>14.1f} {t_new:>14.1f} {t_old / t_new:>7.1f}x {t_full:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
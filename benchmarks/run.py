@@ -0,0 +1,367 @@
+"""
+Suite de benchmarks reproducible.
+
+Genera DTE sintéticos (ver synthetic.py) y mide por separado cada etapa del
+pipeline, la conversión de una carpeta con la CLI, el endpoint /render en
+proceso y la curva de facturas largas (suite ``long``). Los resultados se guardan en JSON para comparar corridas.
+
+Uso:
+    python benchmarks/run.py                         # todo, grilla completa
+    python benchmarks/run.py --quick -o base.json    # grilla reducida
+    python benchmarks/run.py --suite stages --baseline base.json --threshold 0.2
+
+Con ``--baseline`` termina con código 1 si alguna medición empeora más que
+``--threshold`` (0.2 = 20 %) respecto de la corrida anterior. La suite
+``startup`` falla además si los imports de la CLI superan su presupuesto
+(``--budget-help`` / ``--budget-convert``).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import pathlib
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+from synthetic import TIPOS, make_dte_xml, write_folder  # noqa: E402
+
+GRID_ITEMS = (1, 10, 100, 1000, 5000)
+QUICK_ITEMS = (1, 100)
+LONG_ITEMS = (100, 1000, 5000, 10000)
+QUICK_LONG_ITEMS = (100, 1000)
+
+
+def timed(fn, repeat: int) -> dict:
+    """Corre ``fn`` ``repeat`` veces; devuelve mediana y mínimo en segundos."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {"median": statistics.median(samples), "min": min(samples), "n": repeat}
+
+
+def _repeat_for(items: int, repeat: int) -> int:
+    # Los documentos grandes tardan segundos: menos vueltas
+    return max(1, repeat // max(1, items // 100))
+
+
+@contextlib.contextmanager
+def _quiet():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def _cases(args):
+    for tipo in args.tipos:
+        for items in args.items:
+            xml = make_dte_xml(tipo, items=items, refs=args.refs, taxes=args.taxes)
+            yield f"T{tipo}/items={items}", tipo, items, xml
+
+
+def bench_stages(args) -> dict:
+    """
+    parse_xml (sin y con validación estricta), timbre PDF417, render_html y
+    layout de WeasyPrint por separado, más el PDF completo con el motor fast.
+    """
+    from weasyprint import HTML
+
+    from sii_xml_pdf import barcode, renderer
+    from sii_xml_pdf.parser import parse_xml
+
+    styles = renderer.get_stylesheets()
+    font_config = renderer.get_font_config()
+
+    results = {}
+    for case, tipo, items, xml in _cases(args):
+        repeat = _repeat_for(items, args.repeat)
+        dte = parse_xml(xml)
+
+        def _barcode():
+            # Sin caché: se mide la codificación, no el acierto del lru_cache
+            barcode._render.cache_clear()
+            barcode._clean_ted_cached.cache_clear()
+            barcode.pdf417_markup_from_ted(dte.timbre_xml)
+
+        html = renderer.render_html(dte)
+        r = {
+            "parse": timed(lambda: parse_xml(xml), repeat * 10),
+            "parse_strict": timed(lambda: parse_xml(xml, validate=True), repeat * 10),
+            "barcode": timed(_barcode, args.repeat),
+            "html": timed(lambda: renderer.render_html(dte), repeat),
+            "pdf": timed(lambda: HTML(string=html).write_pdf(
+                stylesheets=styles, font_config=font_config), repeat),
+            "fast": timed(lambda: renderer.render_pdf(dte, engine="fast"), repeat),
+        }
+        results[f"stages/{case}"] = r
+        print(f"  {case:22} " + "  ".join(f"{k}={v['median'] * 1000:.2f}ms" for k, v in r.items()))
+    return results
+
+
+def bench_cli(args) -> dict:
+    """convert-folder sobre una carpeta sintética, en serie y en paralelo."""
+    from sii_xml_pdf.cli import convert_folder
+    from sii_xml_pdf.pool import default_jobs
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = write_folder(pathlib.Path(tmp) / "xml", args.cli_files, items=args.cli_items)
+        for jobs in sorted({1, default_jobs()}):
+            out = pathlib.Path(tmp) / f"pdf-{jobs}"
+
+            def _run():
+                with _quiet():
+                    convert_folder(str(folder), str(out), None, jobs)
+
+            r = timed(_run, args.cli_repeat)
+            r["files_per_sec"] = args.cli_files / r["median"]
+            results[f"cli/convert-folder/jobs={jobs}"] = {"total": r}
+            print(f"  convert-folder jobs={jobs:<3} {r['median']:.2f}s ({r['files_per_sec']:.1f} archivos/s)")
+    return results
+
+
+def bench_service(args) -> dict:
+    """POST /render en proceso con el TestClient de FastAPI (sin red)."""
+    for k, v in {"API_TOKEN": "bench", "SMTP_USER": "bench", "SMTP_PASS": "bench",
+                 "SMTP_FROM": "bench@example.com", "RENDER_CACHE": ""}.items():
+        os.environ.setdefault(k, v)
+    sys.path.insert(0, str(HERE.parent / "src"))
+    from fastapi.testclient import TestClient
+
+    from service.main import app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    headers = {"Authorization": f"Bearer {os.environ['API_TOKEN']}"}
+    results = {}
+    with TestClient(app) as client:
+        for case, tipo, items, xml in _cases(args):
+            files = {"file": ("bench.xml", xml, "application/xml")}
+
+            def _post():
+                resp = client.post("/render", headers=headers, files=files)
+                resp.raise_for_status()
+
+            _post()  # calienta el pool de procesos
+            r = timed(_post, _repeat_for(items, args.repeat))
+            results[f"service/render/{case}"] = {"total": r}
+            print(f"  /render {case:22} {r['median'] * 1000:.2f}ms")
+    return results
+
+
+def bench_long(args) -> dict:
+    """
+    Curva de facturas largas: HTML + layout + PDF a 100/1k/5k/10k líneas.
+    Con la paginación por tablas el costo por página debe quedar casi
+    constante; falla si el ms/línea del caso mayor supera ``--max-slope``
+    veces el del menor. ``--long-single`` mide además la tabla única (lento).
+    """
+    from weasyprint import HTML
+
+    from sii_xml_pdf import renderer
+    from sii_xml_pdf.parser import parse_xml
+
+    styles = renderer.get_stylesheets()
+    font_config = renderer.get_font_config()
+
+    def _render(dte) -> int:
+        doc = HTML(string=renderer.render_html(dte)).render(stylesheets=styles, font_config=font_config)
+        doc.write_pdf()
+        return len(doc.pages)
+
+    layouts = {"paginado": renderer.LONG_INVOICE_ITEMS}
+    if args.long_single:
+        layouts["tabla_unica"] = 10 ** 9  # nunca parte los ítems
+
+    results = {}
+    default_limit = renderer.LONG_INVOICE_ITEMS
+    try:
+        for layout, limit in layouts.items():
+            renderer.LONG_INVOICE_ITEMS = limit
+            per_line = []
+            for items in args.long_items:
+                dte = parse_xml(make_dte_xml(33, items=items, refs=args.refs, taxes=args.taxes))
+                pages = _render(dte)
+                r = timed(lambda: _render(dte), max(1, args.repeat // max(1, items // 1000)))
+                r["pages"] = pages
+                r["ms_per_line"] = r["median"] * 1000 / items
+                r["ms_per_page"] = r["median"] * 1000 / pages
+                per_line.append(r["ms_per_line"])
+                results[f"long/{layout}/items={items}"] = {"total": r}
+                print(f"  {layout:11} items={items:<6} {r['median']:.2f}s  páginas={pages:<4} "
+                      f"{r['ms_per_line']:.2f}ms/línea  {r['ms_per_page']:.1f}ms/página")
+            slope = per_line[-1] / per_line[0]
+            if layout == "paginado" and len(per_line) > 1 and slope > args.max_slope:
+                args.failures.append(f"long/{layout}: ms/línea crece x{slope:.2f} "
+                                     f"(máx. x{args.max_slope:.2f}), no escala lineal")
+    finally:
+        renderer.LONG_INVOICE_ITEMS = default_limit
+    return results
+
+
+_RE_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _importtime(cmd) -> tuple:
+    """
+    Corre ``python -X importtime <cmd>``: devuelve (segundos de pared,
+    segundos de imports, [(ms acumulados, módulo)] de los imports de primer nivel).
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", *cmd], capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} terminó con {proc.returncode}: {proc.stderr[-500:]}")
+
+    # Solo imports de primer nivel (el acumulado incluye a sus hijos); "site"
+    # depende del entorno (.pth, sitecustomize), no de este paquete
+    top = [(int(m.group(2)) / 1000, m.group(4)) for m in _RE_IMPORTTIME.finditer(proc.stderr)
+           if not m.group(3) and m.group(4) != "site"]
+    total = sum(ms for ms, _ in top) / 1000
+    return wall, total, sorted(top, reverse=True)[:5]
+
+
+def bench_startup(args) -> dict:
+    """Arranque de la CLI (`--help` y `convert` de un XML) con -X importtime."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        xml = pathlib.Path(tmp) / "T33.xml"
+        xml.write_bytes(make_dte_xml(33, items=10))
+        commands = {
+            "help": ["-m", "sii_xml_pdf.cli", "--help"],
+            "convert": ["-m", "sii_xml_pdf.cli", "convert", str(xml), "-o", f"{tmp}/"],
+        }
+        for name, cmd in commands.items():
+            runs = [_importtime(cmd) for _ in range(args.repeat)]
+            walls = [w for w, _, _ in runs]
+            imports = [i for _, i, _ in runs]
+            results[f"startup/{name}"] = {
+                "wall": {"median": statistics.median(walls), "min": min(walls), "n": len(runs)},
+                "import": {"median": statistics.median(imports), "min": min(imports), "n": len(runs)},
+            }
+            top = ", ".join(f"{mod} {ms:.0f}ms" for ms, mod in runs[-1][2])
+            budget = args.startup_budget[name]
+            mark = "✅" if statistics.median(imports) <= budget else "❌"
+            print(f"  {mark} {name:8} imports={statistics.median(imports) * 1000:.0f}ms "
+                  f"(presupuesto {budget * 1000:.0f}ms) pared={statistics.median(walls) * 1000:.0f}ms  [{top}]")
+            if mark == "❌":
+                args.failures.append(f"startup/{name}: imports sobre el presupuesto de {budget * 1000:.0f}ms")
+    return results
+
+
+# Suites disponibles; para agregar una basta con registrarla aquí
+SUITES = {
+    "stages": bench_stages,
+    "cli": bench_cli,
+    "service": bench_service,
+    "startup": bench_startup,
+    "long": bench_long,
+}
+
+
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True,
+                             capture_output=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "git": rev,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Mediciones cuya mediana empeoró más que ``threshold`` (en fracción)."""
+    regressions = []
+    for case, stages in current.items():
+        for stage, r in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if not base or not base.get("median"):
+                continue
+            ratio = r["median"] / base["median"]
+            if ratio > 1 + threshold:
+                regressions.append((f"{case}:{stage}", base["median"], r["median"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks de sii_xml_pdf")
+    ap.add_argument("--suite", default=",".join(SUITES),
+                    help=f"Suites separadas por coma ({', '.join(SUITES)})")
+    ap.add_argument("--quick", action="store_true", help="Grilla reducida (para CI)")
+    ap.add_argument("--tipos", default=None, help="Tipos de DTE, p.ej. 33,61")
+    ap.add_argument("--items", default=None, help="Cantidades de Detalle, p.ej. 1,100,5000")
+    ap.add_argument("--refs", type=int, default=2)
+    ap.add_argument("--taxes", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cli-files", type=int, default=40)
+    ap.add_argument("--cli-items", type=int, default=20)
+    ap.add_argument("--cli-repeat", type=int, default=1)
+    ap.add_argument("-o", "--out", default=str(HERE / "results.json"))
+    ap.add_argument("--baseline", default=None, help="JSON de una corrida anterior")
+    ap.add_argument("--threshold", type=float, default=0.2)
+    ap.add_argument("--budget-help", type=float, default=0.15,
+                    help="Segundos máx. de imports para `sii-xml-pdf --help`")
+    ap.add_argument("--budget-convert", type=float, default=1.0,
+                    help="Segundos máx. de imports para `sii-xml-pdf convert`")
+    ap.add_argument("--long-items", default=None, help="Líneas de la curva larga, p.ej. 100,1000,10000")
+    ap.add_argument("--long-single", action="store_true",
+                    help="Mide también la tabla única en la suite long")
+    ap.add_argument("--max-slope", type=float, default=1.5,
+                    help="Crecimiento máx. del ms/línea entre el menor y el mayor caso largo")
+    args = ap.parse_args(argv)
+    args.startup_budget = {"help": args.budget_help, "convert": args.budget_convert}
+    args.failures = []
+
+    if args.quick:
+        args.tipos = args.tipos or "33,61"
+        args.items = args.items or ",".join(map(str, QUICK_ITEMS))
+        args.repeat = min(args.repeat, 3)
+        args.cli_files = min(args.cli_files, 10)
+        args.long_items = args.long_items or ",".join(map(str, QUICK_LONG_ITEMS))
+    args.tipos = [int(t) for t in (args.tipos or ",".join(map(str, TIPOS))).split(",")]
+    args.items = [int(n) for n in (args.items or ",".join(map(str, GRID_ITEMS))).split(",")]
+    args.long_items = [int(n) for n in (args.long_items or ",".join(map(str, LONG_ITEMS))).split(",")]
+
+    results = {}
+    for name in args.suite.split(","):
+        if name not in SUITES:
+            ap.error(f"Suite desconocida: {name}")
+        print(f"⏱️  {name}")
+        results.update(SUITES[name](args))
+
+    out = pathlib.Path(args.out)
+    out.write_text(json.dumps({"meta": _meta(), "results": results}, indent=2), encoding="utf-8")
+    print(f"✅ Resultados en {out}")
+
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, now, ratio in regressions:
+            print(f"❌ {name}: {before * 1000:.2f}ms → {now * 1000:.2f}ms (x{ratio:.2f})")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Sin regresiones sobre {args.threshold:.0%}")
+
+    if args.failures:
+        for msg in args.failures:
+            print(f"❌ {msg}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Generador de DTE sintéticos para benchmarks.
+
+Produce XML con la misma estructura que los del SII (Encabezado, Detalle,
+Referencia, ImptoReten, TED) y contenido reproducible a partir de una
+semilla. La firma y el FRMT son de relleno: sirven para medir, no para
+validar ante el SII.
+"""
+import pathlib
+import random
+from xml.sax.saxutils import escape
+
+TIPOS = (33, 34, 52, 61)
+
+_PALABRAS = (
+    "CEMENTO", "FIERRO", "PLANCHA", "TORNILLO", "CLAVO", "PINTURA", "LATEX",
+    "MADERA", "PINO", "CAÑERÍA", "CODO", "TEE", "ADHESIVO", "SILICONA",
+    "MALLA", "ALAMBRE", "BROCHA", "RODILLO", "DISCO", "CORTE", "TUBO", "PVC",
+)
+_RAZONES = ("Ferretería Laesquina S.A.", "Constructora Begur S.A.",
+            "Distribuidora Ñuñoa Ltda.", "Servicios Acme SpA")
+_CIUDADES = ("SANTIAGO", "VALPARAÍSO", "CONCEPCIÓN", "TEMUCO")
+
+
+def _rut(rng: random.Random) -> str:
+    cuerpo = rng.randint(5_000_000, 99_999_999)
+    return f"{cuerpo}-{rng.choice('0123456789K')}"
+
+
+def make_dte_xml(tipo: int = 33, items: int = 10, refs: int = 0, taxes: int = 0,
+                 folio: int = 1, seed: int = 0) -> bytes:
+    """XML de un DTE (raíz <DTE>) con ``items`` líneas de Detalle."""
+    rng = random.Random(f"{seed}-{tipo}-{items}-{refs}-{taxes}-{folio}")
+    exento = tipo == 34
+    rut_emisor, rut_recep = _rut(rng), _rut(rng)
+    razon, razon_recep = rng.sample(_RAZONES, 2)
+    fecha = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+    detalles = []
+    primer_item = ""
+    neto = 0
+    for n in range(1, items + 1):
+        qty = rng.randint(1, 50)
+        prc = rng.randint(100, 200_000)
+        monto = qty * prc
+        neto += monto
+        nombre = " ".join(rng.choice(_PALABRAS) for _ in range(rng.randint(2, 5)))
+        primer_item = primer_item or nombre
+        detalles.append(
+            f"<Detalle><NroLinDet>{n}</NroLinDet>"
+            f"<CdgItem><TpoCodigo>INT1</TpoCodigo><VlrCodigo>{rng.randint(1000, 999999)}</VlrCodigo></CdgItem>"
+            + ("<IndExe>1</IndExe>" if exento else "")
+            + f"<NmbItem>{escape(nombre)}</NmbItem><QtyItem>{qty}</QtyItem><UnmdItem>UN</UnmdItem>"
+            f"<PrcItem>{prc}</PrcItem><MontoItem>{monto}</MontoItem></Detalle>"
+        )
+
+    iva = 0 if exento else round(neto * 0.19)
+    impuestos = []
+    total_imp = 0
+    for _ in range(taxes):
+        monto_imp = rng.randint(100, 50_000)
+        total_imp += monto_imp
+        impuestos.append(
+            f"<ImptoReten><TipoImp>{rng.choice(('15', '17', '24', '27', '28'))}</TipoImp>"
+            f"<TasaImp>10</TasaImp><MontoImp>{monto_imp}</MontoImp></ImptoReten>"
+        )
+    total = neto + iva + total_imp
+    montos = (f"<MntExe>{neto}</MntExe>" if exento else
+              f"<MntNeto>{neto}</MntNeto><MntExe>0</MntExe><TasaIVA>19</TasaIVA><IVA>{iva}</IVA>")
+
+    referencias = []
+    for n in range(1, refs + 1):
+        tpo = 33 if tipo == 61 else rng.choice((801, 52, 33))
+        referencias.append(
+            f"<Referencia><NroLinRef>{n}</NroLinRef><TpoDocRef>{tpo}</TpoDocRef>"
+            f"<FolioRef>{rng.randint(1, 999999)}</FolioRef><FchRef>{fecha}</FchRef></Referencia>"
+        )
+
+    ted = (
+        f'<TED version="1.0"><DD><RE>{rut_emisor}</RE><TD>{tipo}</TD><F>{folio}</F>'
+        f"<FE>{fecha}</FE><RR>{rut_recep}</RR><RSR>{escape(razon_recep[:40])}</RSR>"
+        f"<MNT>{total}</MNT><IT1>{escape(primer_item[:40])}</IT1>"
+        f'<CAF version="1.0"><DA><RE>{rut_emisor}</RE><RS>{escape(razon[:40])}</RS><TD>{tipo}</TD>'
+        f"<RNG><D>1</D><H>1000000</H></RNG><FA>2025-01-01</FA>"
+        f"<RSAPK><M>{'A' * 86}==</M><E>Aw==</E></RSAPK><IDK>100</IDK></DA>"
+        f'<FRMA algoritmo="SHA1withRSA">{"B" * 86}==</FRMA></CAF>'
+        f"<TSTED>{fecha}T10:00:00</TSTED></DD>"
+        f'<FRMT algoritmo="SHA1withRSA">{"C" * 86}==</FRMT></TED>'
+    )
+
+    ciudad = rng.choice(_CIUDADES)
+    xml = (
+        '<?xml version="1.0" encoding="ISO-8859-1"?>'
+        '<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0">'
+        f'<Documento ID="T{tipo}F{folio}"><Encabezado>'
+        f"<IdDoc><TipoDTE>{tipo}</TipoDTE><Folio>{folio}</Folio><FchEmis>{fecha}</FchEmis>"
+        f"<FmaPago>{rng.choice((1, 2))}</FmaPago><FchVenc>{fecha}</FchVenc></IdDoc>"
+        f"<Emisor><RUTEmisor>{rut_emisor}</RUTEmisor><RznSoc>{escape(razon)}</RznSoc>"
+        "<GiroEmis>VENTA DE MATERIALES DE CONSTRUCCIÓN</GiroEmis><Acteco>514320</Acteco>"
+        f"<DirOrigen>PANAMERICANA {rng.randint(100, 9999)}</DirOrigen><CmnaOrigen>QUILICURA</CmnaOrigen>"
+        f"<CiudadOrigen>{ciudad}</CiudadOrigen></Emisor>"
+        f"<Receptor><RUTRecep>{rut_recep}</RUTRecep><RznSocRecep>{escape(razon_recep)}</RznSocRecep>"
+        "<GiroRecep>CONSTRUCCIÓN</GiroRecep><DirRecep>ISIDORA GOYENECHEA 3600</DirRecep>"
+        f"<CmnaRecep>LAS CONDES</CmnaRecep><CiudadRecep>{ciudad}</CiudadRecep></Receptor>"
+        f"<Totales>{montos}{''.join(impuestos)}<MntTotal>{total}</MntTotal></Totales>"
+        "</Encabezado>"
+        + "".join(detalles) + "".join(referencias) + ted
+        + f"<TmstFirma>{fecha}T10:00:00</TmstFirma></Documento>"
+        '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo/>'
+        f"<SignatureValue>{'D' * 172}</SignatureValue></Signature>"
+        "</DTE>"
+    )
+    return xml.encode("iso-8859-1")
+
+
+def write_folder(folder, count: int, tipo: int = 33, items: int = 10, refs: int = 1,
+                 taxes: int = 0, seed: int = 0):
+    """Escribe ``count`` XML sintéticos en ``folder`` (para medir convert-folder)."""
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    for folio in range(1, count + 1):
+        data = make_dte_xml(tipo, items=items, refs=refs, taxes=taxes, folio=folio, seed=seed)
+        (folder / f"T{tipo}_{folio:06d}.xml").write_bytes(data)
+    return folder
@@ -0,0 +1,160 @@
+"""
+/render-batch: varios XML (partes multipart o un ZIP) renderizados en el
+pool de /render y devueltos como un ZIP que se va enviando a medida que
+termina cada PDF (transferencia chunked, sin armar el ZIP en memoria).
+
+Al final del ZIP va manifest.json con el resultado de cada XML, incluidos
+los que fallaron.
+
+Las partes subidas se copian al spool y cada XML se lee desde ahí en el
+proceso del pool, recién cuando le toca: la API no guarda el lote en memoria.
+"""
+import asyncio
+import json
+import logging
+import time
+import zipfile
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sii_xml_pdf.errors import MalformedXMLError, error_kind
+from sii_xml_pdf.naming import pdf_name, unique_name
+from sii_xml_pdf.parser import iter_dtes
+from sii_xml_pdf.renderer import render_pdf
+from . import spool
+from .metrics import observe_render
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def render_documents(xml_bytes: bytes, engine: str = "html") -> list:
+    """
+    [(nombre, PDF, tiempos)] de cada Documento del XML (también sobres
+    EnvioDTE). Corre en el pool de procesos.
+    """
+    results = []
+    for dte in iter_dtes(xml_bytes):
+        timings = {}
+        pdf = render_pdf(dte, timings=timings, engine=engine)
+        results.append((pdf_name(dte, sanitize=True), pdf, timings))
+    if not results:
+        raise MalformedXMLError("el XML no contiene ningún Documento")
+    return results
+
+
+# (nombre, ruta en el spool, nombre dentro del ZIP o None si la parte es el XML)
+Member = Tuple[str, str, Optional[str]]
+
+
+def zip_members(path: str, max_files: int, max_size: int) -> List[str]:
+    """
+    Nombres de los .xml de un ZIP del spool, mirando solo su directorio: sin
+    descomprimir nada. ValueError si no es ZIP; spool.UploadTooLarge si trae
+    más de ``max_files`` XML o alguno declara más de ``max_size`` bytes.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = [info for info in zf.infolist()
+                     if not info.is_dir() and info.filename.lower().endswith(".xml")]
+    except zipfile.BadZipFile:
+        raise ValueError("Archivo no es un ZIP válido")
+    if len(infos) > max_files:
+        raise spool.UploadTooLarge(f"Máximo {max_files} XML")
+    too_big = [info.filename for info in infos if info.file_size > max_size]
+    if too_big:
+        raise spool.UploadTooLarge(f"XML too large: {', '.join(too_big[:5])}")
+    return [info.filename for info in infos]
+
+
+def render_member(path: str, member: Optional[str], engine: str = "html") -> list:
+    """render_documents de un XML del spool (suelto o dentro de un ZIP). Corre en el pool."""
+    if member is None:
+        with open(path, "rb") as f:
+            return render_documents(f.read(), engine)
+    with zipfile.ZipFile(path) as zf:
+        # ZipExtFile no entrega más de lo que declara el directorio (ya validado)
+        return render_documents(zf.read(member), engine)
+
+
+class _ZipStream:
+    """
+    Destino de zipfile sin seek: lo escrito se acumula hasta que el
+    generador lo saca con ``take()``. Sin tell/seek, zipfile escribe los
+    tamaños en data descriptors y el ZIP se puede enviar por partes.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _render_one(pool, limit: asyncio.Semaphore, member: Member, engine: str):
+    name, path, inner = member
+    try:
+        async with limit:
+            return name, await pool.run(render_member, path, inner, engine, wait=True), None
+    except asyncio.TimeoutError:
+        return name, None, ("timeout", "Render timeout")
+    except Exception as e:
+        return name, None, (error_kind(e), f"{type(e).__name__}: {e}")
+
+
+async def stream_batch(pool, members: List[Member], engine: str = "html", slots: int = 1,
+                       spooled: Sequence[str] = ()) -> AsyncIterator[bytes]:
+    """
+    Renderiza ``members`` en paralelo y entrega el ZIP por partes, un PDF a
+    la vez según van terminando. Un lote ocupa a lo más ``slots`` cupos del
+    pool, así /render y otros lotes siguen teniendo cupos mientras tanto.
+    Al terminar (o si el cliente se desconecta) borra ``spooled`` del spool.
+    """
+    t0 = time.perf_counter()
+    out = _ZipStream()
+    zf = zipfile.ZipFile(out, "w", zipfile.ZIP_STORED)
+    limit = asyncio.Semaphore(max(1, min(slots, pool.workers)))
+    tasks = [asyncio.ensure_future(_render_one(pool, limit, member, engine))
+             for member in members]
+    manifest, seen = [], set()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            name, docs, error = await next_done
+            if error is not None:
+                kind, detail = error
+                logger.warning("⚠️ Error convirtiendo %s (%s): %s", name, kind, detail)
+                manifest.append({"archivo": name, "ok": False, "tipo": kind, "error": detail})
+                continue
+
+            pdfs = []
+            for pdf_file, pdf, timings in docs:
+                observe_render(timings, len(pdf))
+                pdf_file = unique_name(pdf_file, seen)
+                zf.writestr(pdf_file, pdf)
+                pdfs.append(pdf_file)
+                yield out.take()
+            manifest.append({"archivo": name, "ok": True, "pdfs": pdfs})
+
+        zf.writestr(MANIFEST_NAME, json.dumps({
+            "total": len(members),
+            "fallidos": sum(1 for m in manifest if not m["ok"]),
+            "archivos": sorted(manifest, key=lambda m: m["archivo"]),
+        }, ensure_ascii=False, indent=2))
+        zf.close()
+        yield out.take()
+        logger.info("📦 Lote de %s XML enviado en %.1fs", len(members), time.perf_counter() - t0)
+    finally:
+        # Cliente desconectado: no seguir renderizando para nadie
+        for task in tasks:
+            task.cancel()
+        for path in spooled:
+            spool.remove(path)
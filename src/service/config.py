@@ -1,8 +1,11 @@
 from fastapi_mail import ConnectionConfig
+from redis import Redis
 import os
 import logging
 import sys
 
+from sii_xml_pdf.cache import DiskCache, RedisCache
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -12,13 +15,92 @@ logging.basicConfig(
 
 
 MAIL_CONF = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("SMTP_USER"),
-    MAIL_PASSWORD = os.getenv("SMTP_PASS"),
+    MAIL_USERNAME = os.getenv("SMTP_USER", ""),
+    MAIL_PASSWORD = os.getenv("SMTP_PASS", ""),
     MAIL_FROM = os.getenv("SMTP_FROM", "noreply@example.com"),
     MAIL_PORT = int(os.getenv("SMTP_PORT", 587)),
     MAIL_SERVER = os.getenv("SMTP_HOST", "smtp.example.com"),
-    MAIL_STARTTLS=True,   # 👈 usa esto para STARTTLS (587)
-    MAIL_SSL_TLS=False,   # 👈 usa esto en lugar de MAIL_SSL
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
+    MAIL_STARTTLS=os.getenv("MAIL_STARTTLS", "true").lower() == "true",  # 👈 STARTTLS (587)
+    MAIL_SSL_TLS=os.getenv("MAIL_SSL_TLS", "false").lower() == "true",   # 👈 TLS directo (465)
+    USE_CREDENTIALS=bool(os.getenv("SMTP_USER")),  # sin usuario no hace login (SMTP local)
+    VALIDATE_CERTS=os.getenv("MAIL_VALIDATE_CERTS", "true").lower() == "true",
 )
+
+
+# Conexión Redis (compartida por API y worker)
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+redis_conn = Redis(host=REDIS_HOST, port=6379)
+
+
+# Caché de PDFs: RENDER_CACHE = "" (desactivada) | "disk" | "redis"
+RENDER_CACHE = os.getenv("RENDER_CACHE", "").lower()
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "/tmp/xml2pdf-cache")
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def build_render_cache():
+    if RENDER_CACHE == "redis":
+        return RedisCache(redis_conn, ttl=RENDER_CACHE_TTL)
+    if RENDER_CACHE == "disk":
+        return DiskCache(RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES)
+    return None
+
+
+_render_cache = False  # False = todavía sin armar (None = caché desactivada)
+
+
+def get_render_cache():
+    """Caché del proceso: se arma una sola vez y la heredan los procesos hijos."""
+    global _render_cache
+    if _render_cache is False:
+        _render_cache = build_render_cache()
+    return _render_cache
+
+
+# Pool de render del endpoint /render
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_IN_FLIGHT = int(os.getenv("RENDER_MAX_IN_FLIGHT", str(RENDER_WORKERS * 4)))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+RENDER_RETRY_AFTER = int(os.getenv("RENDER_RETRY_AFTER", "2"))
+# Cupos del pool que puede ocupar a la vez un solo /render-batch (por defecto
+# todos los workers; el resto de las peticiones igual hace fila en el pool)
+RENDER_BATCH_SLOTS = int(os.getenv("RENDER_BATCH_SLOTS", str(RENDER_WORKERS)))
+
+
+# Colas RQ por tamaño del lote: los ZIP chicos no esperan detrás de los grandes
+QUEUE_SMALL = "xml2pdf-small"
+QUEUE_MEDIUM = "xml2pdf-medium"
+QUEUE_BULK = "xml2pdf-bulk"
+QUEUE_NAMES = (QUEUE_SMALL, QUEUE_MEDIUM, QUEUE_BULK)
+# Cola única anterior: el worker la drena al arrancar (ver jobs.drain_legacy_queue).
+# Se puede quitar en la versión siguiente
+QUEUE_LEGACY = "xml2pdf"
+# Envío de correos: la atiende un worker sin fork, que mantiene abierta la conexión SMTP
+QUEUE_MAIL = "xml2pdf-mail"
+
+# Límites de cada cola: hasta N XML y M MB sin comprimir (lo que pase, a bulk)
+QUEUE_SMALL_MAX_XML = int(os.getenv("QUEUE_SMALL_MAX_XML", "50"))
+QUEUE_SMALL_MAX_MB = float(os.getenv("QUEUE_SMALL_MAX_MB", "5"))
+QUEUE_MEDIUM_MAX_XML = int(os.getenv("QUEUE_MEDIUM_MAX_XML", "1000"))
+QUEUE_MEDIUM_MAX_MB = float(os.getenv("QUEUE_MEDIUM_MAX_MB", "100"))
+
+# Prioridad de cada cola en los workers ("cola=peso,..."); sin peso = 1
+QUEUE_WEIGHTS = os.getenv("QUEUE_WEIGHTS", f"{QUEUE_SMALL}=6,{QUEUE_MEDIUM}=3,{QUEUE_BULK}=1")
+
+
+def parse_queue_weights(spec: str) -> dict:
+    """'a=6,b=3' -> {'a': 6.0, 'b': 3.0}. ValueError si un peso no es un número >= 0."""
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        try:
+            value = float(weight or 1)
+        except ValueError:
+            value = -1.0
+        if not name.strip() or not value >= 0:
+            raise ValueError(f"Peso de cola inválido en QUEUE_WEIGHTS: {part.strip()!r}")
+        weights[name.strip()] = value
+    return weights
@@ -0,0 +1,36 @@
+"""
+Configuración de Gunicorn:
+
+    gunicorn -c python:service.gunicorn_conf service.main:app ...
+
+La app se importa una vez en el master (preload) y se calienta con un render
+de prueba antes de hacer fork: cada worker, también los que se reciclan,
+nace con WeasyPrint, la plantilla, el CSS y las fuentes ya cargados.
+Los workers se reciclan por memoria (WORKER_MAX_RSS_MB), no por peticiones.
+"""
+import logging
+import os
+
+preload_app = True
+
+logger = logging.getLogger(__name__)
+
+
+def when_ready(server):
+    from sii_xml_pdf.renderer import warm_up
+
+    warm_up()
+    logger.info("🔥 Master precalentado, haciendo fork de los workers")
+
+
+def post_worker_init(worker):
+    from service.recycle import start_rss_watchdog
+
+    start_rss_watchdog()
+
+
+def child_exit(server, worker):
+    # Modo multiproceso de Prometheus: descarta los gauges del worker que murió
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
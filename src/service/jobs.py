@@ -1,95 +1,463 @@
-import io
 import zipfile
-import tempfile
+import json
 import os
 import logging
-import re
-from fastapi_mail import FastMail, MessageSchema
-from .config import MAIL_CONF
-from sii_xml_pdf.renderer import parse_xml, render_pdf, render_pdf_from_xml  # 👈 añadimos el fallback
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from rq import Queue, Retry, get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Dependency, Job
+from . import mailer, spool
+from .config import (
+    QUEUE_BULK, QUEUE_LEGACY, QUEUE_MAIL, QUEUE_MEDIUM, QUEUE_MEDIUM_MAX_MB, QUEUE_MEDIUM_MAX_XML,
+    QUEUE_SMALL, QUEUE_SMALL_MAX_MB, QUEUE_SMALL_MAX_XML, get_render_cache, redis_conn,
+)
+# sanitize_name y MAX_RAZON_LEN vivían aquí: se siguen exportando desde jobs
+from sii_xml_pdf.naming import MAX_RAZON_LEN, pdf_name, sanitize_name, unique_name  # noqa: F401
+from sii_xml_pdf.errors import (
+    ERRORS_CSV, QUARANTINE_DIR, MalformedXMLError, RenderError, error_row, errors_csv,
+)
+from sii_xml_pdf.parser import iter_dtes
+from sii_xml_pdf.renderer import render_pdf_cached
 
 logger = logging.getLogger(__name__)
 
-MAX_RAZON_LEN = 40  # 👈 límite de caracteres para razón social
+# Reparto del ZIP en jobs hijos
+ZIP_CHUNK_SIZE = int(os.getenv("ZIP_CHUNK_SIZE", "20"))   # XML por job hijo
+CHUNK_TIMEOUT = int(os.getenv("ZIP_CHUNK_TIMEOUT", "600"))  # máximo por job hijo
+BATCH_TTL = int(os.getenv("ZIP_BATCH_TTL", str(24 * 3600)))
+BATCH_PREFIX = "xml2pdf:batch:"
 
+# Timeout de cada job según el trabajo estimado: base + por XML + por MB
+TIMEOUT_BASE = int(os.getenv("ZIP_TIMEOUT_BASE", "60"))
+TIMEOUT_PER_XML = float(os.getenv("ZIP_TIMEOUT_PER_XML", "2"))
+TIMEOUT_PER_MB = float(os.getenv("ZIP_TIMEOUT_PER_MB", "30"))
+FINAL_TIMEOUT = int(os.getenv("ZIP_FINAL_TIMEOUT", "600"))  # mínimo del job final
+# Reintentos del job final: mientras queden, los PDFs y el ZIP subido se conservan
+FINAL_RETRIES = int(os.getenv("ZIP_FINAL_RETRIES", "2"))
+FINAL_RETRY_INTERVAL = int(os.getenv("ZIP_FINAL_RETRY_INTERVAL", "60"))  # s
 
-def sanitize_name(text: str, max_len: int = MAX_RAZON_LEN) -> str:
-    """Normaliza y acorta la razón social."""
-    clean = text.title().replace(".", "").strip()
-    clean = re.sub(r"[^A-Za-z0-9\s\-]", "", clean)  # quitar caracteres raros
-    if len(clean) > max_len:
-        clean = clean[:max_len].rstrip() + "..."
-    return clean
+MB = 1024 * 1024
 
+MAIL_SUBJECT = "PDFs generados"
+MAIL_BODY = "Adjunto los PDFs generados desde tus XML."
+ZIP_ENTRY_OVERHEAD = 300  # cabecera local + directorio central de un PDF (nombre incluido)
 
-async def process_zip_and_send(zip_bytes: bytes, email: str):
-    logger.info("📦 Procesando ZIP para %s", email)
 
-    pdfs = []
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-        for name in zf.namelist():
-            if not name.lower().endswith(".xml"):
-                continue
-            logger.info("➡️ Convirtiendo %s", name)
-            data = zf.read(name)
+def _batch_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}{batch_id}"
+
+
+def _retry(max_retries: int, interval: int) -> Optional[Retry]:
+    return Retry(max=max_retries, interval=interval) if max_retries > 0 else None
+
+
+def _last_attempt() -> bool:
+    """True si el job actual ya no tiene reintentos de RQ (o no corre en RQ)."""
+    job = get_current_job()
+    return job is None or not job.retries_left
+
+
+def _pdfs_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}{batch_id}:pdfs"
+
+
+def _errors_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}{batch_id}:errors"
+
+
+def zip_xml_entries(zip_path: str) -> List[Tuple[str, int]]:
+    """(nombre, tamaño sin comprimir) de los .xml del ZIP (solo lee el directorio central)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        return [(info.filename, info.file_size) for info in zf.infolist()
+                if info.filename.lower().endswith(".xml")]
+
+
+def zip_xml_names(zip_path: str) -> List[str]:
+    """Nombres de los .xml del ZIP."""
+    return [name for name, _ in zip_xml_entries(zip_path)]
+
+
+def select_queue(n_xml: int, n_bytes: int) -> str:
+    """Cola según el tamaño del lote: small, medium o bulk."""
+    if n_xml <= QUEUE_SMALL_MAX_XML and n_bytes <= QUEUE_SMALL_MAX_MB * MB:
+        return QUEUE_SMALL
+    if n_xml <= QUEUE_MEDIUM_MAX_XML and n_bytes <= QUEUE_MEDIUM_MAX_MB * MB:
+        return QUEUE_MEDIUM
+    return QUEUE_BULK
+
 
+def estimate_timeout(n_xml: int, n_bytes: int) -> int:
+    """Timeout (s) de un job hijo según sus XML y MB, tope CHUNK_TIMEOUT."""
+    seconds = TIMEOUT_BASE + n_xml * TIMEOUT_PER_XML + n_bytes / MB * TIMEOUT_PER_MB
+    return int(min(seconds, CHUNK_TIMEOUT))
+
+
+def enqueue_zip_batch(queues: Dict[str, object], zip_path: str, checksum: str, email: str,
+                      entries: Optional[List[Tuple[str, int]]] = None) -> str:
+    """
+    Reparte los XML del ZIP (ya en el spool) en jobs hijos de ZIP_CHUNK_SIZE
+    documentos, que corren en paralelo en todos los `rq worker` disponibles,
+    y encola el job final (ZIP + email) para cuando terminen todos. A la
+    cola solo van la ruta, el SHA-256 y los nombres, nunca el contenido.
+
+    ``queues`` es {nombre: Queue}: el lote completo va a la cola que le toca
+    por tamaño (ver select_queue). Devuelve el id del lote.
+    """
+    batch_id = uuid.uuid4().hex
+    if entries is None:
+        entries = zip_xml_entries(zip_path)
+    names = [name for name, _ in entries]
+    total_bytes = sum(size for _, size in entries)
+    queue_name = select_queue(len(names), total_bytes)
+    queue = queues[queue_name]
+
+    key = _batch_key(batch_id)
+    redis_conn.hset(key, mapping={
+        "status": "queued", "total": len(names), "done": 0, "failed": 0, "email": email,
+        "spool": zip_path, "queue": queue_name,
+    })
+    redis_conn.expire(key, BATCH_TTL)
+
+    children = []
+    for offset in range(0, len(names), ZIP_CHUNK_SIZE):
+        chunk = entries[offset:offset + ZIP_CHUNK_SIZE]
+        children.append(queue.enqueue(
+            render_chunk, batch_id, offset, zip_path, checksum, [name for name, _ in chunk],
+            job_timeout=estimate_timeout(len(chunk), sum(size for _, size in chunk)),
+        ))
+    # El job final lee todos los PDF del spool y arma el ZIP: crece con el lote
+    queue.enqueue(
+        process_zip_and_send, batch_id, email, zip_path,
+        depends_on=Dependency(jobs=children, allow_failure=True) if children else None,
+        job_id=batch_id, job_timeout=FINAL_TIMEOUT + int(len(names) * TIMEOUT_PER_XML / 10),
+        retry=_retry(FINAL_RETRIES, FINAL_RETRY_INTERVAL),
+    )
+    logger.info("📦 Lote %s: %s XML (%.1f MB) en %s jobs de %s para %s",
+                batch_id, len(names), total_bytes / MB, len(children), queue_name, email)
+    return batch_id
+
+
+def drain_legacy_queue(queues: Dict[str, object]) -> int:
+    """
+    Pasa los jobs de la antigua cola única QUEUE_LEGACY, que traen el ZIP
+    completo en los argumentos (zip_bytes, email), al flujo actual: el ZIP
+    va al spool y se encola como un lote nuevo. Devuelve cuántos movió.
+    """
+    legacy = Queue(QUEUE_LEGACY, connection=redis_conn)
+    moved = 0
+    while True:
+        job_id = redis_conn.lpop(legacy.key)  # con varios workers cada job lo toma uno
+        if job_id is None:
+            break
+        try:
+            job = Job.fetch(job_id.decode(), connection=redis_conn)
+            zip_bytes, email = job.args[:2]
+        except (NoSuchJobError, ValueError, TypeError) as e:
+            logger.error("❌ Job %s de la cola %s ilegible: %s", job_id, QUEUE_LEGACY, str(e))
+            continue
+        path = os.path.join(spool.SPOOL_DIR, f"{job.id}.zip")
+        try:
+            os.makedirs(spool.SPOOL_DIR, exist_ok=True)
+            spool.write_atomic(path, zip_bytes)
+            batch_id = enqueue_zip_batch(queues, path, spool.file_sha256(path), email)
+        except Exception as e:
+            # Igual fallaría en la cola antigua: queda en el log para avisarle a quien lo envió
+            logger.error("❌ No se pudo mover el job %s de %s (%s): %s", job.id, QUEUE_LEGACY, email, str(e))
+            spool.remove(path)
+            job.delete()
+            continue
+        job.delete()
+        moved += 1
+        logger.info("🚚 Job %s de %s pasado al lote %s", job.id, QUEUE_LEGACY, batch_id)
+    return moved
+
+
+def get_batch_progress(batch_id: str):
+    """Estado de un lote: status, total, done y failed (None si no existe)."""
+    raw = redis_conn.hgetall(_batch_key(batch_id))
+    if not raw:
+        return None
+    info = {k.decode(): v.decode() for k, v in raw.items()}
+    return {
+        "job_id": batch_id,
+        "status": info.get("status"),
+        "total": int(info.get("total", 0)),
+        "done": int(info.get("done", 0)),
+        "failed": int(info.get("failed", 0)),
+    }
+
+
+def _render_member(name: str, data: bytes, cache, samples: list, errors: list):
+    """
+    Genera (nombre, PDF) por cada Documento de un XML del ZIP, a medida que
+    se renderizan, para no acumular todo un sobre EnvioDTE en memoria.
+    En ``samples`` se agregan (tiempos por etapa, tamaño) de cada PDF.
+
+    El XML se parsea una sola vez: los documentos sin campos obligatorios o
+    que fallan al renderizar quedan en ``errors`` (filas de errors.csv) y el
+    resto del sobre sigue; un XML mal formado se relanza.
+    """
+    bad = []
+    n = 0
+    # 👉 Parsear XML: un PDF por cada Documento (también sobres EnvioDTE)
+    for dte in iter_dtes(data, errors=bad):
+        n += 1
+        timings = {}
+        try:
+            pdf = render_pdf_cached(dte, cache=cache, timings=timings)
+        except RenderError as e:
+            errors.append(error_row(name, e, f"{dte.tipo_dte_abreviatura} {dte.numero_factura}"))
+            continue
+        samples.append((timings, len(pdf)))
+        yield pdf_name(dte, sanitize=True), pdf
+    errors.extend(error_row(name, e) for e in bad)
+    if not n and not bad:
+        errors.append(error_row(name, MalformedXMLError("el XML no contiene ningún Documento")))
+
+
+def _check_spool(key: str, zip_path: str, checksum: str):
+    """
+    Comprueba que el ZIP del spool sea el subido. Se hashea una sola vez por
+    lote: el primer job que lo verifica lo deja anotado en Redis.
+    """
+    if redis_conn.hget(key, "verified") == checksum.encode():
+        return
+    if spool.file_sha256(zip_path) != checksum:
+        raise ValueError(f"El ZIP del spool no coincide con el subido: {zip_path}")
+    redis_conn.hset(key, "verified", checksum)
+
+
+def render_chunk(batch_id: str, offset: int, zip_path: str, checksum: str, names: List[str]):
+    """
+    Job hijo: renderiza un bloque de XML del ZIP en el spool y deja los PDFs
+    en el directorio del lote (spool.batch_dir). En Redis solo quedan los
+    contadores y la ruta de cada PDF.
+    """
+    key = _batch_key(batch_id)
+    pdfs_key = _pdfs_key(batch_id)
+    redis_conn.hset(key, "status", "rendering")
+    _check_spool(key, zip_path, checksum)
+    out_dir = spool.batch_dir(batch_id)
+    cache = get_render_cache()
+    samples = []
+
+    with zipfile.ZipFile(zip_path) as zf:
+        for i, name in enumerate(names, start=offset):
+            logger.info("➡️ Convirtiendo %s", name)
+            errors = []
             try:
-                # 👉 Intentar parsear XML
-                dte = parse_xml(data)
-                fecha = dte.fecha_emision.replace("-", "")
-                tipo = dte.tipo_dte_abreviatura
-                razon = sanitize_name(dte.razon_social)
-                folio = dte.numero_factura
-                pdf_name = f"{fecha} {tipo} {razon} {folio}.pdf"
-
-                pdf_bytes = render_pdf(dte)
+                data = zf.read(name)
+                # Campo "nnnnnn.mmmm/nombre.pdf": conserva el orden del ZIP original
+                for j, (pdf_file, pdf) in enumerate(_render_member(name, data, cache, samples, errors)):
+                    path = os.path.join(out_dir, f"{i:06d}.{j:04d}.pdf")
+                    spool.write_atomic(path, pdf)
+                    redis_conn.hset(pdfs_key, f"{i:06d}.{j:04d}/{pdf_file}", path)
+                    redis_conn.expire(pdfs_key, BATCH_TTL)
             except Exception as e:
-                # 👉 Si falla el parseo, usar fallback
-                logger.warning(
-                    "No se pudo parsear %s (%s), usando nombre base",
-                    name,
-                    str(e),
-                )
-                pdf_name = name.replace(".xml", ".pdf")
-                pdf_bytes = render_pdf_from_xml(data)
+                errors.append(error_row(name, e))
+
+            if errors:
+                # Sin reintentos: el XML va a errors.csv y a quarantine/ en el ZIP final
+                for row in errors:
+                    logger.error("❌ Error convirtiendo %s (%s): %s", name, row["tipo"], row["detalle"])
+                redis_conn.rpush(_errors_key(batch_id), *(json.dumps(row) for row in errors))
+                redis_conn.expire(_errors_key(batch_id), BATCH_TTL)
+                redis_conn.hincrby(key, "failed", 1)
+                continue
+            redis_conn.hincrby(key, "done", 1)
 
-            pdfs.append((pdf_name, pdf_bytes))
+    # El worker (service.worker) lee estos tiempos desde el proceso principal
+    job = get_current_job()
+    if job is not None:
+        job.meta["render_samples"] = samples
+        job.save_meta()
+
+
+def _batch_entries(pdfs: Dict[bytes, bytes], errors: list, zip_path: Optional[str]):
+    """
+    (nombre, contenido) del ZIP de salida: los PDFs ({campo: ruta}) en el
+    orden del ZIP original, como ruta en el spool, y, si hubo errores,
+    errors.csv y los XML que fallaron en quarantine/, como bytes.
+    """
+    seen = set()
+    for field in sorted(pdfs):
+        path = pdfs[field].decode()
+        if os.path.exists(path):
+            yield unique_name(field.decode().split("/", 1)[1], seen), path
+    if not errors:
+        return
+    yield ERRORS_CSV, errors_csv(errors)
+    if not zip_path or not os.path.exists(zip_path):
+        return
+    with zipfile.ZipFile(zip_path) as src:
+        for name in dict.fromkeys(row["archivo"] for row in errors):
+            try:
+                yield f"{QUARANTINE_DIR}/{name}", src.read(name)
+            except KeyError:
+                continue
+
+
+def _write_volumes(batch_id: str, entries, max_bytes: int) -> List[mailer.Attachment]:
+    """
+    Escribe en el spool el ZIP con ``entries`` (nombre, ruta o bytes), uno a
+    la vez (los PDF se copian desde disco sin cargarlos en memoria), y lo
+    corta en volúmenes de a lo más ``max_bytes`` para que quepan en un
+    correo. Los PDF ya vienen comprimidos: se guardan sin deflate (ZIP_STORED).
+    """
+    os.makedirs(spool.SPOOL_DIR, exist_ok=True)
+    paths = []
+    f = zf = None
+    try:
+        for name, data in entries:
+            size = os.path.getsize(data) if isinstance(data, str) else len(data)
+            if zf is not None and zf.infolist() and \
+                    f.tell() + size + (len(zf.infolist()) + 1) * ZIP_ENTRY_OVERHEAD > max_bytes:
+                zf.close()
+                f.close()
+                zf = None
+            if zf is None:
+                paths.append(os.path.join(spool.SPOOL_DIR, f"{batch_id}-{len(paths) + 1}.zip"))
+                f = open(paths[-1], "wb")
+                zf = zipfile.ZipFile(f, "w", zipfile.ZIP_STORED)
+            if isinstance(data, str):
+                zf.write(data, name)
+            else:
+                zf.writestr(name, data)
+        if zf is None:  # lote sin PDFs: igual va un ZIP (vacío)
+            paths.append(os.path.join(spool.SPOOL_DIR, f"{batch_id}-1.zip"))
+            f = open(paths[-1], "wb")
+            zf = zipfile.ZipFile(f, "w", zipfile.ZIP_STORED)
+    except BaseException:
+        for path in paths:
+            spool.remove(path)
+        raise
+    finally:
+        if zf is not None:
+            zf.close()
+            f.close()
 
-    logger.info("✅ Generados %s PDFs, creando ZIP final", len(pdfs))
+    if len(paths) == 1:
+        return [(paths[0], "pdfs.zip")]
+    return [(path, f"pdfs-{i}.zip") for i, path in enumerate(paths, start=1)]
 
-    # Crear ZIP final en memoria
-    out_zip = io.BytesIO()
-    with zipfile.ZipFile(out_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fname, pdf in pdfs:
-            zf.writestr(fname, pdf)
-    out_zip.seek(0)
 
-    # Guardar ZIP en archivo temporal
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp:
-        tmp.write(out_zip.getvalue())
-        tmp_path = tmp.name
+def process_zip_and_send(batch_id: str, email: str, zip_path: Optional[str] = None):
+    """
+    Job final del lote: arma el ZIP con los PDFs de los jobs hijos, encola
+    su envío en QUEUE_MAIL (o lo deja en el outbox del destinatario, ver
+    MAIL_COALESCE_SECONDS) y borra el ZIP subido y los PDFs del spool. Si
+    falla y quedan reintentos, los deja para el siguiente intento.
+    """
+    logger.info("📦 Armando ZIP del lote %s para %s", batch_id, email)
+    key = _batch_key(batch_id)
+    pdfs_key = _pdfs_key(batch_id)
+    redis_conn.hset(key, "status", "assembling")
 
-    logger.info("📧 Enviando email a %s con adjunto %s", email, tmp_path)
+    # Los jobs hijos que murieron (timeout, worker caído) cuentan como fallidos
+    progress = get_batch_progress(batch_id) or {"total": 0, "done": 0, "failed": 0}
+    missing = progress["total"] - progress["done"] - progress["failed"]
+    if missing > 0:
+        redis_conn.hincrby(key, "failed", missing)
 
+    pdfs = redis_conn.hgetall(pdfs_key)
+    errors = [json.loads(row) for row in redis_conn.lrange(_errors_key(batch_id), 0, -1)]
+    volumes = []
+    done = False
     try:
-        message = MessageSchema(
-            subject="PDFs generados",
-            recipients=[email],
-            body="Adjunto los PDFs generados desde tus XML.",
-            subtype="plain",
-            attachments=[tmp_path],
-        )
-        fm = FastMail(MAIL_CONF)
-        await fm.send_message(message)
-        logger.info("✅ Email enviado a %s", email)
+        # Volúmenes en bytes de disco: en el correo el base64 los agranda un tercio
+        volumes = _write_volumes(batch_id, _batch_entries(pdfs, errors, zip_path),
+                                 mailer.raw_budget(int(mailer.MAIL_MAX_ATTACHMENT_MB * MB)))
+        logger.info("✅ Generados %s PDFs en %s ZIP (%s errores)", len(pdfs), len(volumes), len(errors))
+
+        mail_queue = Queue(QUEUE_MAIL, connection=redis_conn)
+        retry = _retry(mailer.MAIL_JOB_RETRIES, mailer.MAIL_JOB_RETRY_INTERVAL)
+        # Antes de encolar: un mailer rápido podría marcar "sent" antes que esto
+        redis_conn.hset(key, "status", "mailing")
+        if mailer.MAIL_COALESCE_SECONDS > 0:
+            # Se junta con los otros lotes del mismo destinatario: el primero programa el envío
+            handed = volumes
+            volumes = []  # desde aquí son del outbox
+            if mailer.outbox_add(email, {"batch_id": batch_id, "attachments": handed}):
+                mail_queue.enqueue_in(timedelta(seconds=mailer.MAIL_COALESCE_SECONDS), flush_outbox, email,
+                                      retry=retry)
+            logger.info("📬 Lote %s en el outbox de %s", batch_id, email)
+        else:
+            body = MAIL_BODY
+            if errors:
+                body += f"\n\n{len(errors)} documento(s) con error: ver {ERRORS_CSV} y la carpeta {QUARANTINE_DIR}/ del ZIP."
+            mail_queue.enqueue(send_batch, batch_id, email, body, volumes, retry=retry)
+            logger.info("📧 Email a %s con %s adjunto(s) en la cola %s", email, len(volumes), QUEUE_MAIL)
+            volumes = []  # los borra el job de envío
+        done = True
     except Exception as e:
-        logger.error("❌ Error enviando email: %s", str(e))
+        logger.error("❌ Error armando el ZIP: %s", str(e))
+        if _last_attempt():
+            redis_conn.hset(key, "status", "error")
+        else:
+            logger.warning("⚠️ El lote %s se reintenta: se conservan sus PDFs en el spool", batch_id)
         raise
     finally:
-        try:
-            os.remove(tmp_path)
-            logger.info("🧹 Archivo temporal eliminado: %s", tmp_path)
-        except Exception as e:
-            logger.warning(
-                "No se pudo borrar el archivo temporal %s: %s", tmp_path, str(e)
-            )
+        # Los volúmenes que no alcanzaron a encolarse se vuelven a armar en el reintento
+        for path, _ in volumes:
+            spool.remove(path)
+        if done or _last_attempt():
+            redis_conn.delete(pdfs_key, _errors_key(batch_id))
+            spool.remove_dir(os.path.join(spool.SPOOL_DIR, batch_id))
+            if zip_path:
+                spool.remove(zip_path)
+        spool.sweep()
+
+
+def _mail_failed(batch_ids: List[str], attachments: List[mailer.Attachment], e: Exception) -> bool:
+    """
+    Tras un envío fallido: si quedan reintentos deja los adjuntos en el spool
+    y devuelve True; si no, marca los lotes con error y los borra.
+    """
+    if not _last_attempt():
+        logger.warning("⚠️ Falló el envío (%s), se reintenta: los adjuntos quedan en el spool", e)
+        return True
+    logger.error("❌ Envío fallido sin más reintentos: %s", e)
+    for batch_id in batch_ids:
+        redis_conn.hset(_batch_key(batch_id), "status", "error")
+    for path, _ in attachments:
+        spool.remove(path)
+    return False
+
+
+def send_batch(batch_id: str, email: str, body: str, attachments: List[mailer.Attachment]):
+    """Job de QUEUE_MAIL: envía los volúmenes de un lote y, ya enviados, los borra del spool."""
+    try:
+        mailer.send_files(email, MAIL_SUBJECT, body, [tuple(att) for att in attachments])
+    except Exception as e:
+        _mail_failed([batch_id], attachments, e)
+        raise
+    logger.info("✅ Email enviado a %s", email)
+    redis_conn.hset(_batch_key(batch_id), "status", "sent")
+    for path, _ in attachments:
+        spool.remove(path)
+
+
+def flush_outbox(email: str):
+    """Job de QUEUE_MAIL: envía en un solo correo todos los lotes juntados en el outbox de ``email``."""
+    entries = mailer.outbox_take(email)
+    if not entries:
+        return
+    seen = set()
+    attachments = [(path, unique_name(name, seen))
+                   for entry in entries for path, name in entry["attachments"]
+                   if os.path.exists(path)]
+    try:
+        body = MAIL_BODY if len(entries) == 1 else \
+            f"Adjunto los PDFs generados desde tus XML ({len(entries)} lotes)."
+        mailer.send_files(email, MAIL_SUBJECT, body, attachments)
+    except Exception as e:
+        if _mail_failed([entry["batch_id"] for entry in entries], attachments, e):
+            mailer.outbox_restore(email, entries)
+        raise
+    logger.info("✅ Email con %s lote(s) enviado a %s", len(entries), email)
+    for entry in entries:
+        redis_conn.hset(_batch_key(entry["batch_id"]), "status", "sent")
+    for path, _ in attachments:
+        spool.remove(path)
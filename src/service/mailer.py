@@ -0,0 +1,276 @@
+"""
+Envío de correos del worker por SMTP (smtplib) con una conexión reutilizable.
+
+Cada proceso mantiene una conexión abierta que se comprueba con NOOP antes
+de volver a usarla y se cierra tras MAIL_IDLE_TIMEOUT sin uso; los errores
+transitorios (conexión caída, respuestas 4xx) se reintentan con backoff
+exponencial. Los adjuntos se reparten en varios mensajes de a lo más
+MAIL_MAX_ATTACHMENT_MB cada uno, medidos ya codificados en base64.
+
+Los envíos van a la cola QUEUE_MAIL, que atiende un worker ``--simple`` (sin
+fork por job): así la conexión dura entre un lote y otro. En un work-horse
+de RQ moriría con cada job.
+
+Con MAIL_COALESCE_SECONDS > 0 los lotes de un mismo destinatario se juntan
+en un outbox en Redis y se envían en un solo correo (ver jobs.flush_outbox).
+
+Para probar en local basta un SMTP de pruebas sin TLS ni login, p. ej.
+``python -m smtpd -n -c DebuggingServer localhost:1025`` con SMTP_HOST=localhost,
+SMTP_PORT=1025, MAIL_STARTTLS=False y sin SMTP_USER (o el servicio
+``mailpit`` de docker-compose.dev.yml).
+"""
+import json
+import logging
+import math
+import mimetypes
+import os
+import smtplib
+import ssl
+import threading
+import time
+from email.message import EmailMessage
+from typing import List, Optional, Sequence, Tuple
+
+from .config import MAIL_CONF, redis_conn
+
+logger = logging.getLogger(__name__)
+
+MAIL_RETRIES = int(os.getenv("MAIL_RETRIES", "3"))
+MAIL_RETRY_BACKOFF = float(os.getenv("MAIL_RETRY_BACKOFF", "2"))  # s, se duplica en cada intento
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "30"))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))
+MAIL_MAX_ATTACHMENT_MB = float(os.getenv("MAIL_MAX_ATTACHMENT_MB", "15"))
+MAIL_COALESCE_SECONDS = int(os.getenv("MAIL_COALESCE_SECONDS", "0"))  # 0 = un correo por lote
+# Reintentos del job de envío (RQ) cuando falla todo send_files; los adjuntos
+# se conservan en el spool hasta que sale el correo o se agota el último
+MAIL_JOB_RETRIES = int(os.getenv("MAIL_JOB_RETRIES", "3"))
+MAIL_JOB_RETRY_INTERVAL = int(os.getenv("MAIL_JOB_RETRY_INTERVAL", "300"))  # s
+
+OUTBOX_PREFIX = "xml2pdf:outbox:"
+
+Attachment = Tuple[str, str]  # (ruta, nombre del adjunto)
+
+
+class SMTPPool:
+    """
+    Una conexión SMTP por proceso, reutilizada entre mensajes. Tras un fork
+    (work-horse de RQ) el hijo abre la suya en vez de usar la del padre.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, starttls: bool = True, ssl_tls: bool = False,
+                 validate_certs: bool = True, timeout: float = MAIL_TIMEOUT,
+                 idle_timeout: float = MAIL_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.ssl_tls = ssl_tls
+        self.validate_certs = validate_certs
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._conn = None
+        self._pid = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        ctx = ssl.create_default_context()
+        if not self.validate_certs:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        return ctx
+
+    def _connect(self):
+        if self.ssl_tls:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=self._ssl_context())
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                conn.starttls(context=self._ssl_context())
+        if self.username:
+            conn.login(self.username, self.password or "")
+        logger.info("📡 Conexión SMTP abierta con %s:%s", self.host, self.port)
+        return conn
+
+    def _alive(self) -> bool:
+        try:
+            return self._conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def connection(self):
+        """Conexión lista para enviar: la abierta si responde al NOOP, o una nueva."""
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None  # socket heredado del padre: no tocarlo
+        if self._conn is not None:
+            if time.monotonic() - self._last_used > self.idle_timeout or not self._alive():
+                self.close()
+        if self._conn is None:
+            self._conn = self._connect()
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._conn = None
+
+    def send(self, msg: EmailMessage, retries: int = MAIL_RETRIES,
+             backoff: float = MAIL_RETRY_BACKOFF):
+        """Envía ``msg``; reintenta los errores transitorios y relanza los permanentes (5xx)."""
+        for attempt in range(retries + 1):
+            try:
+                with self._lock:
+                    self.connection().send_message(msg)
+                    self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    raise
+                error = e
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+            with self._lock:
+                self.close()
+            if attempt == retries:
+                raise error
+            wait = backoff * 2 ** attempt
+            logger.warning("⚠️ Error SMTP (%s), reintento %s/%s en %.0fs",
+                           error, attempt + 1, retries, wait)
+            time.sleep(wait)
+
+
+_pool: Optional[SMTPPool] = None
+
+
+def get_pool() -> SMTPPool:
+    """Pool del proceso, configurado desde MAIL_CONF (variables SMTP_*)."""
+    global _pool
+    if _pool is None:
+        password = MAIL_CONF.MAIL_PASSWORD
+        _pool = SMTPPool(
+            MAIL_CONF.MAIL_SERVER, MAIL_CONF.MAIL_PORT,
+            username=MAIL_CONF.MAIL_USERNAME if MAIL_CONF.USE_CREDENTIALS else None,
+            password=password.get_secret_value() if hasattr(password, "get_secret_value") else password,
+            starttls=MAIL_CONF.MAIL_STARTTLS, ssl_tls=MAIL_CONF.MAIL_SSL_TLS,
+            validate_certs=MAIL_CONF.VALIDATE_CERTS,
+        )
+    return _pool
+
+
+def encoded_size(n: int) -> int:
+    """Bytes que ocupan ``n`` bytes de adjunto en base64, con saltos CRLF cada 76 caracteres."""
+    b64 = 4 * math.ceil(n / 3)
+    return b64 + 2 * math.ceil(b64 / 76)
+
+
+def raw_budget(max_bytes: int) -> int:
+    """Bytes de archivo que caben en ``max_bytes`` una vez codificados (inverso de encoded_size)."""
+    b64 = max_bytes * 76 // 78 - 2  # el último salto de línea puede sobrar
+    return max(b64, 0) // 4 * 3
+
+
+def split_attachments(attachments: Sequence[Attachment],
+                      max_bytes: int) -> List[List[Attachment]]:
+    """
+    Agrupa los adjuntos en mensajes de a lo más ``max_bytes`` ya codificados
+    en base64 (un tercio más que en disco), en orden. Uno que por sí solo
+    pase el límite va en un mensaje aparte.
+    """
+    groups, current, size = [], [], 0
+    for att in attachments:
+        n = encoded_size(os.path.getsize(att[0]))
+        if current and size + n > max_bytes:
+            groups.append(current)
+            current, size = [], 0
+        current.append(att)
+        size += n
+        if n > max_bytes:
+            logger.warning("⚠️ Adjunto %s (%s bytes) supera MAIL_MAX_ATTACHMENT_MB", att[1], n)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_message(recipient: str, subject: str, body: str,
+                  attachments: Sequence[Attachment] = ()) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = MAIL_CONF.MAIL_FROM
+    msg["To"] = recipient
+    msg["Subject"] = subject
+    msg.set_content(body)
+    for path, filename in attachments:
+        ctype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        maintype, subtype = ctype.split("/", 1)
+        with open(path, "rb") as f:
+            msg.add_attachment(f.read(), maintype=maintype, subtype=subtype, filename=filename)
+    return msg
+
+
+def send_files(recipient: str, subject: str, body: str, attachments: Sequence[Attachment],
+               max_bytes: Optional[int] = None, pool: Optional[SMTPPool] = None) -> int:
+    """
+    Envía los adjuntos a ``recipient`` en tantos mensajes como haga falta,
+    todos por la misma conexión. Devuelve cuántos mensajes se enviaron.
+    """
+    pool = pool or get_pool()
+    if max_bytes is None:
+        max_bytes = int(MAIL_MAX_ATTACHMENT_MB * 1024 * 1024)
+    groups = split_attachments(attachments, max_bytes) or [[]]
+    for i, group in enumerate(groups, start=1):
+        part = f" ({i}/{len(groups)})" if len(groups) > 1 else ""
+        pool.send(build_message(recipient, subject + part, body, group))
+    logger.info("📧 %s correo(s) enviados a %s", len(groups), recipient)
+    return len(groups)
+
+
+# ============= OUTBOX (lotes juntados por destinatario) =============
+
+def _outbox_key(recipient: str) -> str:
+    return f"{OUTBOX_PREFIX}{recipient.lower()}"
+
+
+def outbox_add(recipient: str, entry: dict) -> bool:
+    """
+    Deja ``entry`` en el outbox de ``recipient``. Devuelve True si no había
+    un envío programado: quien llama debe programar el flush.
+    """
+    key = _outbox_key(recipient)
+    redis_conn.rpush(key, json.dumps(entry))
+    redis_conn.expire(key, 24 * 3600)
+    return bool(redis_conn.set(f"{key}:flush", 1, nx=True, ex=max(MAIL_COALESCE_SECONDS * 10, 3600)))
+
+
+def outbox_restore(recipient: str, entries: List[dict]):
+    """
+    Devuelve al frente del outbox los ``entries`` de un flush que falló y
+    marca el flush como programado: el reintento los vuelve a sacar junto
+    con lo que llegue mientras tanto.
+    """
+    key = _outbox_key(recipient)
+    pipe = redis_conn.pipeline()
+    for entry in reversed(entries):
+        pipe.lpush(key, json.dumps(entry))
+    pipe.expire(key, 24 * 3600)
+    pipe.set(f"{key}:flush", 1, ex=max(MAIL_COALESCE_SECONDS * 10, 3600))
+    pipe.execute()
+
+
+def outbox_take(recipient: str) -> List[dict]:
+    """Saca todo el outbox de ``recipient`` (lo que llegue después programa otro flush)."""
+    key = _outbox_key(recipient)
+    redis_conn.delete(f"{key}:flush")
+    pipe = redis_conn.pipeline()
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key)
+    raw, _ = pipe.execute()
+    return [json.loads(item) for item in raw]
@@ -1,23 +1,73 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Form, BackgroundTasks
-from fastapi.responses import Response
-import os, zipfile, io
-
-from redis import Redis
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Form, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio, os, zipfile
+from typing import List
+
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from rq import Queue
 
 # importa tu función de conversión
-from sii_xml_pdf.renderer import render_pdf_from_xml
-from .jobs import process_zip_and_send  
+from sii_xml_pdf.cache import cache_key
+from sii_xml_pdf.errors import MalformedXMLError, MissingFieldsError
+from sii_xml_pdf.renderer import ENGINES, preload
+from .config import (redis_conn, get_render_cache, RENDER_WORKERS, RENDER_BATCH_SLOTS,
+                     RENDER_MAX_IN_FLIGHT, RENDER_TIMEOUT, RENDER_RETRY_AFTER, QUEUE_NAMES)
+from .batch import stream_batch, zip_members
+from .jobs import enqueue_zip_batch, get_batch_progress, zip_xml_entries
+from .metrics import build_registry, observe_render, render_with_key, render_with_timings, track_requests
+from .render_pool import RenderPool, RenderPoolSaturated
+from . import spool
 
 API_TOKEN = os.getenv("API_TOKEN", "change_me")
 MAX_XML_SIZE = int(os.getenv("MAX_XML_SIZE", "1048576"))  # 1MB
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "200"))  # XML por /render-batch
+MAX_ZIP_SIZE = int(os.getenv("MAX_ZIP_SIZE", str(100 * 1024 * 1024)))  # 100MB
+MAX_ZIP_MEMBERS = int(os.getenv("MAX_ZIP_MEMBERS", "5000"))  # XML por ZIP
+
+# Tamaño máximo del cuerpo por ruta (más holgura para el multipart): se
+# rechaza con 413 mirando Content-Length, antes de leer nada. Sin
+# Content-Length (chunked), /render y /render-batch recién lo notan cuando
+# Starlette ya copió todo el multipart a un temporal; /render-zip lee el
+# cuerpo directo (spool.spool_multipart) y corta apenas pasa el límite.
+MULTIPART_OVERHEAD = 64 * 1024
+BODY_LIMITS = {"/render": MAX_XML_SIZE, "/render-zip": MAX_ZIP_SIZE, "/render-batch": MAX_ZIP_SIZE}
+
+# Pool de procesos para el render (no bloquear el event loop)
+render_pool = RenderPool(RENDER_WORKERS, RENDER_MAX_IN_FLIGHT, RENDER_TIMEOUT,
+                         initializer=preload)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    spool.sweep()
+    render_pool.start()
+    yield
+    render_pool.shutdown()
+
+
+app = FastAPI(title="SII XML→PDF Service", version="1.0.0", lifespan=lifespan)
+app.middleware("http")(track_requests)
+
+
+@app.middleware("http")
+async def limit_body_size(request, call_next):
+    limit = BODY_LIMITS.get(request.url.path)
+    length = request.headers.get("content-length")
+    if limit is not None and length and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+        return JSONResponse({"detail": "Upload too large"}, status_code=413)
+    return await call_next(request)
+
 
-app = FastAPI(title="SII XML→PDF Service", version="1.0.0")
+# Colas Redis: una por tamaño de lote (ver jobs.select_queue)
+queues = {name: Queue(name, connection=redis_conn) for name in QUEUE_NAMES}
 
+# Métricas Prometheus (incluye el largo de cada cola)
+metrics_registry = build_registry(list(queues.values()))
 
-# Conexión Redis
-redis_conn = Redis(host=os.getenv("REDIS_HOST", "redis"), port=6379)
-queue = Queue("xml2pdf", connection=redis_conn)
+# Caché de PDFs (opcional, ver RENDER_CACHE)
+render_cache = get_render_cache()
 
 def check_auth(authorization: str):
     if not authorization or not authorization.lower().startswith("bearer "):
@@ -30,44 +80,167 @@ def check_auth(authorization: str):
 def healthz():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags
+
+
 @app.post("/render")
 async def render(authorization: str = Header(None),
-                 file: UploadFile = File(...)):
+                 if_none_match: str = Header(None),
+                 file: UploadFile = File(...),
+                 engine: str = Query("html")):
     # Autenticación
     check_auth(authorization)
+    # ?engine=fast dibuja el PDF directo, sin la plantilla HTML
+    if engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motor desconocido: {engine}")
 
-    # Leer XML
-    data = await file.read()
+    # Leer XML (como mucho un byte más que el límite)
+    data = await file.read(MAX_XML_SIZE + 1)
     if len(data) > MAX_XML_SIZE:
         raise HTTPException(status_code=413, detail="XML too large")
 
-    # Generar PDF en memoria
+    # ETag débil: mismo XML canónico + misma plantilla/CSS y motor → mismo PDF.
+    # La clave (C14N + hash) y la caché nunca corren en el event loop: si hace
+    # falta antes de renderizar va a un hilo; si no, la calcula el pool.
+    # La clave canonicaliza el XML: uno mal formado da 422, nunca 304.
+    key = None
+    if render_cache or if_none_match:
+        try:
+            key = await run_in_threadpool(cache_key, data, engine=engine)
+        except MalformedXMLError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if if_none_match and _etag_matches(f'W/"{key}"', if_none_match):
+            return Response(status_code=304, headers={"ETag": f'W/"{key}"'})
+
+    # Generar PDF en el pool de procesos
     try:
-        pdf_bytes = render_pdf_from_xml(data)
+        pdf_bytes = await run_in_threadpool(render_cache.get, key) if render_cache else None
+        if pdf_bytes is None:
+            if key is None:
+                pdf_bytes, timings, key = await render_pool.run(render_with_key, data, None, engine)
+            else:
+                pdf_bytes, timings = await render_pool.run(render_with_timings, data, None, engine)
+            observe_render(timings, len(pdf_bytes))
+            if render_cache:
+                await run_in_threadpool(render_cache.set, key, pdf_bytes)
         if not pdf_bytes.startswith(b"%PDF"):
             raise RuntimeError("Invalid PDF generated")
-        return Response(pdf_bytes, media_type="application/pdf")
+        return Response(pdf_bytes, media_type="application/pdf", headers={"ETag": f'W/"{key}"'})
+    except RenderPoolSaturated:
+        raise HTTPException(status_code=503, detail="Render pool saturated",
+                            headers={"Retry-After": str(RENDER_RETRY_AFTER)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Render timeout")
+    except (MalformedXMLError, MissingFieldsError) as e:
+        # El XML está mal, no el servicio
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+@app.post("/render-batch")
+async def render_batch(authorization: str = Header(None),
+                       files: List[UploadFile] = File(...),
+                       engine: str = Query("html")):
+    """
+    Varios XML (una parte por archivo) o un ZIP con XMLs → ZIP con los PDFs,
+    enviado a medida que se renderizan, más manifest.json con los errores.
+    """
+    check_auth(authorization)
+    if engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motor desconocido: {engine}")
+
+    # Cada parte va al spool; los XML se leen de a uno cuando les toca renderizarse
+    members, spooled = [], []
+    try:
+        for upload in files:
+            name = upload.filename or f"archivo-{len(members) + 1}.xml"
+            try:
+                path, size, _ = await spool.spool_upload(upload, MAX_ZIP_SIZE, suffix=".upload")
+            except spool.UploadTooLarge:
+                raise HTTPException(status_code=413, detail=f"{name}: too large")
+            spooled.append(path)
+            with open(path, "rb") as f:
+                magic = f.read(4)
+            if name.lower().endswith(".zip") or magic == b"PK\x03\x04":
+                try:
+                    inner = zip_members(path, MAX_BATCH_FILES - len(members), MAX_XML_SIZE)
+                except spool.UploadTooLarge as e:
+                    raise HTTPException(status_code=413, detail=f"{name}: {e}")
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"{name}: {e}")
+                members.extend((member, path, member) for member in inner)
+            elif size > MAX_XML_SIZE:
+                raise HTTPException(status_code=413, detail=f"XML too large: {name}")
+            else:
+                members.append((name, path, None))
+            if len(members) > MAX_BATCH_FILES:
+                raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_FILES} XML por lote")
+
+        if not members:
+            raise HTTPException(status_code=400, detail="No se recibió ningún XML")
+    except BaseException:
+        for path in spooled:
+            spool.remove(path)
+        raise
+
+    # Sin Content-Length: el ZIP sale por partes (chunked) según termina cada PDF
+    return StreamingResponse(
+        stream_batch(render_pool, members, engine, RENDER_BATCH_SLOTS, spooled),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="pdfs.zip"'},
+    )
+
+
 # ============= ENDPOINT ZIP + EMAIL =============
 
 @app.post("/render-zip")
-async def render_zip(authorization: str = Header(None),
-                     file: UploadFile = File(...),
-                     email: str = Form(...)):
+async def render_zip(request: Request, authorization: str = Header(None)):
+    """Multipart con ``file`` (ZIP con XMLs) y ``email``: encola el lote."""
     check_auth(authorization)
 
-    data = await file.read()
+    # El ZIP va al spool compartido a medida que llega; a Redis solo la ruta y el hash
     try:
-        zipfile.ZipFile(io.BytesIO(data))  # valida ZIP
-    except zipfile.BadZipFile:
-        raise HTTPException(status_code=400, detail="Archivo no es un ZIP válido")
+        zip_path, _, checksum, form = await spool.spool_multipart(request, "file", MAX_ZIP_SIZE)
+    except spool.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="ZIP too large")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 👇 Encolar en Redis, no procesar aquí
-    job = queue.enqueue(process_zip_and_send, data, email, job_timeout=600)
+    try:
+        email = form.get("email", "").strip()
+        if not email:
+            raise HTTPException(status_code=422, detail="Falta el campo email")
+        try:
+            entries = zip_xml_entries(zip_path)  # valida ZIP
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Archivo no es un ZIP válido")
+        if len(entries) > MAX_ZIP_MEMBERS:
+            raise HTTPException(status_code=413, detail=f"Máximo {MAX_ZIP_MEMBERS} XML por ZIP")
+
+        # 👇 Encolar en Redis, no procesar aquí: un job por bloque de XML + job final,
+        # en la cola small/medium/bulk según el nº de XML y su tamaño sin comprimir
+        job_id = enqueue_zip_batch(queues, zip_path, checksum, email, entries)
+    except BaseException:
+        spool.remove(zip_path)
+        raise
+
+    return {"status": "queued", "job_id": job_id, "email": email}
+
+
+@app.get("/jobs/{job_id}")
+def job_progress(job_id: str, authorization: str = Header(None)):
+    check_auth(authorization)
 
-    return {"status": "queued", "job_id": job.get_id(), "email": email}
+    progress = get_batch_progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return progress
 
@@ -0,0 +1,116 @@
+"""
+Métricas Prometheus del servicio y del worker.
+
+Con varios workers de Gunicorn cada proceso tiene sus propios contadores: si
+se define PROMETHEUS_MULTIPROC_DIR (un directorio vacío al arrancar) se
+agregan los de todos los procesos en cada scrape.
+"""
+import logging
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+from sii_xml_pdf.cache import cache_key
+from sii_xml_pdf.renderer import render_pdf_from_xml
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+REQUEST_LATENCY = Histogram(
+    "xml2pdf_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+)
+RENDER_STAGE = Histogram(
+    "xml2pdf_render_stage_seconds", "Duración de cada etapa del render",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PDF_SIZE = Histogram(
+    "xml2pdf_pdf_size_bytes", "Tamaño de los PDF generados",
+    buckets=(10e3, 25e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6),
+)
+RENDER_IN_FLIGHT = Gauge(
+    "xml2pdf_render_in_flight", "Renders en curso en el pool de /render",
+    multiprocess_mode="livesum",
+)
+JOB_DURATION = Histogram(
+    "xml2pdf_job_duration_seconds", "Duración de los jobs RQ",
+    ["job"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200),
+)
+JOB_FAILURES = Counter("xml2pdf_job_failures_total", "Jobs RQ fallidos", ["job"])
+
+
+class QueueDepthCollector:
+    """Largo de las colas RQ y de su registro de fallidos, leído en cada scrape."""
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    def collect(self):
+        depth = GaugeMetricFamily("xml2pdf_queue_depth", "Jobs esperando en la cola", labels=["queue"])
+        failed = GaugeMetricFamily("xml2pdf_queue_failed", "Jobs en el registro de fallidos",
+                                   labels=["queue"])
+        for q in self.queues:
+            try:
+                depth.add_metric([q.name], len(q))
+                failed.add_metric([q.name], q.failed_job_registry.count)
+            except Exception as e:  # Redis caído: el resto de métricas sigue sirviendo
+                logger.warning("No se pudo leer la cola %s: %s", q.name, str(e))
+        yield depth
+        yield failed
+
+
+def build_registry(queues=()) -> CollectorRegistry:
+    """Registro a exponer: el global o, en modo multiproceso, el agregado."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    if queues:
+        registry.register(QueueDepthCollector(queues))
+    return registry
+
+
+def observe_render(timings: Optional[dict], pdf_size: Optional[int] = None):
+    for stage, seconds in (timings or {}).items():
+        RENDER_STAGE.labels(stage).observe(seconds)
+    if pdf_size is not None:
+        PDF_SIZE.observe(pdf_size)
+
+
+def render_with_timings(xml_bytes: bytes, css_path: Optional[str] = None, engine: str = "html"):
+    """
+    render_pdf_from_xml que además devuelve los tiempos por etapa: corre en
+    el pool de procesos, así que las métricas se anotan en el proceso padre.
+    """
+    timings = {}
+    pdf = render_pdf_from_xml(xml_bytes, css_path=css_path, timings=timings, engine=engine)
+    return pdf, timings
+
+
+def render_with_key(xml_bytes: bytes, css_path: Optional[str] = None, engine: str = "html"):
+    """render_with_timings más la clave de caché (ETag), calculada también en el pool."""
+    pdf, timings = render_with_timings(xml_bytes, css_path, engine)
+    return pdf, timings, cache_key(xml_bytes, css_path, engine)
+
+
+async def track_requests(request, call_next):
+    """Middleware HTTP: latencia por ruta (la plantilla, no la URL concreta)."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            request.method, route.path if route else "unmatched", str(status),
+        ).observe(time.perf_counter() - t0)
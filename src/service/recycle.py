@@ -0,0 +1,93 @@
+"""
+Reciclaje de procesos por memoria (RSS) en lugar de por nº de peticiones.
+
+WeasyPrint va acumulando memoria (fuentes, cachés de layout) y los PDF
+grandes la disparan: un worker se recicla cuando él y sus hijos (el pool de
+render) superan WORKER_MAX_RSS_MB, no cada N peticiones.
+"""
+import glob
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "0"))  # 0 = desactivado
+RSS_CHECK_INTERVAL = float(os.getenv("WORKER_RSS_CHECK_INTERVAL", "10"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_rss(pid: int) -> int:
+    """
+    Memoria en bytes de un proceso (Linux, /proc). Se usa el PSS: las
+    páginas compartidas copy-on-write con el master se reparten entre los
+    procesos en vez de contarse en cada uno. Sin smaps_rollup, el RSS.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _children(pid: int):
+    for path in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(path) as f:
+                yield from (int(c) for c in f.read().split())
+        except OSError:
+            continue
+
+
+def tree_rss(pid: Optional[int] = None) -> int:
+    """RSS del proceso más el de todos sus descendientes."""
+    pending = [pid or os.getpid()]
+    total = 0
+    while pending:
+        p = pending.pop()
+        total += process_rss(p)
+        pending.extend(_children(p))
+    return total
+
+
+def over_limit(max_mb: int = WORKER_MAX_RSS_MB, pid: Optional[int] = None) -> bool:
+    return max_mb > 0 and tree_rss(pid) > max_mb * MB
+
+
+def start_rss_watchdog(max_mb: int = WORKER_MAX_RSS_MB, interval: float = RSS_CHECK_INTERVAL,
+                       sig: int = signal.SIGTERM) -> Optional[threading.Thread]:
+    """
+    Hilo que revisa el RSS cada ``interval`` segundos y, al pasar ``max_mb``,
+    le envía ``sig`` al propio proceso: con SIGTERM Gunicorn termina las
+    peticiones en curso y el master levanta un worker nuevo.
+    """
+    if max_mb <= 0:
+        return None
+    pid = os.getpid()
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            rss = tree_rss(pid)
+            if rss > max_mb * MB:
+                logger.warning("♻️ Proceso %s usa %s MB (límite %s MB): reciclando",
+                               pid, rss // MB, max_mb)
+                os.kill(pid, sig)
+                return
+
+    thread = threading.Thread(target=watch, name="rss-watchdog", daemon=True)
+    thread.start()
+    return thread
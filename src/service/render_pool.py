@@ -0,0 +1,131 @@
+"""
+Pool de procesos para renderizar PDFs fuera del event loop.
+
+El render es CPU puro (WeasyPrint), así que se delega a procesos aparte con
+un máximo de trabajos en vuelo: si el pool está lleno se rechaza enseguida
+(503 + Retry-After) en lugar de encolar sin límite y degradar a todos.
+
+Un render que pasa el timeout deja su proceso colgado: el pool cambia el
+executor por uno nuevo y mata el viejo apenas le quedan solo renders
+colgados, así los cupos no quedan tomados para siempre.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Set
+
+from .metrics import RENDER_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+class RenderPoolSaturated(Exception):
+    """No quedan cupos en el pool de render."""
+
+
+class RenderPool:
+    def __init__(self, workers: int, max_in_flight: int, timeout: float,
+                 initializer: Optional[Callable] = None):
+        self.workers = workers
+        self.max_in_flight = max(max_in_flight, workers)
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        # Renders en vuelo y los que pasaron el timeout, por executor
+        self._running: Dict[ProcessPoolExecutor, Set[asyncio.Future]] = {}
+        self._stuck: Dict[ProcessPoolExecutor, Set[asyncio.Future]] = {}
+        self.recycled = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        self._running[executor] = set()
+        self._stuck[executor] = set()
+        return executor
+
+    def start(self):
+        self._executor = self._new_executor()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        logger.info("🧵 Pool de render: %s procesos, %s en vuelo máx., timeout %ss",
+                    self.workers, self.max_in_flight, self.timeout)
+
+    def shutdown(self):
+        for executor in list(self._running):
+            self._kill(executor)
+        self._executor = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def saturated(self) -> bool:
+        return self._in_flight >= self.max_in_flight
+
+    def _release(self, executor, fut):
+        self._in_flight -= 1
+        RENDER_IN_FLIGHT.dec()
+        self._slots.release()
+        # Evita el aviso "exception was never retrieved" si nadie la esperó (timeout)
+        if not fut.cancelled():
+            fut.exception()
+        if executor in self._running:
+            self._running[executor].discard(fut)
+            self._stuck[executor].discard(fut)
+            self._reap(executor)
+
+    def _kill(self, executor):
+        # ProcessPoolExecutor no tiene cómo matar un worker ocupado (hasta 3.14)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._running.pop(executor, None)
+        self._stuck.pop(executor, None)
+
+    def _reap(self, executor):
+        """Mata un executor reemplazado cuando ya no corre nada que no esté colgado."""
+        if executor is not self._executor and self._running[executor] <= self._stuck[executor]:
+            self._kill(executor)
+
+    def _timed_out(self, executor, fut):
+        self._stuck[executor].add(fut)
+        if executor is self._executor:
+            logger.warning("⏱️ Render sobre %ss: se reemplaza el pool de procesos", self.timeout)
+            self._executor = self._new_executor()
+            self.recycled += 1
+        self._reap(executor)
+
+    async def run(self, fn: Callable, *args, wait: bool = False):
+        """
+        Ejecuta ``fn(*args)`` en el pool y espera el resultado.
+
+        Sin ``wait`` lanza RenderPoolSaturated si no hay cupo; con ``wait``
+        espera uno. Lanza asyncio.TimeoutError si supera ``timeout``: el cupo
+        se libera recién cuando el proceso termina o se mata al reciclar el
+        executor, así el límite es real.
+        """
+        if not wait and self._slots.locked():
+            raise RenderPoolSaturated()
+        await self._slots.acquire()
+
+        self._in_flight += 1
+        RENDER_IN_FLIGHT.inc()
+        executor = self._executor
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BaseException:
+            self._in_flight -= 1
+            RENDER_IN_FLIGHT.dec()
+            self._slots.release()
+            raise
+        self._running[executor].add(fut)
+        fut.add_done_callback(functools.partial(self._release, executor))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                self._timed_out(executor, fut)
+            raise
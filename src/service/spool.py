@@ -0,0 +1,222 @@
+"""
+Spool de subidas grandes en un directorio compartido entre la API y los
+workers (SPOOL_DIR, un volumen en docker-compose).
+
+Los ZIP se copian al spool a medida que llega el cuerpo de la petición (ver
+spool_multipart), cortando apenas superan el límite, y a la cola solo va la
+ruta y su SHA-256: Redis nunca guarda el ZIP. La escritura y el hash van en
+un hilo, por bloques de CHUNK_SIZE, fuera del event loop. Los PDF de cada
+lote van a un subdirectorio propio (ver batch_dir). El job final del lote
+borra ambos; los que quedan huérfanos (lote expirado, worker caído) se
+barren por antigüedad.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/tmp/xml2pdf-spool")
+SPOOL_TTL = int(os.getenv("SPOOL_TTL", str(24 * 3600)))  # segundos
+CHUNK_SIZE = 1024 * 1024
+MAX_FORM_FIELD = 64 * 1024  # campos de texto del formulario (email, etc.)
+
+
+class UploadTooLarge(Exception):
+    """La subida supera el tamaño máximo permitido."""
+
+
+def _write_block(f, h, data: bytes):
+    h.update(data)
+    f.write(data)
+
+
+async def spool_upload(upload, max_bytes: int, suffix: str = ".zip") -> Tuple[str, int, str]:
+    """
+    Copia ``upload`` (UploadFile) al spool por bloques y devuelve (ruta,
+    bytes, sha256). Lanza UploadTooLarge al pasar ``max_bytes``, sin dejar
+    nada en disco.
+    """
+    from fastapi.concurrency import run_in_threadpool
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"más de {max_bytes} bytes")
+                await run_in_threadpool(_write_block, f, h, chunk)
+        path = os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}{suffix}")
+        os.replace(tmp, path)
+    except BaseException:
+        remove(tmp)
+        raise
+    return path, size, h.hexdigest()
+
+
+async def spool_multipart(request, field: str, max_bytes: int,
+                          suffix: str = ".zip") -> Tuple[str, int, str, Dict[str, str]]:
+    """
+    Lee el cuerpo multipart de ``request`` a medida que llega y copia la
+    parte ``field`` al spool. Devuelve (ruta, bytes, sha256, {campo: valor}
+    con el resto del formulario).
+
+    A diferencia de UploadFile, Starlette no copia antes todo el cuerpo a un
+    temporal: UploadTooLarge sale apenas la parte pasa ``max_bytes``, sin
+    leer el resto, aunque la petición no traiga Content-Length. Lanza
+    ValueError si el cuerpo no es multipart/form-data o no trae ``field``.
+
+    Los callbacks del parser solo juntan los bytes del archivo; se escriben
+    (y se hashean) en un hilo cada CHUNK_SIZE, fuera del event loop.
+    """
+    from fastapi.concurrency import run_in_threadpool
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise ValueError("se esperaba multipart/form-data")
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    h = hashlib.sha256()
+    fields = {}
+    part = {}
+    state = {"size": 0, "found": False}
+    pending = []  # bytes del archivo aún sin escribir
+    fd, tmp = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".part")
+    f = os.fdopen(fd, "wb")
+
+    def on_part_begin():
+        part.clear()
+        part.update(header=b"", value=b"", headers={}, name=None, body=[], is_file=False)
+
+    def on_header_field(data, start, end):
+        part["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header"].lower()] = part["value"]
+        part["header"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        part["is_file"] = part["name"] == field and not state["found"]
+        state["found"] = state["found"] or part["is_file"]
+
+    def on_part_data(data, start, end):
+        chunk = data[start:end]
+        if part["is_file"]:
+            state["size"] += len(chunk)
+            if state["size"] > max_bytes:
+                raise UploadTooLarge(f"más de {max_bytes} bytes")
+            pending.append(chunk)
+        else:
+            part["body"].append(chunk)
+            if sum(map(len, part["body"])) > MAX_FORM_FIELD:
+                raise UploadTooLarge(f"campo {part['name']} de más de {MAX_FORM_FIELD} bytes")
+
+    def on_part_end():
+        if not part["is_file"] and part["name"]:
+            fields[part["name"]] = b"".join(part["body"]).decode("utf-8", "replace")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field,
+        "on_header_value": on_header_value, "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished, "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    async def flush(force: bool = False):
+        if pending and (force or sum(map(len, pending)) >= CHUNK_SIZE):
+            block = b"".join(pending)
+            pending.clear()
+            await run_in_threadpool(_write_block, f, h, block)
+
+    try:
+        with f:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await flush()
+            parser.finalize()
+            await flush(force=True)
+        if not state["found"]:
+            raise ValueError(f"falta el archivo '{field}'")
+        path = os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}{suffix}")
+        os.replace(tmp, path)
+    except BaseException:
+        remove(tmp)
+        raise
+    return path, state["size"], h.hexdigest(), fields
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def batch_dir(batch_id: str) -> str:
+    """Directorio del spool con los PDF de un lote (lo crea si no existe)."""
+    path = os.path.join(SPOOL_DIR, batch_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_atomic(path: str, data: bytes):
+    """Escribe ``data`` en ``path`` sin dejar archivos a medias si el job muere."""
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("No se pudo borrar %s del spool: %s", path, str(e))
+
+
+def remove_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def sweep(max_age: int = SPOOL_TTL) -> int:
+    """Borra del spool los archivos y directorios de lote más viejos que ``max_age`` segundos."""
+    limit = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(SPOOL_DIR))
+    except FileNotFoundError:
+        return 0
+    for e in entries:
+        try:
+            if e.stat().st_mtime >= limit:
+                continue
+            if e.is_dir():
+                remove_dir(e.path)
+            else:
+                os.remove(e.path)
+            removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info("🧹 %s archivos vencidos borrados del spool", removed)
+    return removed
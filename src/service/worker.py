@@ -0,0 +1,140 @@
+"""
+Worker RQ con métricas Prometheus.
+
+Mide cada job desde el proceso principal del worker (duración y fallos por
+función, incluidos los timeouts y los work-horse que mueren) y expone las
+métricas en su propio puerto. Antes de empezar hace un render de prueba, así
+cada work-horse (fork por job) hereda WeasyPrint ya cargado; si el worker
+supera WORKER_MAX_RSS_MB se detiene tras el job en curso y el contenedor lo
+reinicia.
+
+Por defecto escucha las colas small, medium y bulk. Los jobs que queden en
+la antigua cola única xml2pdf (con la firma anterior: bytes del ZIP, email)
+se pasan a estas colas al arrancar (ver jobs.drain_legacy_queue).
+Tras cada job las reordena al azar según QUEUE_WEIGHTS: las chicas salen
+primero casi siempre, pero bulk también avanza aunque nunca se vacíen.
+
+Los correos van a la cola xml2pdf-mail, que atiende un worker aparte sin
+fork (--simple), para que la conexión SMTP se reutilice entre jobs.
+
+    python -m service.worker --port 9100
+    python -m service.worker xml2pdf-bulk --port 9101   # worker solo para bulk
+    python -m service.worker xml2pdf-mail --simple --port 9102   # envío de correos
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+from prometheus_client import start_http_server
+from rq import Queue, SimpleWorker, Worker
+from rq.exceptions import StopRequested
+from rq.job import JobStatus
+
+from sii_xml_pdf.renderer import warm_up
+from .config import (QUEUE_MAIL, QUEUE_NAMES, QUEUE_WEIGHTS, get_render_cache,
+                     parse_queue_weights, redis_conn)
+from .jobs import drain_legacy_queue
+from .metrics import JOB_DURATION, JOB_FAILURES, build_registry, observe_render
+from .recycle import WORKER_MAX_RSS_MB, over_limit, tree_rss
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+
+def _job_name(job) -> str:
+    try:
+        return job.func_name.rsplit(".", 1)[-1]
+    except Exception:
+        return "unknown"
+
+
+class MetricsMixin:
+    def execute_job(self, job, queue):
+        t0 = time.perf_counter()
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            name = _job_name(job)
+            JOB_DURATION.labels(name).observe(time.perf_counter() - t0)
+            try:
+                if job.get_status(refresh=True) == JobStatus.FAILED:
+                    JOB_FAILURES.labels(name).inc()
+                # Los tiempos por etapa los deja el job en meta (ver render_chunk)
+                for timings, size in job.get_meta(refresh=True).get("render_samples", ()):
+                    observe_render(timings, size)
+            except Exception as e:  # job ya expirado o Redis caído
+                logger.debug("Sin métricas del job %s: %s", job.id, str(e))
+
+
+class RecycleMixin:
+    def execute_job(self, job, queue):
+        result = super().execute_job(job, queue)
+        if over_limit(WORKER_MAX_RSS_MB):
+            logger.warning("♻️ Worker usa %s MB (límite %s MB): se detiene para reiniciarse",
+                           tree_rss() // (1024 * 1024), WORKER_MAX_RSS_MB)
+            raise StopRequested()
+        return result
+
+
+def weighted_order(queues: list, weights: dict) -> list:
+    """
+    Orden al azar de ``queues`` en que cada cola queda primera con
+    probabilidad proporcional a su peso (sin peso = 1, peso 0 = al final).
+    """
+    def key(queue):
+        weight = weights.get(queue.name, 1.0)
+        return random.random() ** (1.0 / weight) if weight > 0 else -1.0
+    return sorted(queues, key=key, reverse=True)
+
+
+class WeightedMixin:
+    def __init__(self, *args, queue_weights: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue_weights = queue_weights or {}
+        self._ordered_queues = weighted_order(self.queues, self.queue_weights)
+
+    def reorder_queues(self, reference_queue):
+        self._ordered_queues = weighted_order(self.queues, self.queue_weights)
+
+
+class MetricsWorker(RecycleMixin, MetricsMixin, WeightedMixin, Worker):
+    """Worker estándar (un work-horse por job)."""
+
+
+class MetricsSimpleWorker(RecycleMixin, MetricsMixin, WeightedMixin, SimpleWorker):
+    """Ejecuta los jobs en el mismo proceso (sin fork)."""
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Worker RQ de xml2pdf con métricas")
+    ap.add_argument("queues", nargs="*", default=list(QUEUE_NAMES))
+    ap.add_argument("--port", type=int, default=METRICS_PORT)
+    ap.add_argument("--weights", default=QUEUE_WEIGHTS,
+                    help="Prioridad de cada cola, 'cola=peso,...' (por defecto QUEUE_WEIGHTS)")
+    ap.add_argument("--simple", action="store_true", help="Sin fork por job (SimpleWorker)")
+    args = ap.parse_args(argv)
+
+    if set(args.queues) - {QUEUE_MAIL}:  # el de correos no renderiza
+        warm_up()
+        get_render_cache()  # la heredan los work-horse, no se arma en cada job
+        logger.info("🔥 Worker precalentado")
+        moved = drain_legacy_queue({name: Queue(name, connection=redis_conn) for name in QUEUE_NAMES})
+        if moved:
+            logger.info("🚚 %s job(s) de la cola antigua pasados a las colas nuevas", moved)
+
+    queues = [Queue(name, connection=redis_conn) for name in args.queues]
+    start_http_server(args.port, registry=build_registry(queues))
+    logger.info("📈 Métricas del worker en :%s/metrics", args.port)
+
+    worker_cls = MetricsSimpleWorker if args.simple else MetricsWorker
+    weights = parse_queue_weights(args.weights)
+    logger.info("🎚️ Colas %s, pesos %s", ", ".join(args.queues), weights)
+    # with_scheduler: el envío juntado por destinatario usa enqueue_in (ver mailer)
+    worker_cls(queues, connection=redis_conn, queue_weights=weights).work(with_scheduler=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Lectura y escritura de archivos comprimidos para `convert-archive`.
+
+Los XML se leen de a uno desde un ZIP, tar o tar.gz (o desde stdin) y los
+PDF se escriben directo en el ZIP/tar de salida (o en stdout), sin pasar
+por archivos sueltos en disco.
+"""
+import io
+import pathlib
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+ARCHIVE_FORMATS = ("zip", "tar", "tar.gz")
+
+# stdin se guarda en memoria hasta este tamaño y luego en un temporal (el ZIP
+# necesita poder saltar al directorio central, al final del archivo)
+SPOOL_MAX_MEMORY = 64 * 1024 * 1024
+
+
+def open_input(path: str) -> BinaryIO:
+    """Abre ``path`` para leer; con "-" copia stdin a un temporal con seek."""
+    if path != "-":
+        return open(path, "rb")
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    shutil.copyfileobj(sys.stdin.buffer, spool, 1 << 20)
+    spool.seek(0)
+    return spool
+
+
+def iter_xml_members(fileobj: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """
+    (nombre, bytes) de cada .xml del ZIP o tar, leídos de a uno y en orden.
+    El formato se revisa al llamarla (ValueError si no es ninguno de los dos).
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        return _zip_members(zipfile.ZipFile(fileobj))
+    fileobj.seek(0)
+    try:
+        return _tar_members(tarfile.open(fileobj=fileobj, mode="r:*"))
+    except tarfile.TarError:
+        raise ValueError("La entrada no es un ZIP ni un tar/tar.gz")
+
+
+def _zip_members(zf: zipfile.ZipFile):
+    with zf:
+        for info in zf.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(".xml"):
+                yield info.filename, zf.read(info)
+
+
+def _tar_members(tf: tarfile.TarFile):
+    with tf:
+        for member in tf:
+            if member.isfile() and member.name.lower().endswith(".xml"):
+                yield member.name, tf.extractfile(member).read()
+
+
+def guess_format(out: str) -> str:
+    name = out.lower()
+    if name.endswith((".tar.gz", ".tgz")):
+        return "tar.gz"
+    if name.endswith(".tar"):
+        return "tar"
+    return "zip"
+
+
+class ZipSink:
+    """
+    Escribe PDFs en un ZIP sin comprimir (ya vienen comprimidos). Funciona
+    también sobre stdout: zipfile usa data descriptors si no hay seek.
+    """
+
+    def __init__(self, fileobj: BinaryIO, close_file: bool = True):
+        self._fileobj = fileobj
+        self._close_file = close_file
+        self._zf = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_STORED)
+
+    def write(self, name: str, data: bytes):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        self._zf.writestr(info, data)
+
+    def close(self):
+        self._zf.close()
+        _close(self._fileobj, self._close_file)
+
+
+class TarSink:
+    """Escribe PDFs en un tar (o tar.gz) en modo stream, sin seek."""
+
+    def __init__(self, fileobj: BinaryIO, gzip: bool = False, close_file: bool = True):
+        self._fileobj = fileobj
+        self._close_file = close_file
+        self._tf = tarfile.open(fileobj=fileobj, mode="w|gz" if gzip else "w|")
+
+    def write(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self._tf.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._tf.close()
+        _close(self._fileobj, self._close_file)
+
+
+def _close(fileobj: BinaryIO, close_file: bool):
+    if close_file:
+        fileobj.close()
+    else:
+        fileobj.flush()
+
+
+def open_sink(out: str, fmt: Optional[str] = None):
+    """Salida para ``out`` ("-" = stdout); el formato sale de la extensión si no se indica."""
+    fmt = fmt or ("zip" if out == "-" else guess_format(out))
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Formato de archivo desconocido: {fmt}")
+    if out == "-":
+        fileobj, close_file = sys.stdout.buffer, False
+    else:
+        pathlib.Path(out).parent.mkdir(parents=True, exist_ok=True)
+        fileobj, close_file = open(out, "wb"), True
+    if fmt == "zip":
+        return ZipSink(fileobj, close_file)
+    return TarSink(fileobj, gzip=fmt == "tar.gz", close_file=close_file)
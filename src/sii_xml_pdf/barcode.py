@@ -1,7 +1,23 @@
-from pdf417 import encode, render_svg
+from pdf417 import encode, render_image, render_svg
+from pdf417.rendering import barcode_size
+from functools import lru_cache
 import xml.etree.ElementTree as ET
+import base64
+import io
 import re
 
+# Modos de salida del timbre:
+# - "svg":  un <rect> por módulo (salida original de pdf417.render_svg)
+# - "path": un único <path> con las corridas horizontales de módulos negros
+# - "png":  <img> con un PNG de 1 px por módulo escalado sin interpolar
+BARCODE_MODES = ("svg", "path", "png")
+DEFAULT_BARCODE_MODE = "path"
+
+_RE_XMLNS = re.compile(r'\sxmlns(:\w+)?="[^"]+"')
+_RE_NS_PREFIX = re.compile(r'\bns\d+:')
+_RE_BETWEEN_TAGS = re.compile(r">\s+<")
+_RE_SPACES = re.compile(r"\s+")
+
 
 def clean_ted(ted_xml: str) -> str:
     """
@@ -12,27 +28,100 @@ def clean_ted(ted_xml: str) -> str:
     """
     s = ted_xml.strip()
     # Quitar xmlns y atributos de namespace
-    s = re.sub(r'\sxmlns(:\w+)?="[^"]+"', '', s)
+    s = _RE_XMLNS.sub('', s)
     # Quitar prefijos tipo ns0:
-    s = re.sub(r'\bns\d+:', '', s)
+    s = _RE_NS_PREFIX.sub('', s)
     # Quitar espacios y saltos de línea excesivos
-    s = re.sub(r">\s+<", "><", s)
-    s = re.sub(r"\s+", " ", s)
+    s = _RE_BETWEEN_TAGS.sub("><", s)
+    s = _RE_SPACES.sub(" ", s)
     return s
 
 
-def pdf417_svg_from_ted(ted_str: str, columns: int = 17, scale: int = 2, ratio: int = 3) -> str:
-    ted_clean = clean_ted(ted_str)
-    
-    # # 👇 verificar el tamaño y contenido exacto
-    # print("==== TED a codificar ====")
-    # print(ted_clean)
-    # print("Longitud:", len(ted_clean), "caracteres")
-    # # Generar el PDF417
-    
+# El mismo TED llega una y otra vez (reintentos, sobres repetidos): se evita
+# también repetir las regex de limpieza
+_clean_ted_cached = lru_cache(maxsize=256)(clean_ted)
+
+
+def barcode_runs(codes):
+    """
+    Recorre los códigos PDF417 y entrega las corridas de módulos negros
+    como (columna, fila, largo), en unidades de módulo.
+    """
+    for row_id, row in enumerate(codes):
+        bits = "".join(format(value, "b") for value in row)
+        col = bits.find("1")
+        while col != -1:
+            end = bits.find("0", col)
+            if end == -1:
+                end = len(bits)
+            yield col, row_id, end - col
+            col = bits.find("1", end)
+
+
+def _svg_path(codes, scale: int, ratio: int) -> str:
+    width, height = barcode_size(codes)
+    sy = scale * ratio
+    d = "".join(
+        f"M{col * scale} {row * sy}h{n * scale}v{sy}h-{n * scale}z"
+        for col, row, n in barcode_runs(codes)
+    )
+    return (
+        f'<svg version="1.1" xmlns="http://www.w3.org/2000/svg" '
+        f'width="{width * scale}" height="{height * sy}" shape-rendering="crispEdges">'
+        f'<path fill="#000000" d="{d}"/></svg>'
+    )
+
+
+def _png_img(codes, scale: int, ratio: int) -> str:
+    # 1 px de ancho por módulo (ratio px de alto): el CSS lo escala igual que
+    # al SVG y image-rendering evita que se interpolen los bordes
+    width, height = barcode_size(codes)
+    image = render_image(codes, scale=1, ratio=ratio, padding=0).convert("1")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", optimize=True)
+    data = base64.b64encode(buf.getvalue()).decode("ascii")
+    return (
+        f'<img alt="Timbre electrónico" src="data:image/png;base64,{data}" '
+        f'width="{width * scale}" height="{height * scale * ratio}">'
+    )
+
+
+@lru_cache(maxsize=256)
+def _render(ted_clean: str, columns: int, scale: int, ratio: int, mode: str) -> str:
     codes = encode(ted_clean, columns=columns, security_level=0)
+    if mode == "path":
+        return _svg_path(codes, scale, ratio)
+    if mode == "png":
+        return _png_img(codes, scale, ratio)
+
     svg_tree = render_svg(codes, scale=scale, ratio=ratio)
-    root = svg_tree.getroot()
+    return ET.tostring(svg_tree.getroot(), encoding="unicode")
 
-    # Devolver como string para inyectar en el template
-    return ET.tostring(root, encoding="unicode")
+
+def pdf417_markup_from_ted(ted_str: str, columns: int = 17, scale: int = 2, ratio: int = 3,
+                           mode: str = DEFAULT_BARCODE_MODE) -> str:
+    """
+    Devuelve el timbre PDF417 como markup para inyectar en el template
+    (<svg> o <img> según ``mode``). El resultado se memoiza por TED limpio.
+    """
+    if mode not in BARCODE_MODES:
+        raise ValueError(f"Modo de timbre desconocido: {mode}")
+    return _render(_clean_ted_cached(ted_str), columns, scale, ratio, mode)
+
+
+@lru_cache(maxsize=256)
+def _runs(ted_clean: str, columns: int):
+    codes = encode(ted_clean, columns=columns, security_level=0)
+    return barcode_size(codes), tuple(barcode_runs(codes))
+
+
+def pdf417_runs(ted_str: str, columns: int = 17):
+    """
+    ((ancho, alto) en módulos, corridas de barcode_runs) del timbre, para
+    dibujarlo directo en el PDF (motor "fast"). Memoizado por TED limpio.
+    """
+    return _runs(_clean_ted_cached(ted_str), columns)
+
+
+def pdf417_svg_from_ted(ted_str: str, columns: int = 17, scale: int = 2, ratio: int = 3) -> str:
+    return pdf417_markup_from_ted(ted_str, columns, scale, ratio, mode="svg")
@@ -0,0 +1,175 @@
+"""
+Caché de PDFs renderizados, direccionada por contenido.
+
+La clave combina el hash del XML canonicalizado (C14N) con una huella de
+lo que dibuja el PDF: invoice.html, invoice.css, el CSS personalizado y el
+modo del timbre con el motor html, o fast.py con el motor rápido. Cualquier
+cambio invalida las entradas anteriores sin tener que vaciar nada.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+import xml.etree.ElementTree as ET
+from importlib import resources
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Subir cuando cambie el renderer de forma que altere el PDF generado
+CACHE_VERSION = "2"
+
+_fingerprints: Dict[Tuple, str] = {}
+
+
+def _template_files(engine: str = "html"):
+    pkg = resources.files("sii_xml_pdf")
+    if engine == "fast":  # dibuja directo: ni plantilla ni CSS
+        return [pkg.joinpath("fast.py")]
+    tpl = pkg.joinpath("templates")
+    return [tpl.joinpath("invoice.html"), tpl.joinpath("invoice.css")]
+
+
+def _mtime(path) -> int:
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def template_fingerprint(css_path: Optional[str] = None, engine: str = "html") -> str:
+    """
+    Huella de lo que usa ``engine`` para dibujar (plantilla + CSS + modo del
+    timbre, o fast.py); se recalcula solo si cambia algún mtime.
+    """
+    from .barcode import DEFAULT_BARCODE_MODE
+
+    files = _template_files(engine)
+    if css_path and engine != "fast":
+        files.append(pathlib.Path(css_path))
+    extra = f"{engine}:{DEFAULT_BARCODE_MODE}" if engine != "fast" else engine
+    memo_key = (extra,) + tuple((str(f), _mtime(f)) for f in files)
+
+    fp = _fingerprints.get(memo_key)
+    if fp is None:
+        h = hashlib.sha256(f"{CACHE_VERSION}:{extra}".encode())
+        for f in files:
+            h.update(f.read_bytes())
+        fp = h.hexdigest()[:16]
+        _fingerprints[memo_key] = fp
+    return fp
+
+
+def xml_digest(xml_bytes: bytes) -> str:
+    """
+    SHA-256 del XML en forma canónica (C14N 2.0). Un XML mal formado lanza
+    MalformedXMLError, como lo haría el parser: sin clave no hay ETag ni 304.
+    """
+    try:
+        canon = ET.canonicalize(xml_data=xml_bytes).encode("utf-8")
+    except ET.ParseError as e:
+        from .errors import MalformedXMLError
+
+        raise MalformedXMLError(f"XML mal formado: {e}") from e
+    return hashlib.sha256(canon).hexdigest()
+
+
+def render_fingerprint(css_path: Optional[str] = None, engine: str = "html") -> str:
+    """Huella de plantilla/CSS o de fast.py, con el motor como sufijo si no es el HTML."""
+    fp = template_fingerprint(css_path, engine)
+    return fp if engine == "html" else f"{fp}-{engine}"
+
+
+def cache_key(xml_bytes: bytes, css_path: Optional[str] = None, engine: str = "html") -> str:
+    return f"{xml_digest(xml_bytes)[:40]}-{render_fingerprint(css_path, engine)}"
+
+
+def dte_cache_key(dte, css_path: Optional[str] = None, engine: str = "html") -> str:
+    """Clave a partir de un DTEData ya parseado (p.ej. documentos de un sobre)."""
+    digest = hashlib.sha256(dte.model_dump_json().encode("utf-8")).hexdigest()
+    return f"{digest[:40]}-{render_fingerprint(css_path, engine)}"
+
+
+class DiskCache:
+    """
+    Caché LRU en un directorio: un archivo por PDF. Cada acierto actualiza el
+    mtime y, al superar ``max_bytes``, se borran los menos usados.
+
+    El tamaño total se calcula al crearla (recorre el directorio una vez):
+    conviene armarla antes del fork, así los procesos hijos heredan la cuenta
+    en vez de recorrer el directorio cada uno.
+    """
+
+    def __init__(self, directory, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in self._entries())
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    def _entries(self):
+        return self.directory.glob("*/*.pdf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            old = path.stat().st_size  # reescribir la misma clave no suma
+        except FileNotFoundError:
+            old = 0
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        self._size += len(data) - old
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for e in self._entries():
+            try:
+                st = e.stat()
+            except FileNotFoundError:  # borrado por otro proceso
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, e))
+        entries.sort()
+
+        size = sum(s for _, s, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, s, e in entries:
+            if size <= target:
+                break
+            try:
+                e.unlink()
+            except FileNotFoundError:
+                pass
+            size -= s
+        self._size = size
+        logger.debug("Caché en disco recortada a %s bytes", size)
+
+
+class RedisCache:
+    """Caché en Redis con expiración (TTL) por entrada."""
+
+    def __init__(self, conn, ttl: int = 7 * 24 * 3600, prefix: str = "xml2pdf:pdf:"):
+        self.conn = conn
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.conn.get(self.prefix + key)
+
+    def set(self, key: str, data: bytes):
+        self.conn.set(self.prefix + key, data, ex=self.ttl)
@@ -1,97 +1,404 @@
 import argparse
+import functools
+import os
 import pathlib
 import sys
-import pandas as pd
-import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
 
-from sii_xml_pdf.parser import parse_xml
-from sii_xml_pdf.renderer import render_pdf
+# parser (pydantic), renderer (WeasyPrint, Jinja) y export se importan dentro
+# de cada subcomando: `sii-xml-pdf --help` o un `convert` desde cron no deben
+# pagar el arranque de lo que no usan (ver benchmarks/run.py --suite startup)
+from sii_xml_pdf.naming import pdf_name, unique_name
+from sii_xml_pdf.pool import BatchSummary, TaskResult, default_jobs, run_tasks
 
 
-def convert_file(xml_path, out=None, css=None):
+def _init_worker(css=None, engine="html"):
+    from sii_xml_pdf.renderer import preload
+
+    # Plantilla, CSS y fuentes se cargan una vez por proceso del pool (el
+    # motor fast no los usa)
+    if engine == "html":
+        preload(css)
+
+
+def _output_path(dte, out=None, n=1) -> pathlib.Path:
+    # Construir ruta de salida
+    if out is None:
+        return pathlib.Path("output/pdf") / pdf_name(dte)
+
+    out_candidate = pathlib.Path(out)
+    if out_candidate.is_dir() or str(out).endswith("/"):
+        return out_candidate / pdf_name(dte)
+    if n > 1:
+        # Sobre con varios documentos y -o apuntando a un archivo
+        return out_candidate.with_name(f"{out_candidate.stem}-{n}{out_candidate.suffix}")
+    return out_candidate
+
+
+def _convert_xml(xml_path, out=None, css=None, engine="html") -> List[pathlib.Path]:
+    """Convierte cada documento del XML (uno o un sobre EnvioDTE) a PDF."""
+    from sii_xml_pdf.parser import iter_dtes
+    from sii_xml_pdf.renderer import render_pdf
+
+    paths = []
+    for n, dte in enumerate(iter_dtes(xml_path), start=1):
+        pdf_bytes = render_pdf(dte, css_path=css, engine=engine)
+
+        out_path = _output_path(dte, out, n)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(pdf_bytes)
+        paths.append(out_path)
+
+    if not paths:
+        from sii_xml_pdf.errors import MalformedXMLError
+
+        raise MalformedXMLError("el XML no contiene ningún Documento")
+    return paths
+
+
+def convert_file(xml_path, out=None, css=None, engine="html"):
     xml_path = pathlib.Path(xml_path).resolve()
     if not xml_path.exists():
         raise SystemExit(f"❌ No existe el XML: {xml_path}")
 
-    dte = parse_xml(str(xml_path))
-    pdf_bytes = render_pdf(dte, css_path=css)
+    for out_path in _convert_xml(xml_path, out=out, css=css, engine=engine):
+        print(f"✅ PDF generado: {out_path}")
 
-    # Construir ruta de salida
-    if out is None:
-        out_path = pathlib.Path(
-            "output/pdf") / f"{dte.fecha_emision.replace('-', '')} {dte.tipo_dte_abreviatura} {dte.razon_social.title().replace('.', '')} {dte.numero_factura}.pdf"
+
+def convert_folder(folder, out=None, css=None, jobs=None, combine=False, bookmarks=True,
+                   incremental=False, watch=False, interval=2.0, engine="html"):
+    folder = pathlib.Path(folder).resolve()
+    if not folder.exists():
+        raise SystemExit(f"❌ No existe la carpeta: {folder}")
+
+    if combine:
+        if incremental or watch:
+            raise SystemExit("❌ --combine no se puede usar con --incremental ni --watch")
+        if engine != "html":
+            raise SystemExit(f"❌ --combine solo funciona con el motor html (no {engine})")
+        return _convert_folder_combined(folder, out=out, css=css, bookmarks=bookmarks)
+
+    if out is not None:
+        # Asegurar que -o se trate como directorio aunque aún no exista
+        pathlib.Path(out).mkdir(parents=True, exist_ok=True)
+
+    if watch:
+        return _watch_folder(folder, out=out, css=css, jobs=jobs, interval=interval, engine=engine)
+
+    files = sorted(folder.glob("*.xml"))
+    summary = BatchSummary()
+    if incremental:
+        manifest = _load_manifest(out)
+        manifest.prune(f.name for f in files)
+        _convert_incremental(files, manifest, out, css, jobs, summary, engine)
     else:
-        out_candidate = pathlib.Path(out)
-        if out_candidate.is_dir() or str(out).endswith("/"):
-            out_path = out_candidate / \
-                f"{dte.fecha_emision.replace('-', '')} {dte.tipo_dte_abreviatura} {dte.razon_social.title().replace('.', '')} {dte.numero_factura}.pdf"
+        for _ in _convert_files(files, out, css, jobs, summary, engine):
+            pass
+    summary.finish()
+    summary.report()
+    _write_errors(summary, pathlib.Path(out or "output/pdf"))
+
+
+def _write_errors(summary, out_dir: pathlib.Path, name: str = None):
+    """errors.csv en ``out_dir`` con los XML que fallaron; sin errores, borra el de una corrida anterior."""
+    from sii_xml_pdf.errors import ERRORS_CSV, errors_csv
+
+    path = out_dir / (name or ERRORS_CSV)
+    if not summary.failures:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(errors_csv(summary.error_rows()))
+    print(f"📝 Errores en {path}", file=sys.stderr)
+
+
+def _convert_files(files, out, css, jobs, summary, engine="html", executor=None):
+    """Convierte ``files`` en el pool (o en ``executor``), informa cada resultado y lo entrega."""
+    task = functools.partial(_convert_xml, out=out, css=css, engine=engine)
+    init = (None, ()) if executor is not None else (_init_worker, (css, engine))
+    for result in run_tasks(task, ((f.name, f) for f in files), jobs=jobs,
+                            initializer=init[0], initargs=init[1], executor=executor):
+        summary.add(result)
+        if result.ok:
+            for out_path in result.value:
+                print(f"✅ PDF generado: {out_path}")
         else:
-            out_path = out_candidate
+            print(
+                f"⚠️ Error convirtiendo {result.name}: {result.error}", file=sys.stderr)
+        yield result
+
+
+def _load_manifest(out):
+    from sii_xml_pdf.manifest import MANIFEST_NAME, Manifest
+
+    return Manifest.load(pathlib.Path(out or "output/pdf") / MANIFEST_NAME)
+
+
+def _convert_incremental(files, manifest, out, css, jobs, summary, engine="html", executor=None):
+    """
+    Convierte solo los XML nuevos o modificados, o todos si cambió la
+    plantilla/CSS o el motor. Los que fallan no quedan en el manifiesto:
+    se reintentan en la pasada siguiente (o en la próxima vuelta de --watch).
+    """
+    from sii_xml_pdf.cache import render_fingerprint
+
+    fingerprint = render_fingerprint(css, engine)
+    pending = {}
+    for f in files:
+        st = f.stat()
+        digest = manifest.digest(f, st)
+        if manifest.is_current(digest, fingerprint):
+            manifest.record(f.name, st, digest, fingerprint)
+        else:
+            pending[f.name] = (f, st, digest)
+
+    skipped = len(files) - len(pending)
+    if skipped:
+        print(f"⏭️ {skipped} XML sin cambios")
+    try:
+        for result in _convert_files([f for f, _, _ in pending.values()], out, css, jobs,
+                                     summary, engine, executor):
+            _, st, digest = pending[result.name]
+            if result.ok:
+                manifest.record(result.name, st, digest, fingerprint, result.value)
+            else:
+                manifest.forget(result.name)
+    finally:
+        manifest.save()
+
+
+def _watch_folder(folder, out=None, css=None, jobs=None, interval=2.0, engine="html"):
+    """
+    Vigila la carpeta y convierte los XML a medida que llegan o cambian. En
+    cada vuelta se hace stat de todos los XML (una edición en el mismo
+    archivo no cambia el mtime del directorio), y un archivo se convierte
+    cuando su tamaño y mtime se mantienen entre dos vueltas (ya terminó de
+    copiarse). Los que no cambiaron según el manifiesto ni se hashean.
+
+    El pool de procesos (con la plantilla ya precargada) dura toda la sesión.
+    """
+    manifest = _load_manifest(out)
+    print(f"👀 Vigilando {folder} cada {interval}s (Ctrl+C para salir)")
+
+    jobs = jobs or default_jobs()
+    executor = None
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                       initargs=(css, engine))
+
+    summary = BatchSummary()
+    settling = {}  # nombre → (tamaño, mtime) de la vuelta anterior
+    try:
+        files = sorted(folder.glob("*.xml"))
+        manifest.prune(f.name for f in files)
+        _convert_incremental(files, manifest, out, css, jobs, summary, engine, executor)
+        summary.finish()
+        summary.report()
+
+        while True:
+            time.sleep(interval)
+            ready, seen, present = [], {}, set()
+            with os.scandir(folder) as entries:
+                for e in entries:
+                    if not e.name.endswith(".xml") or not e.is_file():
+                        continue
+                    present.add(e.name)
+                    st = e.stat()
+                    if manifest.unchanged(e.name, st):
+                        continue
+                    key = (st.st_size, st.st_mtime_ns)
+                    if settling.get(e.name) == key:
+                        ready.append(pathlib.Path(e.path))
+                    else:
+                        seen[e.name] = key
+            settling = seen
+            if manifest.prune(present) and not ready:
+                manifest.save()  # si hay ready, se guarda al convertir
+
+            if ready:
+                summary = BatchSummary()
+                _convert_incremental(sorted(ready), manifest, out, css, jobs, summary,
+                                     engine, executor)
+                summary.finish()
+                summary.report()
+    except KeyboardInterrupt:
+        print("👋 Vigilancia detenida")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _convert_folder_combined(folder, out=None, css=None, bookmarks=True):
+    """
+    Renderiza todos los XML de la carpeta en un único PDF. Si no queda
+    ningún documento que renderizar, informa los errores y sale con código 1.
+    """
+    from sii_xml_pdf.errors import MalformedXMLError, error_kind
+    from sii_xml_pdf.parser import iter_dtes
+    from sii_xml_pdf.renderer import render_pdf_batch
+
+    if out is not None and str(out).lower().endswith(".pdf"):
+        out_path = pathlib.Path(out)
+    else:
+        out_path = pathlib.Path(out or "output/pdf") / "combinado.pdf"
+
+    summary = BatchSummary()
+
+    def documents():
+        for xml_file in sorted(folder.glob("*.xml")):
+            try:
+                dtes = list(iter_dtes(xml_file))
+            except Exception as e:
+                summary.add(TaskResult(xml_file.name, error=f"{type(e).__name__}: {e}",
+                                       kind=error_kind(e)))
+                continue
+            if not dtes:
+                # Igual que _convert_xml: un XML sin documentos es un fallo
+                e = MalformedXMLError("el XML no contiene ningún Documento")
+                summary.add(TaskResult(xml_file.name, error=f"{type(e).__name__}: {e}",
+                                       kind=error_kind(e)))
+                continue
+            summary.add(TaskResult(xml_file.name, value=len(dtes)))
+            yield from dtes
+
+    errors = []
+    try:
+        pdf_bytes = render_pdf_batch(documents(), combined=True, css_path=css,
+                                     bookmarks=bookmarks, errors=errors)
+    except ValueError:  # ningún documento se pudo renderizar
+        pdf_bytes = None
+    for dte, e in errors:
+        summary.failures.append(TaskResult(
+            f"{dte.tipo_dte_abreviatura} {dte.numero_factura}", error=f"{type(e).__name__}: {e}",
+            kind=error_kind(e)))
+
+    if pdf_bytes is None:
+        summary.finish()
+        summary.report()
+        _write_errors(summary, out_path.parent)
+        raise SystemExit(f"❌ No hay documentos para el PDF combinado en {folder}")
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, "wb") as f:
         f.write(pdf_bytes)
+    print(f"✅ PDF combinado generado: {out_path}")
+    summary.finish()
+    summary.report()
+    _write_errors(summary, out_path.parent)
 
-    print(f"✅ PDF generado: {out_path}")
 
+def _render_member(data: bytes, css=None, engine="html") -> list:
+    """[(nombre, PDF)] de cada documento de un XML leído desde un archivo comprimido."""
+    from sii_xml_pdf.errors import MalformedXMLError
+    from sii_xml_pdf.parser import iter_dtes
+    from sii_xml_pdf.renderer import render_pdf
 
-def convert_folder(folder, out=None, css=None):
-    folder = pathlib.Path(folder).resolve()
-    if not folder.exists():
-        raise SystemExit(f"❌ No existe la carpeta: {folder}")
+    pdfs = [(pdf_name(dte, sanitize=True), render_pdf(dte, css_path=css, engine=engine))
+            for dte in iter_dtes(data)]
+    if not pdfs:
+        raise MalformedXMLError("el XML no contiene ningún Documento")
+    return pdfs
 
-    for xml_file in folder.glob("*.xml"):
+
+def convert_archive(src, out=None, css=None, jobs=None, engine="html", fmt=None):
+    """
+    Convierte los XML de un ZIP/tar/tar.gz (o stdin, "-") y escribe los PDF
+    directo en un ZIP/tar de salida (o stdout, "-"), sin archivos sueltos.
+    Los mensajes van a stderr, así stdout queda libre para el archivo. Los
+    XML que fallan quedan en un errors.csv dentro del archivo de salida.
+    """
+    from sii_xml_pdf.archive import iter_xml_members, open_input, open_sink
+    from sii_xml_pdf.errors import ERRORS_CSV, errors_csv
+
+    if src != "-" and not pathlib.Path(src).exists():
+        raise SystemExit(f"❌ No existe el archivo: {src}")
+    if out is None:
+        out = "-" if src == "-" else f"output/{pathlib.Path(src).name.split('.')[0]}-pdf.zip"
+
+    summary = BatchSummary()
+    seen = set()
+    task = functools.partial(_render_member, css=css, engine=engine)
+    with open_input(src) as fileobj:
         try:
-            convert_file(xml_file, out=out, css=css)
-        except Exception as e:
-            print(
-                f"⚠️ Error convirtiendo {xml_file.name}: {e}", file=sys.stderr)
+            members = iter_xml_members(fileobj)
+            sink = open_sink(out, fmt)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        try:
+            for result in run_tasks(task, members, jobs=jobs,
+                                    initializer=_init_worker, initargs=(css, engine)):
+                summary.add(result)
+                if not result.ok:
+                    print(f"⚠️ Error convirtiendo {result.name}: {result.error}", file=sys.stderr)
+                    continue
+                for name, pdf in result.value:
+                    sink.write(unique_name(name, seen), pdf)
+            if summary.failures:
+                sink.write(ERRORS_CSV, errors_csv(summary.error_rows()))
+        finally:
+            sink.close()
+    summary.finish()
+    summary.report()
+    if out != "-":
+        print(f"✅ {len(seen)} PDF en {out}", file=sys.stderr)
+
+
+def _export_rows(xml_file) -> list:
+    from sii_xml_pdf.export import file_rows
 
+    return list(file_rows(xml_file))
+
+
+def extract_excel(folder, out=None, jobs=None, fmt="xlsx"):
+    """
+    Exporta los XML a tablas normalizadas (documentos, items, referencias e
+    impuestos) en XLSX, CSV o Parquet, escribiendo a medida que se parsean.
+    Las filas de un XML se escriben recién cuando se leyó entero: uno que
+    falla no deja filas a medias y queda en errors.csv con su tipo de error.
+    """
+    from sii_xml_pdf.errors import ERRORS_CSV
+    from sii_xml_pdf.export import open_exporter
 
-def extract_excel(folder, out="output/listado_xml.xlsx"):
-    """Genera un Excel con info de los XML, incluyendo los ítems como JSON."""
     folder = pathlib.Path(folder).resolve()
-    rows = []
-    for xml_file in folder.glob("*.xml"):
-        try:
-            dte = parse_xml(str(xml_file))
-
-            # Convertir los objetos Item a dict
-            items_dicts = []
-            for it in dte.items:
-                if hasattr(it, "dict"):   # Pydantic
-                    items_dicts.append(it.dict())
-                elif hasattr(it, "__dict__"):  # dataclass/simple object
-                    items_dicts.append(it.__dict__)
-                else:  # fallback
-                    items_dicts.append(str(it))
-
-            rows.append({
-                "archivo": xml_file.name,
-                "rut": dte.rut_proveedor,
-                "fecha": dte.fecha_emision,
-                "folio": dte.numero_factura,
-                "montoNeto": dte.monto_neto,
-                "tipoDoc": dte.tipo_dte,
-                "razon_social": dte.razon_social,
-                "items_json": json.dumps(items_dicts, ensure_ascii=False)
-            })
-        except Exception as e:
-            print(f"⚠️ Error procesando {xml_file.name}: {e}", file=sys.stderr)
-
-    if not rows:
-        print("⚠️ No se generó ningún dato")
-        return
+    files = sorted(folder.glob("*.xml"))
+    if out is None:
+        out = "output/listado_xml.xlsx" if fmt == "xlsx" else "output/listado_xml"
 
-    df = pd.DataFrame(rows)
-    out_path = pathlib.Path(out)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_excel(out_path, index=False)
-    print(f"✅ Excel generado: {out_path}")
+    summary = BatchSummary()
+    exporter = open_exporter(fmt, out)
+    try:
+        # Sin -j va en serie; igual que en paralelo, cada XML entrega todas sus filas o ninguna
+        for result in run_tasks(_export_rows, ((f.name, f) for f in files), jobs=jobs or 1):
+            summary.add(result)
+            if result.ok:
+                for table, row in result.value:
+                    exporter.write(table, row)
+            else:
+                print(f"⚠️ Error procesando {result.name}: {result.error}", file=sys.stderr)
+    finally:
+        exporter.close()
+    summary.finish()
+    summary.report()
+
+    # Con .xlsx el informe va al lado (listado_xml_errors.csv), sin pisar el de convert-folder
+    out = pathlib.Path(out)
+    if fmt == "xlsx":
+        _write_errors(summary, out.parent, f"{out.stem}_{ERRORS_CSV}")
+    else:
+        _write_errors(summary, out)
+
+    for path in exporter.paths:
+        print(f"✅ Generado: {path}")
 
 
 def main():
-    ap = argparse.ArgumentParser(prog="sii_xml_pdf")
+    ap = argparse.ArgumentParser(
+        prog="sii_xml_pdf",
+        epilog="Un documento sin TipoDTE, Folio, FchEmis, RUTEmisor o MntTotal no se "
+               "convierte: queda en errors.csv como campos_faltantes.")
     subparsers = ap.add_subparsers(dest="command")
 
     # convert
@@ -102,6 +409,9 @@ def main():
         "-o", "--out", help="Ruta de salida (archivo .pdf o directorio)")
     ap_convert.add_argument(
         "--css", help="Ruta a invoice.css (opcional)", default=None)
+    ap_convert.add_argument(
+        "--engine", choices=["html", "fast"], default="html",
+        help="Motor de render: html (plantilla + WeasyPrint) o fast (dibujo directo, mucho más rápido)")
 
     # convert-folder
     ap_folder = subparsers.add_parser(
@@ -110,22 +420,75 @@ def main():
     ap_folder.add_argument("-o", "--out", help="Directorio de salida")
     ap_folder.add_argument(
         "--css", help="Ruta a invoice.css (opcional)", default=None)
+    ap_folder.add_argument(
+        "-j", "--jobs", type=int, default=default_jobs(),
+        help="Procesos en paralelo (por defecto: nº de CPUs)")
+    ap_folder.add_argument(
+        "--combine", action="store_true",
+        help="Genera un único PDF con todos los documentos (-o puede ser un .pdf)")
+    ap_folder.add_argument(
+        "--no-bookmarks", dest="bookmarks", action="store_false",
+        help="Con --combine, no agrega un marcador por documento")
+    ap_folder.add_argument(
+        "--incremental", action="store_true",
+        help="Convierte solo los XML nuevos o modificados (manifiesto en el directorio de salida)")
+    ap_folder.add_argument(
+        "--watch", action="store_true",
+        help="Sigue vigilando la carpeta y convierte los XML que lleguen (implica --incremental)")
+    ap_folder.add_argument(
+        "--interval", type=float, default=2.0,
+        help="Con --watch, segundos entre revisiones (por defecto 2)")
+    ap_folder.add_argument(
+        "--engine", choices=["html", "fast"], default="html",
+        help="Motor de render: html (plantilla + WeasyPrint) o fast (dibujo directo, mucho más rápido)")
+
+    # convert-archive
+    ap_archive = subparsers.add_parser(
+        "convert-archive", help="Convierte los XML de un ZIP/tar a un ZIP/tar de PDFs")
+    ap_archive.add_argument("archive", help="ZIP, tar o tar.gz con XMLs (- = stdin)")
+    ap_archive.add_argument(
+        "-o", "--out", default=None,
+        help="ZIP/tar de salida (- = stdout; por defecto output/<nombre>-pdf.zip)")
+    ap_archive.add_argument(
+        "--format", dest="fmt", choices=["zip", "tar", "tar.gz"], default=None,
+        help="Formato de salida (por defecto según la extensión de -o, o zip)")
+    ap_archive.add_argument(
+        "--css", help="Ruta a invoice.css (opcional)", default=None)
+    ap_archive.add_argument(
+        "-j", "--jobs", type=int, default=default_jobs(),
+        help="Procesos en paralelo (por defecto: nº de CPUs)")
+    ap_archive.add_argument(
+        "--engine", choices=["html", "fast"], default="html",
+        help="Motor de render: html (plantilla + WeasyPrint) o fast (dibujo directo, mucho más rápido)")
 
     # extract-excel
     ap_excel = subparsers.add_parser(
-        "extract-excel", help="Extrae info de XMLs y genera Excel")
+        "extract-excel", help="Extrae info de XMLs a tablas (Excel, CSV o Parquet)")
     ap_excel.add_argument("folder", help="Carpeta con XMLs")
     ap_excel.add_argument(
-        "-o", "--out", help="Ruta de salida Excel", default="output/listado_xml.xlsx")
+        "-o", "--out", default=None,
+        help="Archivo .xlsx, o directorio para csv/parquet (por defecto en output/)")
+    ap_excel.add_argument(
+        "--format", dest="fmt", choices=["xlsx", "csv", "parquet"], default="xlsx",
+        help="Formato de salida (por defecto xlsx)")
+    ap_excel.add_argument(
+        "-j", "--jobs", type=int, default=default_jobs(),
+        help="Procesos en paralelo (por defecto: nº de CPUs)")
 
     args = ap.parse_args()
 
     if args.command == "convert":
-        convert_file(args.xml, out=args.out, css=args.css)
+        convert_file(args.xml, out=args.out, css=args.css, engine=args.engine)
     elif args.command == "convert-folder":
-        convert_folder(args.folder, out=args.out, css=args.css)
+        convert_folder(args.folder, out=args.out, css=args.css, jobs=args.jobs,
+                       combine=args.combine, bookmarks=args.bookmarks,
+                       incremental=args.incremental, watch=args.watch, interval=args.interval,
+                       engine=args.engine)
+    elif args.command == "convert-archive":
+        convert_archive(args.archive, out=args.out, css=args.css, jobs=args.jobs,
+                        engine=args.engine, fmt=args.fmt)
     elif args.command == "extract-excel":
-        extract_excel(args.folder, out=args.out)
+        extract_excel(args.folder, out=args.out, jobs=args.jobs, fmt=args.fmt)
     else:
         ap.print_help()
 
@@ -0,0 +1,57 @@
+"""
+Errores por documento y su registro en errors.csv.
+
+Cada XML se parsea una sola vez: si falla, el error dice por qué (XML mal
+formado, campos obligatorios faltantes o fallo del render) y el lote sigue
+con el resto en vez de reintentar o abortar.
+"""
+import csv
+import io
+import xml.etree.ElementTree as ET
+
+ERRORS_CSV = "errors.csv"
+QUARANTINE_DIR = "quarantine"  # XML originales que fallaron, dentro del ZIP de salida
+ERROR_COLUMNS = ("archivo", "documento", "tipo", "detalle")
+
+
+class DTEError(ValueError):
+    """Error de un documento; ``kind`` va en la columna "tipo" de errors.csv."""
+    kind = "error"
+
+
+class MalformedXMLError(DTEError):
+    """XML que no se puede leer o que no trae ningún Documento."""
+    kind = "xml_mal_formado"
+
+
+class MissingFieldsError(DTEError):
+    """Documento sin alguno de los campos obligatorios (ver parser.REQUIRED_FIELDS)."""
+    kind = "campos_faltantes"
+
+
+class RenderError(DTEError):
+    """El documento se parseó bien pero falló al generar el PDF."""
+    kind = "error_render"
+
+
+def error_kind(exc: BaseException) -> str:
+    if isinstance(exc, DTEError):
+        return exc.kind
+    if isinstance(exc, ET.ParseError):
+        return MalformedXMLError.kind
+    return DTEError.kind
+
+
+def error_row(archivo: str, exc: BaseException, documento: str = "") -> dict:
+    """Fila de errors.csv para ``exc``."""
+    detail = str(exc) if isinstance(exc, DTEError) else f"{type(exc).__name__}: {exc}"
+    return {"archivo": archivo, "documento": documento, "tipo": error_kind(exc), "detalle": detail}
+
+
+def errors_csv(rows) -> bytes:
+    """errors.csv en UTF-8 con BOM, para que Excel respete los acentos."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=ERROR_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf-8-sig")
@@ -0,0 +1,208 @@
+"""
+Exportación de los DTE a tablas normalizadas (CSV, Parquet o XLSX).
+
+Se escriben cuatro tablas, una fila a la vez a medida que se parsea cada
+documento, así la memoria no crece con la cantidad de XML:
+
+- documentos:  una fila por DTE
+- items:       una fila por línea de Detalle
+- referencias: una fila por Referencia
+- impuestos:   una fila por ImptoReten
+
+Las tablas hijas llevan (rut, tipo_dte, folio), que identifica al documento.
+"""
+import csv
+import pathlib
+from typing import Dict, Iterator, List, Tuple
+
+# Columnas de cada tabla con su tipo (para el esquema de Parquet)
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "documentos": [
+        ("archivo", "str"), ("rut", "str"), ("razon_social", "str"),
+        ("tipo_dte", "int"), ("tipo_dte_palabras", "str"), ("folio", "str"),
+        ("fecha", "str"), ("fecha_vencimiento", "str"), ("forma_pago", "int"),
+        ("receptor_rut", "str"), ("receptor_razon_social", "str"),
+        ("monto_neto", "int"), ("monto_exento", "int"), ("monto_iva", "int"),
+        ("monto_total", "int"),
+    ],
+    "items": [
+        ("rut", "str"), ("tipo_dte", "int"), ("folio", "str"), ("linea", "int"),
+        ("codigo", "str"), ("descripcion", "str"), ("cantidad", "float"),
+        ("precio", "float"), ("total", "int"),
+    ],
+    "referencias": [
+        ("rut", "str"), ("tipo_dte", "int"), ("folio", "str"), ("linea", "int"),
+        ("tipo_doc_referencia", "str"), ("tipo_doc_referencia_palabras", "str"),
+        ("folio_referencia", "str"), ("fecha_referencia", "str"),
+    ],
+    "impuestos": [
+        ("rut", "str"), ("tipo_dte", "int"), ("folio", "str"), ("linea", "int"),
+        ("tipo", "str"), ("tipo_palabras", "str"), ("monto", "int"),
+    ],
+}
+
+FORMATS = ("xlsx", "csv", "parquet")
+
+
+def document_rows(dte, archivo: str) -> Iterator[Tuple[str, tuple]]:
+    """Filas (tabla, valores) de un DTEData, en el orden de TABLES."""
+    key = (dte.rut_proveedor, dte.tipo_dte, dte.numero_factura)
+    yield "documentos", (
+        archivo, dte.rut_proveedor, dte.razon_social,
+        dte.tipo_dte, dte.tipo_dte_palabras, dte.numero_factura,
+        dte.fecha_emision, dte.fecha_vencimiento, dte.forma_pago,
+        dte.receptor_rut, dte.receptor_razon_social,
+        dte.monto_neto, dte.monto_exento, dte.monto_iva, dte.monto_total,
+    )
+    for n, it in enumerate(dte.items, start=1):
+        yield "items", key + (n, it.codigo, it.descripcion, it.qty, it.rate, it.total)
+    for n, ref in enumerate(dte.referencias, start=1):
+        yield "referencias", key + (n, ref.tipo_doc_referencia, ref.tipo_doc_referencia_palabras,
+                                    ref.folio_referencia, ref.fecha_referencia)
+    for n, imp in enumerate(dte.impuestos, start=1):
+        yield "impuestos", key + (n, imp.tipo, imp.tipo_palabras, imp.monto)
+
+
+def file_rows(xml_file) -> Iterator[Tuple[str, tuple]]:
+    """Filas de todos los documentos de un XML (uno o un sobre EnvioDTE)."""
+    from .parser import iter_dtes
+
+    name = pathlib.Path(xml_file).name
+    for dte in iter_dtes(xml_file):
+        yield from document_rows(dte, name)
+
+
+class CsvExporter:
+    """Un CSV por tabla dentro de ``directory``."""
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files = {}
+        self._writers = {}
+        for table, columns in TABLES.items():
+            f = open(self.directory / f"{table}.csv", "w", newline="", encoding="utf-8")
+            self._files[table] = f
+            self._writers[table] = csv.writer(f)
+            self._writers[table].writerow([c for c, _ in columns])
+
+    def write(self, table: str, row: tuple):
+        self._writers[table].writerow(row)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+    @property
+    def paths(self) -> List[pathlib.Path]:
+        return [self.directory / f"{t}.csv" for t in TABLES]
+
+
+class ParquetExporter:
+    """
+    Un .parquet por tabla dentro de ``directory`` (requiere pyarrow). Las
+    filas se juntan en grupos de ``batch_rows`` antes de escribirse.
+    """
+
+    _TYPES = {"str": "string", "int": "int64", "float": "float64"}
+
+    def __init__(self, directory, batch_rows: int = 10_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ El formato parquet requiere pyarrow: pip install pyarrow")
+
+        self._pa = pa
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.batch_rows = batch_rows
+        self._schemas = {
+            table: pa.schema([(c, getattr(pa, self._TYPES[t])()) for c, t in columns])
+            for table, columns in TABLES.items()
+        }
+        self._writers = {
+            table: pq.ParquetWriter(str(self.directory / f"{table}.parquet"), schema)
+            for table, schema in self._schemas.items()
+        }
+        self._pending = {table: [] for table in TABLES}
+
+    def write(self, table: str, row: tuple):
+        rows = self._pending[table]
+        rows.append(row)
+        if len(rows) >= self.batch_rows:
+            self._flush(table)
+
+    def _flush(self, table: str):
+        rows = self._pending[table]
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        self._writers[table].write_table(
+            self._pa.Table.from_arrays(
+                [self._pa.array(col, type=field.type)
+                 for col, field in zip(columns, self._schemas[table])],
+                schema=self._schemas[table]))
+        rows.clear()
+
+    def close(self):
+        for table, writer in self._writers.items():
+            self._flush(table)
+            writer.close()
+
+    @property
+    def paths(self) -> List[pathlib.Path]:
+        return [self.directory / f"{t}.parquet" for t in TABLES]
+
+
+# Filas de datos por hoja: Excel admite 1.048.576 filas, contando la cabecera
+XLSX_MAX_ROWS = 1_048_575
+
+
+class XlsxExporter:
+    """
+    Un libro con una hoja por tabla, en modo write-only de openpyxl. Una
+    tabla que pasa de XLSX_MAX_ROWS filas sigue en "items (2)", "items (3)"…
+    """
+
+    def __init__(self, path, max_rows: int = XLSX_MAX_ROWS):
+        from openpyxl import Workbook
+
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self._wb = Workbook(write_only=True)
+        self._sheets = {}  # tabla → [hoja actual, filas escritas, nº de hojas]
+        for table in TABLES:
+            self._sheets[table] = [self._new_sheet(table, table), 0, 1]
+
+    def _new_sheet(self, table: str, title: str):
+        ws = self._wb.create_sheet(title)
+        ws.append([c for c, _ in TABLES[table]])
+        return ws
+
+    def write(self, table: str, row: tuple):
+        sheet = self._sheets[table]
+        if sheet[1] >= self.max_rows:
+            sheet[2] += 1
+            sheet[0], sheet[1] = self._new_sheet(table, f"{table} ({sheet[2]})"), 0
+        sheet[0].append(row)
+        sheet[1] += 1
+
+    def close(self):
+        self._wb.save(self.path)
+
+    @property
+    def paths(self) -> List[pathlib.Path]:
+        return [self.path]
+
+
+def open_exporter(fmt: str, out):
+    """Exportador para ``fmt``: ``out`` es el .xlsx o el directorio de salida."""
+    if fmt == "xlsx":
+        return XlsxExporter(out)
+    if fmt == "csv":
+        return CsvExporter(out)
+    if fmt == "parquet":
+        return ParquetExporter(out)
+    raise ValueError(f"Formato de exportación desconocido: {fmt}")
@@ -0,0 +1,467 @@
+"""
+Motor de render "fast": dibuja el DTE directo en operadores PDF con pydyf,
+sin pasar por Jinja, HTML ni el layout CSS de WeasyPrint.
+
+Reproduce la misma disposición que invoice.html (emisor, recuadro rojo con
+RUT y folio, receptor, referencias, ítems, totales y timbre) con Helvetica
+y Helvetica-Bold, dos de las 14 fuentes estándar del PDF: no se embeben y
+los anchos de cada carácter vienen de sus AFM (tablas más abajo), así que
+medir y cortar texto es sumar enteros. No busca igualdad de píxeles con la
+plantilla HTML: está pensado para archivar grandes volúmenes.
+
+    pdf = render_pdf(dte, engine="fast")
+"""
+import io
+from typing import List, Optional, Tuple
+
+import pydyf
+
+from .barcode import pdf417_runs
+from .formatting import fecha_es_larga, format_clp
+from .models import DTEData
+
+# ===== Métricas (AFM de Adobe, unidades de 1/1000 del cuerpo) =====
+# Anchos de los caracteres 32..126 y de los de Latin-1 que aparecen en
+# documentos chilenos (WinAnsiEncoding coincide con Latin-1 en esos).
+_HELVETICA_ASCII = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_HELVETICA_BOLD_ASCII = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+_HELVETICA_LATIN1 = {
+    "\xa0": 278, "¡": 333, "°": 400, "ª": 370, "º": 365, "«": 556, "»": 556,
+    "·": 278, "¿": 611, "€": 556, "–": 556, "—": 1000, "‘": 222, "’": 222,
+    "“": 333, "”": 333, "•": 350, "…": 1000,
+    "Á": 667, "À": 667, "Ä": 667, "Â": 667, "Ç": 722, "É": 667, "È": 667,
+    "Ë": 667, "Ê": 667, "Í": 278, "Ì": 278, "Ï": 278, "Î": 278, "Ñ": 722,
+    "Ó": 778, "Ò": 778, "Ö": 778, "Ô": 778, "Ú": 722, "Ù": 722, "Ü": 722,
+    "Û": 722, "á": 556, "à": 556, "ä": 556, "â": 556, "ç": 500, "é": 556,
+    "è": 556, "ë": 556, "ê": 556, "í": 278, "ì": 278, "ï": 278, "î": 278,
+    "ñ": 556, "ó": 556, "ò": 556, "ö": 556, "ô": 556, "ú": 556, "ù": 556,
+    "ü": 556, "û": 556,
+}
+_HELVETICA_BOLD_LATIN1 = {
+    "\xa0": 278, "¡": 333, "°": 400, "ª": 370, "º": 365, "«": 556, "»": 556,
+    "·": 278, "¿": 611, "€": 556, "–": 556, "—": 1000, "‘": 278, "’": 278,
+    "“": 500, "”": 500, "•": 350, "…": 1000,
+    "Á": 722, "À": 722, "Ä": 722, "Â": 722, "Ç": 722, "É": 667, "È": 667,
+    "Ë": 667, "Ê": 667, "Í": 278, "Ì": 278, "Ï": 278, "Î": 278, "Ñ": 722,
+    "Ó": 778, "Ò": 778, "Ö": 778, "Ô": 778, "Ú": 722, "Ù": 722, "Ü": 722,
+    "Û": 722, "á": 556, "à": 556, "ä": 556, "â": 556, "ç": 556, "é": 556,
+    "è": 556, "ë": 556, "ê": 556, "í": 278, "ì": 278, "ï": 278, "î": 278,
+    "ñ": 611, "ó": 611, "ò": 611, "ö": 611, "ô": 611, "ú": 611, "ù": 611,
+    "ü": 611, "û": 611,
+}
+
+
+def _widths(ascii_widths, latin1) -> dict:
+    widths = {chr(32 + i): w for i, w in enumerate(ascii_widths)}
+    widths.update(latin1)
+    return widths
+
+
+_WIDTHS = {
+    False: _widths(_HELVETICA_ASCII, _HELVETICA_LATIN1),
+    True: _widths(_HELVETICA_BOLD_ASCII, _HELVETICA_BOLD_LATIN1),
+}
+_FONTS = {False: b"/F1", True: b"/F2"}
+
+
+def text_width(text: str, size: float, bold: bool = False) -> float:
+    """Ancho en puntos de ``text``; lo que no está en la tabla se mide como '?'."""
+    widths = _WIDTHS[bold]
+    fallback = widths["?"]
+    return sum(widths.get(c, fallback) for c in text) * size / 1000
+
+
+def _encode(text: str) -> bytes:
+    # WinAnsi (cp1252); lo que no existe ahí sale como '?'
+    data = text.encode("cp1252", "replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _clip(text: str, width: float, size: float, bold: bool = False) -> str:
+    """Recorta ``text`` con "..." para que quepa en ``width``."""
+    if text_width(text, size, bold) <= width:
+        return text
+    widths = _WIDTHS[bold]
+    fallback = widths["?"]
+    limit = width * 1000 / size - 3 * widths["."]
+    used = 0
+    for i, c in enumerate(text):
+        used += widths.get(c, fallback)
+        if used > limit:
+            return text[:i] + "..."
+    return text
+
+
+def _wrap(text: str, width: float, size: float, bold: bool = False) -> List[str]:
+    """Corta ``text`` en líneas de ``width``; las palabras más largas se parten."""
+    widths = _WIDTHS[bold]
+    fallback = widths["?"]
+    limit = width * 1000 / size
+    space = widths[" "]
+
+    lines, line, used = [], [], 0
+    for word in text.split():
+        w = sum(widths.get(c, fallback) for c in word)
+        if line and used + space + w <= limit:
+            line.append(word)
+            used += space + w
+            continue
+        if line:
+            lines.append(" ".join(line))
+        while w > limit:
+            # Palabra sin espacios más ancha que la columna (códigos, URLs)
+            cut, part = 0, 0
+            for i, c in enumerate(word):
+                cw = widths.get(c, fallback)
+                if part + cw > limit and i:
+                    break
+                part += cw
+                cut = i + 1
+            lines.append(word[:cut])
+            word = word[cut:]
+            w -= part
+        line, used = [word], w
+    if line:
+        lines.append(" ".join(line))
+    return lines or [""]
+
+
+# ===== Página (mismas medidas que invoice.css) =====
+MM = 72 / 25.4
+PAGE_W, PAGE_H = 612.0, 792.0  # Letter
+MARGIN = 15 * MM
+CONTENT_W = PAGE_W - 2 * MARGIN
+BOTTOM = MARGIN
+
+RED = (0.827, 0.184, 0.184)  # #d32f2f
+GREY = (0.663, 0.6, 0.663)   # #a9a
+
+ITEM_SIZE = 9.25
+ITEM_LINE = ITEM_SIZE * 1.1
+ITEM_PAD = 1.5
+# Nro., Código, Descripción, Dscto., Cantidad, Precio Unit., Valor Item
+ITEM_COLUMNS = (0.06, 0.12, 0.38, 0.11, 0.11, 0.11, 0.11)
+ITEM_HEADERS = ("Nro.", "Código", "Descripción", "Dscto.", "Cantidad", "Precio Unit.", "Valor Item")
+ITEM_ALIGN = ("right", "right", "left", "right", "right", "right", "right")
+
+FOOTER_H = 150.0  # barra SON, timbre, totales y monto total
+
+
+class _Canvas:
+    """Operadores de una página; se escriben como bytes, sin objetos intermedios."""
+
+    def __init__(self):
+        self.ops: List[bytes] = []
+
+    def text(self, x: float, y: float, text: str, size: float, bold: bool = False,
+             align: str = "left"):
+        if not text:
+            return
+        if align == "right":
+            x -= text_width(text, size, bold)
+        elif align == "center":
+            x -= text_width(text, size, bold) / 2
+        self.ops.append(b"BT %s %.2f Tf 1 0 0 1 %.2f %.2f Tm (%s) Tj ET"
+                        % (_FONTS[bold], size, x, y, _encode(text)))
+
+    def color(self, rgb: Tuple[float, float, float], stroke: bool = False):
+        self.ops.append(b"%.3f %.3f %.3f %s" % (*rgb, b"RG" if stroke else b"rg"))
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, width: float = 0.75):
+        self.ops.append(b"%.2f w %.2f %.2f m %.2f %.2f l S" % (width, x1, y1, x2, y2))
+
+    def box(self, x: float, y: float, w: float, h: float, width: float = 0.75):
+        self.ops.append(b"%.2f w %.2f %.2f %.2f %.2f re S" % (width, x, y, w, h))
+
+
+def _baseline(top: float, line_h: float, size: float) -> float:
+    # Centra la altura de la x de Helvetica en la línea
+    return top - line_h / 2 - 0.35 * size
+
+
+class _Layout:
+    def __init__(self, dte: DTEData):
+        self.dte = dte
+        self.pages: List[_Canvas] = []
+        self.c: Optional[_Canvas] = None
+        self.y = 0.0
+        self.x_cols = []
+        x = MARGIN
+        for frac in ITEM_COLUMNS:
+            self.x_cols.append((x, CONTENT_W * frac))
+            x += CONTENT_W * frac
+
+    def new_page(self):
+        self.c = _Canvas()
+        self.pages.append(self.c)
+        self.y = PAGE_H - MARGIN
+
+    # ----- Cabecera y receptor -----
+    def header(self):
+        d, c = self.dte, self.c
+        top = self.y
+
+        box_w = 70 * MM
+        box_x = PAGE_W - MARGIN - box_w
+        size, lh = 11, 11 * 1.6
+        lines = []
+        for text in (f"R.U.T.: {d.rut_proveedor}", d.tipo_dte_palabras,
+                     f"Nº: {d.numero_factura}", fecha_es_larga(d.fecha_emision)):
+            lines.extend(_wrap(text, box_w - 2 * size, size))
+        box_h = len(lines) * lh + 2 * size
+        c.color(RED, stroke=True)
+        c.box(box_x, top - box_h, box_w, box_h, width=1.5)
+        c.color((0, 0, 0), stroke=True)
+        y = top - size
+        for text in lines:
+            c.text(box_x + box_w / 2, _baseline(y, lh, size), text, size, align="center")
+            y -= lh
+
+        left_w = box_x - MARGIN - 4 * MM
+        y = top
+        emisor = [(d.razon_social, True)]
+        emisor += [(t, False) for t in (d.giro_proveedor, d.direccion_proveedor) if t]
+        comuna = " - ".join(t for t in (d.comuna_proveedor, d.ciudad_proveedor) if t)
+        if comuna:
+            emisor.append((comuna, False))
+        for text, bold in emisor:
+            for line in _wrap(text, left_w, size, bold):
+                c.text(MARGIN, _baseline(y, lh, size), line, size, bold)
+                y -= lh
+
+        self.y = min(y, top - box_h) - 8 * MM
+
+    def receiver(self):
+        d, c = self.dte, self.c
+        size, lh, pad = 10, 10 * 1.2 + 3, 3
+        rows = (
+            ("Señor:", d.receptor_razon_social, "Ciudad:", d.receptor_ciudad),
+            ("Giro:", d.receptor_giro, "Comuna:", d.receptor_comuna),
+            ("R.U.T.:", d.receptor_rut, "Forma pago:", d.forma_pago_palabras),
+            ("Dirección:", d.receptor_direccion, "Fecha venc:", d.fecha_vencimiento),
+        )
+        h = len(rows) * lh + 2 * pad
+        c.box(MARGIN, self.y - h, CONTENT_W, h)
+
+        inner = CONTENT_W - 16
+        cols = (0.12, 0.38, 0.18, 0.32)
+        y = self.y - pad
+        for row in rows:
+            x = MARGIN + 8
+            for i, (value, frac) in enumerate(zip(row, cols)):
+                w = inner * frac
+                bold = i % 2 == 0
+                c.text(x + 3, _baseline(y, lh, size), _clip(value or "", w - 6, size, bold), size, bold)
+                x += w
+            y -= lh
+        self.y -= h + 4 * MM
+
+    def references(self):
+        refs = self.dte.referencias
+        if not refs:
+            return
+        c = self.c
+        size, lh = ITEM_SIZE, ITEM_SIZE * 1.1 + 4
+        w = CONTENT_W / 2
+        cols = ((MARGIN, w * 0.26, "left"), (MARGIN + w * 0.26, w * 0.54, "left"),
+                (MARGIN + w * 0.80, w * 0.20, "right"))
+
+        self.y -= 2 * MM
+        c.text(MARGIN, _baseline(self.y, lh, size), "Referencias:", size)
+        self.y -= lh
+        for (x, cw, align), title in zip(cols, ("FECHA", "TIPO", "FOLIO")):
+            c.text(x + cw / 2, _baseline(self.y, lh, size), title, size, True, "center")
+        self.y -= lh
+        c.color(GREY, stroke=True)
+        c.line(MARGIN, self.y, MARGIN + w, self.y, 0.57)
+        c.color((0, 0, 0), stroke=True)
+        for r in refs:
+            values = (r.fecha_referencia, r.tipo_doc_referencia_palabras, r.folio_referencia)
+            for (x, cw, align), value in zip(cols, values):
+                value = _clip(value or "", cw - 4, size)
+                c.text(x + cw - 2 if align == "right" else x + 2,
+                       _baseline(self.y, lh, size), value, size, align=align)
+            self.y -= lh
+
+    # ----- Ítems -----
+    def item_header(self):
+        c, lh = self.c, ITEM_LINE + 2 * ITEM_PAD + 2
+        for (x, w), title in zip(self.x_cols, ITEM_HEADERS):
+            c.text(x + w / 2, _baseline(self.y, lh, ITEM_SIZE), title, ITEM_SIZE, True, "center")
+        self.y -= lh
+        c.color(GREY, stroke=True)
+        c.line(MARGIN, self.y, MARGIN + CONTENT_W, self.y, 0.57)
+        c.color((0, 0, 0), stroke=True)
+
+    def carry_row(self, label: str, amount: int):
+        c, lh = self.c, ITEM_LINE + 2 * ITEM_PAD
+        c.color(GREY, stroke=True)
+        c.line(MARGIN, self.y, MARGIN + CONTENT_W, self.y, 0.57)
+        c.color((0, 0, 0), stroke=True)
+        x, w = self.x_cols[5]
+        base = _baseline(self.y, lh, ITEM_SIZE)
+        c.text(x + w - 2, base, label, ITEM_SIZE, True, "right")
+        x, w = self.x_cols[6]
+        c.text(x + w - 2, base, format_clp(amount), ITEM_SIZE, True, "right")
+        self.y -= lh
+
+    def items(self):
+        carry_h = ITEM_LINE + 2 * ITEM_PAD
+        self.y -= 6 * MM
+        self.item_header()
+
+        acumulado = 0
+        for n, it in enumerate(self.dte.items, start=1):
+            cells = (
+                [str(n)],
+                [_clip(it.codigo, self.x_cols[1][1] - 6, ITEM_SIZE)],
+                _wrap(it.descripcion, self.x_cols[2][1] - 4, ITEM_SIZE),
+                ["0"],
+                [f"{it.qty:.2f}"],
+                [format_clp(round(it.rate))],
+                [format_clp(it.total)],
+            )
+            h = len(cells[2]) * ITEM_LINE + 2 * ITEM_PAD
+            if self.y - h - carry_h < BOTTOM:
+                # Página llena: subtotal, página nueva con encabezado y transporte
+                self.carry_row("Suma y sigue", acumulado)
+                self.new_page()
+                self.item_header()
+                self.carry_row("Transporte", acumulado)
+
+            top = self.y - ITEM_PAD
+            for (x, w), lines, align in zip(self.x_cols, cells, ITEM_ALIGN):
+                y = top
+                for line in lines:
+                    base = _baseline(y, ITEM_LINE, ITEM_SIZE)
+                    if align == "right":
+                        self.c.text(x + w - 2, base, line, ITEM_SIZE, align="right")
+                    else:
+                        self.c.text(x + 2, base, line, ITEM_SIZE)
+                    y -= ITEM_LINE
+            self.y -= h
+            acumulado += it.total
+
+    # ----- Totales y timbre (al pie de la última página) -----
+    def footer(self):
+        from num2words import num2words
+
+        d = self.dte
+        if self.y - 4 * MM < BOTTOM + FOOTER_H:
+            self.new_page()
+        c = self.c
+        top = BOTTOM + FOOTER_H
+
+        # Barra "SON ..."
+        bar_h, size = 0.7 * 28.35, 0.4 * 28.35
+        c.box(MARGIN, top - bar_h, CONTENT_W, bar_h)
+        base = _baseline(top, bar_h, size)
+        c.text(MARGIN + 11, base, "SON", size, True)
+        palabras = num2words(d.monto_total, lang="es").upper()
+        x = MARGIN + 11 + text_width("SON ", size, True)
+        c.text(x, base, _clip(palabras, MARGIN + CONTENT_W - 11 - x, size), size)
+        top -= bar_h + 4 * MM
+
+        # Timbre PDF417: una corrida de módulos negros = un rectángulo
+        (cols, rows), runs = pdf417_runs(d.timbre_xml)
+        area_w, max_h = CONTENT_W / 2 - 4 * MM, 32 * MM
+        module = min(area_w / cols, max_h / (rows * 3))
+        bar_top = top - 0.2 * 28.35
+        ops = [b"%.3f %.3f %.3f %.3f re" % (MARGIN + col * module, bar_top - (row + 1) * module * 3,
+                                            n * module, module * 3)
+               for col, row, n in runs]
+        ops.append(b"f")
+        c.ops.append(b"\n".join(ops))
+        legend = bar_top - rows * module * 3 - 7
+        center = MARGIN + cols * module / 2
+        c.text(center, legend, "Timbre electrónico S.I.I.", 5.67, align="center")
+        c.text(center, legend - 6.5, "Verifique documento en: http://www.sii.cl", 5.67, align="center")
+
+        # Totales: dos columnas de cuatro filas (etiqueta y valor subrayados)
+        monto_imp = sum(i.monto for i in d.impuestos) if d.impuestos else 0
+        columns = (
+            (("Impuestos:", monto_imp), ("Retenciones:", 0), ("Descuento:", 0), ("Recargo:", 0)),
+            (("Neto:", d.monto_neto), ("Exento:", d.monto_exento), ("19% I.V.A.:", d.monto_iva)),
+        )
+        size, lh = 10, 10 * 1.6 + 6
+        col_w = CONTENT_W / 4
+        for i, column in enumerate(columns):
+            x = MARGIN + CONTENT_W / 2 + i * col_w
+            y = top
+            for label, value in column:
+                base = y - lh + 6
+                c.text(x + 4, base, label, size)
+                c.text(x + col_w - 4, base, format_clp(value), size, align="right")
+                c.line(x + 4, base - 3, x + col_w / 2, base - 3, 0.75)
+                c.line(x + col_w / 2, base - 3, x + col_w - 4, base - 3, 0.75)
+                y -= lh
+
+        # Monto total
+        size = 12
+        c.text(PAGE_W - MARGIN, BOTTOM + 4, format_clp(d.monto_total), size, True, "right")
+        c.text(PAGE_W - MARGIN - text_width(format_clp(d.monto_total), size, True) - 10,
+               BOTTOM + 4, "Monto Total:", size, True, "right")
+
+    def page_numbers(self):
+        total = len(self.pages)
+        for n, c in enumerate(self.pages, start=1):
+            c.color(GREY)
+            c.text(PAGE_W - MARGIN, MARGIN / 2 - 3, f"Página {n} de {total}", 9, align="right")
+            c.color((0, 0, 0))
+
+
+def _build(dte: DTEData) -> List[_Canvas]:
+    layout = _Layout(dte)
+    layout.new_page()
+    layout.header()
+    layout.receiver()
+    layout.references()
+    layout.items()
+    layout.footer()
+    layout.page_numbers()
+    return layout.pages
+
+
+def render_pdf_fast(dte: DTEData) -> bytes:
+    """PDF del DTE dibujado directamente (ver docstring del módulo)."""
+    pdf = pydyf.PDF()
+    pdf.info["Title"] = pydyf.String(f"{dte.tipo_dte_palabras} {dte.numero_factura}")
+    pdf.info["Producer"] = pydyf.String("sii_xml_pdf (fast)")
+
+    fonts = pydyf.Dictionary()
+    for ref, base in ((_FONTS[False], "/Helvetica"), (_FONTS[True], "/Helvetica-Bold")):
+        font = pydyf.Dictionary({"Type": "/Font", "Subtype": "/Type1",
+                                 "BaseFont": base, "Encoding": "/WinAnsiEncoding"})
+        pdf.add_object(font)
+        fonts[ref.decode()[1:]] = font.reference
+    resources = pydyf.Dictionary({"Font": fonts})
+    pdf.add_object(resources)
+
+    for canvas in _build(dte):
+        content = pydyf.Stream(canvas.ops, compress=True)
+        pdf.add_object(content)
+        pdf.add_page(pydyf.Dictionary({
+            "Type": "/Page",
+            "Parent": pdf.pages.reference,
+            "MediaBox": pydyf.Array([0, 0, PAGE_W, PAGE_H]),
+            "Contents": content.reference,
+            "Resources": resources.reference,
+        }))
+
+    out = io.BytesIO()
+    pdf.write(out)
+    return out.getvalue()
@@ -0,0 +1,99 @@
+"""
+Manifiesto de conversión incremental.
+
+Guarda, junto a los PDFs, qué XML ya se convirtieron: por archivo su tamaño,
+mtime y SHA-256, y por hash los PDFs generados con la huella de plantilla
+(cache.template_fingerprint) con que se hicieron. Si la plantilla o el CSS
+cambian, la huella deja de coincidir y todo se vuelve a renderizar.
+
+El hash solo se recalcula cuando cambian el tamaño o el mtime del XML. Los
+XML que fallan no se anotan (la próxima pasada los reintenta) y los que ya
+no están en la carpeta se olvidan (ver prune).
+"""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".sii-xml-pdf-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path, files: Optional[dict] = None, outputs: Optional[dict] = None):
+        self.path = pathlib.Path(path)
+        self.files = files or {}      # nombre → {"size", "mtime_ns", "sha256"}
+        self.outputs = outputs or {}  # sha256 → {"fingerprint", "paths"}
+
+    @classmethod
+    def load(cls, path) -> "Manifest":
+        path = pathlib.Path(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return cls(path)
+        except ValueError:
+            logger.warning("Manifiesto ilegible, se vuelve a convertir todo: %s", path)
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get("files"), data.get("outputs"))
+
+    def digest(self, xml_path: pathlib.Path, st: os.stat_result) -> str:
+        """SHA-256 del XML; se reutiliza el guardado si tamaño y mtime no cambiaron."""
+        entry = self.files.get(xml_path.name)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["sha256"]
+        return file_sha256(xml_path)
+
+    def unchanged(self, name: str, st: os.stat_result) -> bool:
+        entry = self.files.get(name)
+        return bool(entry) and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+
+    def is_current(self, digest: str, fingerprint: str) -> bool:
+        """True si ese contenido ya se convirtió con la misma plantilla y los PDF siguen ahí."""
+        out = self.outputs.get(digest)
+        return (out is not None and out["fingerprint"] == fingerprint
+                and all(os.path.exists(p) for p in out["paths"]))
+
+    def record(self, name: str, st: os.stat_result, digest: str,
+               fingerprint: str, paths: Optional[List] = None):
+        self.files[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        if paths is not None:
+            self.outputs[digest] = {"fingerprint": fingerprint,
+                                    "paths": [str(pathlib.Path(p).resolve()) for p in paths]}
+
+    def forget(self, name: str):
+        self.files.pop(name, None)
+
+    def prune(self, names) -> int:
+        """Olvida los XML que no están en ``names`` (borrados de la carpeta); devuelve cuántos."""
+        names = set(names)
+        gone = [name for name in self.files if name not in names]
+        for name in gone:
+            del self.files[name]
+        return len(gone)
+
+    def save(self):
+        # Olvida los PDFs de contenidos que ya no corresponden a ningún XML
+        live = {e["sha256"] for e in self.files.values()}
+        self.outputs = {k: v for k, v in self.outputs.items() if k in live}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({
+            "version": MANIFEST_VERSION, "files": self.files, "outputs": self.outputs,
+        }), encoding="utf-8")
+        os.replace(tmp, self.path)
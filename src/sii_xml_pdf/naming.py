@@ -0,0 +1,40 @@
+"""
+Nombres de los PDF generados: "AAAAMMDD TIPO Razón Social FOLIO.pdf".
+
+Lo usan la CLI (convert, convert-folder, convert-archive) y los jobs del
+servicio, así un mismo DTE se llama igual venga de donde venga.
+"""
+import re
+
+MAX_RAZON_LEN = 40  # 👈 límite de caracteres para razón social
+
+
+def sanitize_name(text: str, max_len: int = MAX_RAZON_LEN) -> str:
+    """Normaliza y acorta la razón social."""
+    clean = text.title().replace(".", "").strip()
+    clean = re.sub(r"[^A-Za-z0-9\s\-]", "", clean)  # quitar caracteres raros
+    if len(clean) > max_len:
+        clean = clean[:max_len].rstrip() + "..."
+    return clean
+
+
+def pdf_name(dte, sanitize: bool = False) -> str:
+    """
+    Nombre del PDF de un DTE. Con ``sanitize`` la razón social pasa por
+    sanitize_name (solo ASCII y acotada: para ZIP, tar y adjuntos).
+    """
+    razon = sanitize_name(dte.razon_social) if sanitize else dte.razon_social.title().replace(".", "")
+    return f"{dte.fecha_emision.replace('-', '')} {dte.tipo_dte_abreviatura} {razon} {dte.numero_factura}.pdf"
+
+
+def unique_name(name: str, seen: set) -> str:
+    """``name`` o, si ya salió, "nombre (2).pdf", "nombre (3).pdf"... (lo anota en ``seen``)."""
+    candidate, n = name, 1
+    stem, dot, ext = name.rpartition(".")
+    if not dot:
+        stem, ext = name, ""
+    while candidate in seen:
+        n += 1
+        candidate = f"{stem} ({n}){dot}{ext}"
+    seen.add(candidate)
+    return candidate
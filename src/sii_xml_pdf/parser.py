@@ -1,6 +1,8 @@
+import io
 import xml.etree.ElementTree as ET
-from typing import List, Union
+from typing import IO, Iterator, List, Optional, Union
 from pathlib import Path
+from .errors import MalformedXMLError, MissingFieldsError
 from .models import DTEData, Item, Referencia, Impuesto
 from .ns import x
 import re
@@ -158,53 +160,243 @@ def _forma_pago_palabras(forma: int) -> str:
     return REL_FORMA_PAGO.get(forma, f"Desconocido ({forma})")
 
 
-def parse_xml(xml: Union[str, bytes, Path]) -> DTEData:
-    if isinstance(xml, (str, Path)):
-        tree = ET.parse(str(xml))
-    else:
-        # bytes → usar fromstring
-        root = ET.fromstring(xml)
-        tree = ET.ElementTree(root)
+# Campos de cabecera que se buscan por tag. Se guarda la primera aparición
+# en orden de documento, igual que haría root.find(".//tag").
+_HEADER_TAGS = {x(tag): tag for tag in (
+    "RUTEmisor", "RznSoc", "GiroEmis", "DirOrigen", "CiudadOrigen", "CmnaOrigen",
+    "RUTRecep", "RznSocRecep", "GiroRecep", "DirRecep", "CiudadRecep", "CmnaRecep",
+    "FmaPago", "FchVenc", "MntNeto", "MntTotal", "Folio", "FchEmis", "TipoDTE",
+    "IVA", "MntExe", "TED",
+)}
+
+# Campos sin los que no se puede armar el PDF (MissingFieldsError)
+REQUIRED_FIELDS = ("TipoDTE", "Folio", "FchEmis", "RUTEmisor", "MntTotal")
+
+# Elementos que contienen un documento completo dentro de un DTE o sobre
+_DOCUMENT_TAGS = {x("Documento"), x("Liquidacion"), x("Exportaciones")}
+
+_DETALLE = x("Detalle")
+_REFERENCIA = x("Referencia")
+_IMPTO_RETEN = x("ImptoReten")
+
+_CDG_ITEM = x("CdgItem")
+_VLR_CODIGO = x("VlrCodigo")
+_QTY_ITEM = x("QtyItem")
+_PRC_ITEM = x("PrcItem")
+_MONTO_ITEM = x("MontoItem")
+_NMB_ITEM = x("NmbItem")
+_DSC_ITEM = x("DscItem")
+_TPO_DOC_REF = x("TpoDocRef")
+_FOLIO_REF = x("FolioRef")
+_FCH_REF = x("FchRef")
+_TIPO_IMP = x("TipoImp")
+_MONTO_IMP = x("MontoImp")
+
+# Hijos directos de un Detalle que se leen, por nombre corto
+_DETALLE_TAGS = {_QTY_ITEM: "qty", _PRC_ITEM: "prc", _MONTO_ITEM: "monto",
+                 _NMB_ITEM: "nmb", _DSC_ITEM: "dsc"}
+
+
+def _scan(root):
+    """
+    Recorre el árbol una sola vez y reparte cada elemento en su campo.
+    Devuelve (campos de cabecera, detalles, referencias, impuestos).
+    """
+    header = {}
+    detalles, referencias, impuestos = [], [], []
+
+    it = root.iter()
+    next(it)  # ".//" no incluye la raíz
+    for el in it:
+        tag = el.tag
+        name = _HEADER_TAGS.get(tag)
+        if name is not None:
+            if name not in header:
+                header[name] = el
+        elif tag == _DETALLE:
+            detalles.append(el)
+        elif tag == _REFERENCIA:
+            referencias.append(el)
+        elif tag == _IMPTO_RETEN:
+            impuestos.append(el)
+
+    return header, detalles, referencias, impuestos
+
+
+def _detalle_fields(det) -> dict:
+    """
+    Recorre los hijos de un Detalle una sola vez (en vez de un find() por
+    campo) y devuelve el primero de cada tag; "cod" es el VlrCodigo del CdgItem.
+    """
+    fields = {}
+    for child in det:
+        tag = child.tag
+        name = _DETALLE_TAGS.get(tag)
+        if name is not None:
+            if name not in fields:
+                fields[name] = child
+        elif tag == _CDG_ITEM and "cod" not in fields:
+            vlr = child.find(_VLR_CODIGO)
+            if vlr is not None:
+                fields["cod"] = vlr
+    return fields
+
+
+def _trusted(model):
+    """
+    Constructor sin validación para valores que ya vienen tipados (por
+    _int_text/_float_text) y con todos los campos presentes. Hace lo mismo
+    que model_construct, pero sin recorrer los campos ni sus defaults en cada
+    llamada, que en pydantic 2 resulta más lento que validar. Usa internos de
+    pydantic: la versión va acotada en pyproject y tests/test_trusted.py lo
+    compara con model_validate para cada modelo.
+    """
+    fields = frozenset(model.model_fields)
+    new = object.__new__
+    setattr_ = object.__setattr__
+
+    def build(**values):
+        obj = new(model)
+        setattr_(obj, "__dict__", values)
+        setattr_(obj, "__pydantic_fields_set__", set(fields))
+        setattr_(obj, "__pydantic_extra__", None)
+        setattr_(obj, "__pydantic_private__", None)
+        return obj
+    return build
+
+
+_TRUSTED = {model: _trusted(model) for model in (DTEData, Item, Referencia, Impuesto)}
+
+
+def _builder(model, validate: bool):
+    """
+    Constructor del modelo: por defecto el camino sin validación; con
+    ``validate`` pydantic valida en modo estricto, sin coerciones.
+    """
+    if validate:
+        return lambda **fields: model.model_validate(fields, strict=True)
+    return _TRUSTED[model]
 
-    root = tree.getroot()
+
+def parse_xml(xml: Union[str, bytes, Path], validate: bool = False) -> DTEData:
+    """
+    Parsea un DTE. Por defecto los modelos se construyen sin revalidar;
+    ``validate=True`` activa la validación estricta de pydantic. Con o sin
+    ``validate``, un DTE sin algún campo de REQUIRED_FIELDS lanza
+    MissingFieldsError.
+    """
+    try:
+        if isinstance(xml, (str, Path)):
+            tree = ET.parse(str(xml))
+        else:
+            # bytes → usar fromstring
+            root = ET.fromstring(xml)
+            tree = ET.ElementTree(root)
+    except ET.ParseError as e:
+        raise MalformedXMLError(f"XML mal formado: {e}") from e
+
+    return _dte_from_element(tree.getroot(), validate)
+
+
+def iter_dtes(source: Union[str, bytes, Path, IO[bytes]],
+              validate: bool = False, errors: Optional[list] = None) -> Iterator[DTEData]:
+    """
+    Lee un XML con iterparse y entrega un DTEData por cada <Documento>.
+
+    Sirve tanto para un DTE suelto como para sobres EnvioDTE/EnvioBOLETA con
+    cientos de documentos: cada subárbol se descarta apenas se procesa, así
+    que la memoria no crece con el tamaño del sobre. ``validate`` como en
+    parse_xml.
+
+    Un documento sin campos obligatorios lanza MissingFieldsError o, si se
+    entrega ``errors`` (lista), se anota ahí y se sigue con el resto del
+    sobre. Un XML mal formado lanza MalformedXMLError.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif isinstance(source, Path):
+        source = str(source)
+
+    stack = []
+    open_docs = 0
+    n = 0
+    try:
+        for event, el in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                stack.append(el)
+                if el.tag in _DOCUMENT_TAGS:
+                    open_docs += 1
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if el.tag in _DOCUMENT_TAGS:
+                open_docs -= 1
+                n += 1
+                try:
+                    dte = _dte_from_element(el, validate)
+                except MissingFieldsError as e:
+                    e = MissingFieldsError(f"Documento {n}: {e}")
+                    if errors is None:
+                        raise e
+                    errors.append(e)
+                else:
+                    yield dte
+            elif open_docs:
+                # Dentro de un documento: se necesita el subárbol completo
+                continue
+
+            # Fuera de un documento (o recién procesado) ya no se necesita
+            if parent is not None:
+                parent.remove(el)
+            else:
+                el.clear()
+    except ET.ParseError as e:
+        raise MalformedXMLError(f"XML mal formado: {e}") from e
+
+
+def _dte_from_element(root, validate: bool = False) -> DTEData:
+    header, detalles, referencias, impuestos = _scan(root)
+    h = header.get
+    missing = [name for name in REQUIRED_FIELDS if not (_text(h(name)) or "").strip()]
+    if missing:
+        raise MissingFieldsError(f"faltan campos obligatorios: {', '.join(missing)}")
+    make_item = _builder(Item, validate)
+    make_ref = _builder(Referencia, validate)
+    make_imp = _builder(Impuesto, validate)
 
     # Emisor
-    rut_proveedor = _format_rut(_text(root.find(f".//{x('RUTEmisor')}")) or "")
-    razon_social = _text(root.find(f".//{x('RznSoc')}")) or ""
-    giro_proveedor = _proper_case(_text(root.find(f".//{x('GiroEmis')}")))
-    direccion_proveedor = _proper_case(
-        _text(root.find(f".//{x('DirOrigen')}")))
-    ciudad_proveedor = _proper_case(
-        _text(root.find(f".//{x('CiudadOrigen')}")))
-    comuna_proveedor = _proper_case(_text(root.find(f".//{x('CmnaOrigen')}")))
+    rut_proveedor = _format_rut(_text(h("RUTEmisor")) or "")
+    razon_social = _text(h("RznSoc")) or ""
+    giro_proveedor = _proper_case(_text(h("GiroEmis")))
+    direccion_proveedor = _proper_case(_text(h("DirOrigen")))
+    ciudad_proveedor = _proper_case(_text(h("CiudadOrigen")))
+    comuna_proveedor = _proper_case(_text(h("CmnaOrigen")))
 
     # Receptor
-    receptor_rut = _format_rut(_text(root.find(f".//{x('RUTRecep')}")) or "")
-    receptor_razon_social = _text(root.find(f".//{x('RznSocRecep')}")) or ""
-    receptor_giro = _proper_case(_text(root.find(f".//{x('GiroRecep')}")))
-    receptor_direccion = _proper_case(_text(root.find(f".//{x('DirRecep')}")))
-    receptor_ciudad = _proper_case(
-        _text(root.find(f".//{x('CiudadRecep')}")) or "")
-    receptor_comuna = _proper_case(
-        _text(root.find(f".//{x('CmnaRecep')}")) or "")
+    receptor_rut = _format_rut(_text(h("RUTRecep")) or "")
+    receptor_razon_social = _text(h("RznSocRecep")) or ""
+    receptor_giro = _proper_case(_text(h("GiroRecep")))
+    receptor_direccion = _proper_case(_text(h("DirRecep")))
+    receptor_ciudad = _proper_case(_text(h("CiudadRecep")) or "")
+    receptor_comuna = _proper_case(_text(h("CmnaRecep")) or "")
 
     # Encabezado
-    forma_pago = _int_text(root.find(f".//{x('FmaPago')}"), default=0)
-    fecha_vencimiento = _text(root.find(f".//{x('FchVenc')}"))
-    monto_neto = _int_text(root.find(f".//{x('MntNeto')}"))
-    monto_total = _int_text(root.find(f".//{x('MntTotal')}"))
-    numero_factura = (
-        _text(root.find(f".//{x('Folio')}")) or "").lstrip("0") or "0"
-    fecha_emision = _text(root.find(f".//{x('FchEmis')}")) or ""
-    tipo_dte = _int_text(root.find(f".//{x('TipoDTE')}"))
-    monto_iva = _int_text(root.find(f".//{x('IVA')}"))
-    monto_exento = _int_text(root.find(f".//{x('MntExe')}"))
+    forma_pago = _int_text(h("FmaPago"), default=0)
+    fecha_vencimiento = _text(h("FchVenc"))
+    monto_neto = _int_text(h("MntNeto"))
+    monto_total = _int_text(h("MntTotal"))
+    numero_factura = (_text(h("Folio")) or "").lstrip("0") or "0"
+    fecha_emision = _text(h("FchEmis")) or ""
+    tipo_dte = _int_text(h("TipoDTE"))
+    monto_iva = _int_text(h("IVA"))
+    monto_exento = _int_text(h("MntExe"))
 
     tipo_pal, abrev = _tipo_dte_palabras_y_abrev(tipo_dte)
     forma_pal = _forma_pago_palabras(forma_pago)
 
     # Extraer todo el nodo TED
-    ted_el = root.find(f".//{x('TED')}")
+    ted_el = h("TED")
     timbre_str = ""
     if ted_el is not None:
         timbre_str = ET.tostring(ted_el, encoding="unicode", method="xml")
@@ -214,31 +406,32 @@ def parse_xml(xml: Union[str, bytes, Path]) -> DTEData:
 
     # Items
     items: List[Item] = []
-    for det in root.findall(f".//{x('Detalle')}"):
-        cod = _text(det.find(f".//{x('VlrCodigo')}")) or "0"
-        qty = _float_text(det.find(x("QtyItem")), default=1.0)
-        rate = _float_text(det.find(x("PrcItem")), default=0.0)
-        total = _int_text(det.find(x("MontoItem")),
+    for det in detalles:
+        f = _detalle_fields(det).get
+        cod = _text(f("cod")) or "0"
+        qty = _float_text(f("qty"), default=1.0)
+        rate = _float_text(f("prc"), default=0.0)
+        total = _int_text(f("monto"),
                           default=int(round(qty * rate)))
 
-        nmb = _text(det.find(x("NmbItem"))) or ""
-        dsc = _text(det.find(x("DscItem"))) or ""
+        nmb = _text(f("nmb")) or ""
+        dsc = _text(f("dsc")) or ""
 
         if nmb and dsc:
             desc = f"{nmb} - {dsc}"
         else:
             desc = nmb or dsc
 
-        items.append(Item(qty=qty, rate=rate, descripcion=desc,
-                     total=total, codigo=cod))
+        items.append(make_item(qty=qty, rate=rate, descripcion=desc,
+                               total=total, codigo=cod))
 
     # Referencias
     refs: List[Referencia] = []
-    for r in root.findall(f".//{x('Referencia')}"):
-        tpo = _text(r.find(x("TpoDocRef"))) or ""
-        folio = _text(r.find(x("FolioRef"))) or ""
-        fch = _text(r.find(x("FchRef"))) or ""
-        refs.append(Referencia(
+    for r in referencias:
+        tpo = _text(r.find(_TPO_DOC_REF)) or ""
+        folio = _text(r.find(_FOLIO_REF)) or ""
+        fch = _text(r.find(_FCH_REF)) or ""
+        refs.append(make_ref(
             tipo_doc_referencia=tpo,
             tipo_doc_referencia_palabras=REL_TIPO_DOC.get(str(tpo), str(tpo)),
             folio_referencia=folio,
@@ -247,13 +440,13 @@ def parse_xml(xml: Union[str, bytes, Path]) -> DTEData:
 
     # Impuestos
     imps: List[Impuesto] = []
-    for i in root.findall(f".//{x('ImptoReten')}"):
-        tipo = _text(i.find(x("TipoImp"))) or ""
-        monto = _int_text(i.find(x("MontoImp")), default=0)
+    for i in impuestos:
+        tipo = _text(i.find(_TIPO_IMP)) or ""
+        monto = _int_text(i.find(_MONTO_IMP), default=0)
         imps.append(
-            Impuesto(tipo=tipo, tipo_palabras=REL_IMP.get(tipo, tipo), monto=monto))
+            make_imp(tipo=tipo, tipo_palabras=REL_IMP.get(tipo, tipo), monto=monto))
 
-    return DTEData(
+    return _builder(DTEData, validate)(
         rut_proveedor=rut_proveedor,
         razon_social=razon_social,
         giro_proveedor=giro_proveedor,
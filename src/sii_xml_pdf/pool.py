@@ -0,0 +1,118 @@
+"""
+Ejecución en paralelo de tareas por archivo con un pool de procesos.
+
+Los resultados se entregan en el mismo orden de entrada (salida
+determinista) y los errores se recogen por archivo en vez de abortar el lote.
+"""
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class TaskResult:
+    name: str
+    value: Any = None
+    error: Optional[str] = None
+    kind: Optional[str] = None  # tipo de error, ver errors.error_kind
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    failures: List[TaskResult] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def add(self, result: TaskResult):
+        self.total += 1
+        if not result.ok:
+            self.failures.append(result)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self, stream=sys.stderr):
+        print(
+            f"📊 {self.total} archivos en {self.elapsed:.1f}s "
+            f"({self.files_per_sec:.1f} archivos/s), {len(self.failures)} con error",
+            file=stream,
+        )
+        for r in self.failures:
+            print(f"   ❌ {r.name}: {r.error}", file=stream)
+
+    def error_rows(self) -> List[dict]:
+        """Filas de errors.csv, una por archivo fallido."""
+        return [{"archivo": r.name, "documento": "", "tipo": r.kind or "error", "detalle": r.error}
+                for r in self.failures]
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+def _run_task(func: Callable, name: str, arg: Any) -> TaskResult:
+    try:
+        return TaskResult(name, value=func(arg))
+    except Exception as e:
+        from sii_xml_pdf.errors import error_kind
+
+        return TaskResult(name, error=f"{type(e).__name__}: {e}", kind=error_kind(e))
+
+
+def run_tasks(
+    func: Callable,
+    items: Iterable[Tuple[str, Any]],
+    jobs: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+    executor: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[TaskResult]:
+    """
+    Ejecuta ``func(arg)`` por cada ``(nombre, arg)`` de ``items``.
+
+    Con ``jobs > 1`` usa un pool de procesos; ``initializer`` corre una vez
+    por proceso (p.ej. para precargar plantillas y CSS). Como mucho
+    ``jobs * 4`` tareas quedan en vuelo, así que ``items`` puede ser un
+    generador de un lote muy grande.
+
+    Con ``executor`` usa ese pool (ya inicializado) y no lo cierra: sirve
+    para llamar muchas veces sin crear procesos nuevos (ver --watch).
+    """
+    if executor is not None:
+        yield from _submit_window(executor, func, items, (jobs or default_jobs()) * 4)
+        return
+
+    jobs = jobs or default_jobs()
+
+    if jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for name, arg in items:
+            yield _run_task(func, name, arg)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as ex:
+        yield from _submit_window(ex, func, items, jobs * 4)
+
+
+def _submit_window(ex: ProcessPoolExecutor, func: Callable, items, window: int):
+    pending = deque()
+    for name, arg in items:
+        pending.append(ex.submit(_run_task, func, name, arg))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
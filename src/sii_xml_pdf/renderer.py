@@ -1,60 +1,374 @@
-from jinja2 import Environment, PackageLoader, select_autoescape
-from weasyprint import HTML, CSS
-from num2words import num2words
-from typing import Optional, List
+from typing import TYPE_CHECKING, Dict, Iterable, NamedTuple, Optional, List, Tuple, Union
+from contextlib import contextmanager
 from importlib import resources
 import io
+import os
+import textwrap
+import threading
+import time
 
-from .models import DTEData
+from .models import DTEData, Impuesto, Item, Referencia
 from .formatting import format_clp, fecha_es_larga
-from .barcode import pdf417_svg_from_ted
-from .parser import parse_xml 
+from .barcode import DEFAULT_BARCODE_MODE, pdf417_markup_from_ted
+from .parser import parse_xml
+from .cache import cache_key, dte_cache_key
+from .errors import RenderError
 
-env = Environment(
-    loader=PackageLoader("sii_xml_pdf", "templates"),
-    autoescape=select_autoescape(["html"])
-)
-env.filters["clp"] = format_clp
+# Motores de render: "html" (Jinja + WeasyPrint, la plantilla completa) y
+# "fast" (dibujo directo con pydyf, ver fast.py)
+ENGINES = ("html", "fast")
+DEFAULT_ENGINE = "html"
 
+if TYPE_CHECKING:
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+# WeasyPrint, Jinja y num2words se importan recién al primer render: importar
+# este módulo (p.ej. desde la CLI o el servicio) no paga su arranque
+_env = None
+
+
+def _get_env():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, PackageLoader, select_autoescape
+
+        env = Environment(
+            loader=PackageLoader("sii_xml_pdf", "templates"),
+            autoescape=select_autoescape(["html"])
+        )
+        env.filters["clp"] = format_clp
+        _env = env
+    return _env
+
+
+_DEFAULT_CSS = resources.files("sii_xml_pdf").joinpath("templates/invoice.css")
+
+# Registro de hojas de estilo por proceso: ruta → (mtime, CSS parseados).
+# Todas comparten una sola FontConfiguration.
+_font_config: Optional["FontConfiguration"] = None
+_stylesheets: Dict[Optional[str], Tuple[int, List["CSS"]]] = {}
+_styles_lock = threading.Lock()
+
+
+def get_font_config() -> "FontConfiguration":
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def _mtime(path) -> int:
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def get_stylesheets(css_path: Optional[str] = None) -> List["CSS"]:
+    """
+    Devuelve el CSS (por defecto o ``css_path``) parseado una sola vez por
+    proceso. Solo se vuelve a leer si cambia el mtime del archivo.
+    """
+    mtime = _mtime(css_path or _DEFAULT_CSS)
+    with _styles_lock:
+        cached = _stylesheets.get(css_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, _default_css_list(css_path, get_font_config()))
+            _stylesheets[css_path] = cached
+    return cached[1]
+
+
+def preload(css_path: Optional[str] = None):
+    """Compila la plantilla y parsea el CSS (útil al iniciar un proceso)."""
+    _get_env().get_template("invoice.html")
+    get_stylesheets(css_path)
+
+
+def _warm_up_dte() -> DTEData:
+    # Documento mínimo (con un ítem, una referencia y un impuesto para pasar
+    # por todas las partes de la plantilla); no es un DTE válido
+    return DTEData(
+        rut_proveedor="11.111.111-1", razon_social="Calentamiento",
+        receptor_rut="22.222.222-2", receptor_razon_social="Calentamiento",
+        forma_pago=1, forma_pago_palabras="Contado",
+        monto_neto=1000, monto_total=1190, monto_iva=190, monto_exento=0,
+        numero_factura="1", fecha_emision="2025-01-01",
+        tipo_dte=33, tipo_dte_palabras="Factura Electrónica", tipo_dte_abreviatura="FC",
+        timbre_xml=('<TED version="1.0"><DD><RE>11111111-1</RE><TD>33</TD><F>1</F>'
+                    "<FE>2025-01-01</FE><RR>22222222-2</RR><RSR>Calentamiento</RSR>"
+                    "<MNT>1190</MNT><IT1>Calentamiento</IT1></DD></TED>"),
+        items=[Item(qty=1, rate=1000, descripcion="Calentamiento", total=1000)],
+        referencias=[Referencia(tipo_doc_referencia="801", tipo_doc_referencia_palabras="Orden de Compra",
+                                folio_referencia="1", fecha_referencia="2025-01-01")],
+        impuestos=[Impuesto(tipo="15", tipo_palabras="IVA retenido total", monto=0)],
+    )
+
+
+def warm_up(css_path: Optional[str] = None):
+    """
+    Deja el proceso listo para renderizar: además de preload(), hace un
+    render de prueba que se descarta (el primero paga la búsqueda de fuentes
+    y el arranque de WeasyPrint). Llamarla antes de hacer fork (Gunicorn con
+    preload, worker RQ) hace que los hijos hereden ese estado.
+    """
+    preload(css_path)
+    render_pdf(_warm_up_dte(), css_path=css_path)
+
+
+# Facturas largas (guías, consolidados mensuales con miles de líneas): una
+# sola <table> gigante hace que el layout de WeasyPrint crezca mucho peor que
+# lineal. Sobre LONG_INVOICE_ITEMS líneas los ítems se parten en una tabla
+# por página, cada una con su encabezado y el subtotal arrastrado.
+#
+# Cada tabla tiene que caber en su página (la siguiente empieza con un salto
+# forzado): las filas se cuentan por las líneas de texto que ocupan, no una
+# por ítem, estimando cómo se corta la descripción y el código en su columna
+# (Carta, 9.25pt, ver invoice.css).
+LONG_INVOICE_ITEMS = 60
+LINES_FIRST_PAGE = 32    # líneas de ítems en la primera página (lleva cabecera y receptor)
+LINES_PER_PAGE = 55      # en las siguientes, con holgura para Transporte y Suma y sigue
+ROW_PADDING_LINES = 0.3  # padding de cada fila, en líneas de texto
+DESC_CHARS_PER_LINE = 40  # columna Descripción (38% del ancho)
+CODE_CHARS_PER_LINE = 11  # columna Código (12%, corta en cualquier carácter)
+
+
+class ItemPage(NamedTuple):
+    start: int                  # nº de línea anterior a la primera de la página
+    rows: List[Item]
+    transporte: Optional[int]   # subtotal que viene de la página anterior
+    subtotal: int               # acumulado al final de la página
+
+
+def item_lines(item: Item) -> int:
+    """Líneas de texto que ocupa la fila de ``item`` (la columna más alta)."""
+    desc = item.descripcion or ""
+    lines = 1 if len(desc) <= DESC_CHARS_PER_LINE else \
+        len(textwrap.wrap(desc, DESC_CHARS_PER_LINE)) or 1
+    code = -(-len(item.codigo or "") // CODE_CHARS_PER_LINE)
+    return max(lines, code, 1)
+
+
+def item_pages(items: List[Item], first: Optional[float] = None,
+               per_page: Optional[float] = None) -> List[ItemPage]:
+    """
+    Reparte los ítems en tablas de una página, de a lo más ``first`` líneas
+    de texto en la primera y ``per_page`` en las demás. Con pocos ítems
+    devuelve una sola (la factura se ve como siempre).
+    """
+    if len(items) <= LONG_INVOICE_ITEMS:
+        return [ItemPage(0, items, None, sum(it.total for it in items))]
+    budget = first or LINES_FIRST_PAGE
+    per_page = per_page or LINES_PER_PAGE
+
+    pages = []
+    start, end, used, acumulado = 0, 0, 0.0, 0
+    for item in items:
+        height = item_lines(item) + ROW_PADDING_LINES
+        # Una fila que sola no cabe va igual, en su propia página
+        if end > start and used + height > budget:
+            rows = items[start:end]
+            transporte = acumulado if start else None
+            acumulado += sum(it.total for it in rows)
+            pages.append(ItemPage(start, rows, transporte, acumulado))
+            start, used, budget = end, 0.0, per_page
+        used += height
+        end += 1
+    rows = items[start:end]
+    pages.append(ItemPage(start, rows, acumulado if start else None,
+                          acumulado + sum(it.total for it in rows)))
+    return pages
+
+
+@contextmanager
+def _timed(timings: Optional[dict], stage: str):
+    """Suma a ``timings[stage]`` los segundos del bloque (si se pidió medir)."""
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+
+
+def _default_css_list(css_path: Optional[str],
+                      font_config: Optional["FontConfiguration"] = None) -> List["CSS"]:
+    from weasyprint import CSS
 
-def _default_css_list(css_path: Optional[str]) -> List[CSS]:
     if css_path:
-        return [CSS(filename=css_path)]
+        return [CSS(filename=css_path, font_config=font_config)]
     # Cargar el CSS del paquete si no se pasa ruta
-    with resources.files("sii_xml_pdf").joinpath("templates/invoice.css").open("r", encoding="utf-8") as f:
+    with _DEFAULT_CSS.open("r", encoding="utf-8") as f:
         css_text = f.read()
-    return [CSS(string=css_text)]
+    return [CSS(string=css_text, font_config=font_config)]
 
 
-def render_html(dte: DTEData) -> str:
-    tmpl = env.get_template("invoice.html")
-    barcode_svg = pdf417_svg_from_ted(dte.timbre_xml)
+def render_html(dte: DTEData, bookmark: Optional[str] = None,
+                barcode_mode: Optional[str] = None, timings: Optional[dict] = None) -> str:
+    from num2words import num2words
+
+    tmpl = _get_env().get_template("invoice.html")
+    with _timed(timings, "barcode"):
+        barcode_svg = pdf417_markup_from_ted(dte.timbre_xml, mode=barcode_mode or DEFAULT_BARCODE_MODE)
     monto_imp_ret = sum(i.monto for i in dte.impuestos) if dte.impuestos else 0
+    pages = item_pages(dte.items)
     ctx = {
         "d": dte,
+        "item_pages": pages,
+        "long_invoice": len(pages) > 1,  # layout en bloque, sin flex
         "fecha_emision_larga": fecha_es_larga(dte.fecha_emision),
         "barcode_svg": barcode_svg,
         "monto_total_palabras": num2words(dte.monto_total, lang="es").upper(),
         "monto_impuesto_y_retenciones": monto_imp_ret,
         "verificacion_url": "http://www.sii.cl",  # visible en el pie
+        "bookmark": bookmark,  # entrada del índice del PDF (modo batch)
     }
-    return tmpl.render(**ctx)
+    with _timed(timings, "html"):
+        return tmpl.render(**ctx)
+
+
+def render_pdf(dte: DTEData, css_path: Optional[str] = None,
+               stylesheets: Optional[List["CSS"]] = None,
+               font_config: Optional["FontConfiguration"] = None,
+               timings: Optional[dict] = None, engine: str = DEFAULT_ENGINE) -> bytes:
+    """
+    Genera el PDF de un DTE. Por defecto usa el registro de estilos del
+    proceso; ``stylesheets``/``font_config`` permiten pasar otros explícitos.
+
+    Si se entrega ``timings`` (dict), se anotan ahí los segundos de cada
+    etapa: "barcode", "html" y "pdf" (layout de WeasyPrint).
+
+    Con ``engine="fast"`` se dibuja directo con pydyf (sin plantilla ni
+    CSS, que se ignoran); todo su tiempo cuenta como "pdf".
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de render desconocido: {engine}")
+
+    # Cualquier fallo desde aquí es del render (el DTE ya viene parseado)
+    try:
+        if engine == "fast":
+            from .fast import render_pdf_fast
+
+            with _timed(timings, "pdf"):
+                return render_pdf_fast(dte)
+
+        from weasyprint import HTML
+
+        html = render_html(dte, timings=timings)
+        styles = stylesheets if stylesheets is not None else get_stylesheets(css_path)
+        font_config = font_config or get_font_config()
+        out = io.BytesIO()
+        with _timed(timings, "pdf"):
+            HTML(string=html).write_pdf(out, stylesheets=styles, font_config=font_config)
+        return out.getvalue()
+    except Exception as e:
+        raise RenderError(f"{type(e).__name__}: {e}") from e
+
 
+def _bookmark_label(dte: DTEData) -> str:
+    return f"{dte.tipo_dte_abreviatura} {dte.numero_factura} · {dte.razon_social} · {dte.fecha_emision}"
+
+
+def render_pdf_batch(dtes: Iterable[DTEData], combined: bool = True,
+                     css_path: Optional[str] = None, bookmarks: bool = True,
+                     errors: Optional[list] = None,
+                     engine: str = DEFAULT_ENGINE) -> Union[bytes, List[bytes]]:
+    """
+    Renderiza muchos DTE de una vez.
+
+    Con ``combined=True`` devuelve un único PDF con un documento tras otro
+    (cada uno empieza en página nueva): el CSS y las fuentes se embeben una
+    sola vez y, con ``bookmarks``, cada documento queda como entrada del
+    índice del PDF. Con ``combined=False`` devuelve una lista de PDFs.
+
+    Si se entrega ``errors``, los documentos que fallan se agregan ahí como
+    ``(dte, excepción)`` y se omiten en vez de abortar el lote.
+
+    El motor "fast" solo genera PDFs separados (``combined=False``).
+    """
+    if not combined:
+        pdfs = []
+        for dte in dtes:
+            try:
+                pdfs.append(render_pdf(dte, css_path=css_path, engine=engine))
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.append((dte, e))
+        return pdfs
+    if engine != "html":
+        raise ValueError(f"El motor {engine} no genera un PDF combinado")
+
+    from weasyprint import HTML
+
+    styles = get_stylesheets(css_path)
+    font_config = get_font_config()
+    first = None
+    pages = []
+    for dte in dtes:
+        try:
+            html = render_html(dte, bookmark=_bookmark_label(dte) if bookmarks else None)
+            doc = HTML(string=html).render(stylesheets=styles, font_config=font_config)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append((dte, e))
+            continue
+        if first is None:
+            first = doc
+        pages.extend(doc.pages)
+
+    if first is None:
+        raise ValueError("No hay documentos para renderizar")
 
-def render_pdf(dte: DTEData, css_path: Optional[str] = None) -> bytes:
-    html = render_html(dte)
-    styles = _default_css_list(css_path)
     out = io.BytesIO()
-    HTML(string=html).write_pdf(out, stylesheets=styles)
+    first.copy(pages).write_pdf(out)
     return out.getvalue()
 
 
-def render_pdf_from_xml(xml_bytes: bytes, css_path: Optional[str] = None) -> bytes:
+def render_pdf_cached(dte: DTEData, css_path: Optional[str] = None, cache=None,
+                      timings: Optional[dict] = None, engine: str = DEFAULT_ENGINE) -> bytes:
+    """
+    Como render_pdf, pero consultando antes la caché (si se entrega una)
+    con una clave derivada del DTEData ya parseado.
+    """
+    if cache is None:
+        return render_pdf(dte, css_path=css_path, timings=timings, engine=engine)
+
+    key = dte_cache_key(dte, css_path, engine)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_pdf(dte, css_path=css_path, timings=timings, engine=engine)
+        cache.set(key, pdf)
+    return pdf
+
+
+def render_pdf_from_xml(xml_bytes: bytes, css_path: Optional[str] = None,
+                        cache=None, key: Optional[str] = None,
+                        timings: Optional[dict] = None, engine: str = DEFAULT_ENGINE) -> bytes:
     """
     Recibe XML en bytes, devuelve el PDF en bytes.
+
+    Con ``cache`` (DiskCache/RedisCache) un acierto devuelve el PDF sin
+    parsear ni renderizar. ``key`` permite pasar la clave ya calculada.
+    ``timings`` recibe los segundos por etapa, como en render_pdf, más "parse".
     """
+    if cache is not None:
+        key = key or cache_key(xml_bytes, css_path, engine)
+        pdf = cache.get(key)
+        if pdf is not None:
+            return pdf
+
     # 1. Parsear el XML a un objeto DTEData
-    dte = parse_xml(xml_bytes)
+    with _timed(timings, "parse"):
+        dte = parse_xml(xml_bytes)
 
     # 2. Generar PDF a partir del DTEData
-    return render_pdf(dte, css_path=css_path)
+    pdf = render_pdf(dte, css_path=css_path, timings=timings, engine=engine)
+    if cache is not None:
+        cache.set(key, pdf)
+    return pdf
@@ -0,0 +1,118 @@
+import asyncio
+import pathlib
+import re
+import socketserver
+import threading
+
+import pytest
+
+from synthetic import make_dte_xml
+
+EXAMPLES = sorted((pathlib.Path(__file__).parent.parent / "examples" / "input").glob("*.xml"))
+
+
+@pytest.fixture
+def example_xml() -> bytes:
+    return EXAMPLES[0].read_bytes()
+
+
+def envelope(docs) -> bytes:
+    """Sobre EnvioDTE con los <DTE> de ``docs`` (XML de make_dte_xml)."""
+    body = b"".join(re.sub(rb"^<\?xml[^>]*\?>", b"", d) for d in docs)
+    return (b'<?xml version="1.0" encoding="ISO-8859-1"?>'
+            b'<EnvioDTE xmlns="http://www.sii.cl/SiiDte" version="1.0"><SetDTE ID="SetDoc">'
+            + body + b"</SetDTE></EnvioDTE>")
+
+
+def without(xml: bytes, tag: str) -> bytes:
+    """El XML sin el primer <tag>...</tag>."""
+    return re.sub(rb"<%s>[^<]*</%s>" % (tag.encode(), tag.encode()), b"", xml, count=1)
+
+
+class InlinePool:
+    """Pool de render que corre en el mismo proceso y anota cuántos renders van a la vez."""
+    workers = 4
+
+    def __init__(self):
+        self.running = self.peak = 0
+        self.calls = []
+
+    async def run(self, fn, *args, wait=False):
+        self.calls.append(fn.__name__)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            return fn(*args)
+        finally:
+            self.running -= 1
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Lo justo de SMTP para smtplib: EHLO, MAIL, RCPT, DATA, NOOP, RSET y QUIT."""
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        envelope = {}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].decode().upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif verb == "MAIL":
+                envelope = {"from": line[10:].strip().decode(), "to": []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(line[8:].strip().decode())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                if server.fail_data:
+                    self.reply(server.fail_data.pop(0))
+                    continue
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw == b".\r\n":
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                server.messages.append((envelope, b"".join(data)))
+                self.reply("250 OK queued")
+            elif verb in ("NOOP", "RSET"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.fail_data = []  # respuestas a devolver en los próximos DATA ("421 ...", "550 ...")
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStub()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
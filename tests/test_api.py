@@ -0,0 +1,121 @@
+import io
+import zipfile
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("httpx")
+
+from conftest import make_dte_xml
+
+AUTH = {"Authorization": "Bearer secreto"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from service import config, spool
+    # Las métricas leen el largo de las colas al importar main: sin Redis real tardaría
+    monkeypatch.setattr(config, "redis_conn", fakeredis.FakeRedis())
+    from service import main
+
+    monkeypatch.setattr(main, "API_TOKEN", "secreto")
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path))
+    enqueued = []
+    monkeypatch.setattr(main, "enqueue_zip_batch", lambda queues, path, checksum, email, entries:
+                        enqueued.append((path, checksum, email, entries)) or "lote")
+    return TestClient(main.app), enqueued, tmp_path
+
+
+def _zip(n=2) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i in range(n):
+            zf.writestr(f"{i}.xml", make_dte_xml(33, folio=i + 1))
+    return buf.getvalue()
+
+
+def test_render_zip_spools_the_upload(client):
+    from service import spool
+
+    c, enqueued, _ = client
+    data = _zip()
+    r = c.post("/render-zip", headers=AUTH, data={"email": "ana@example.com"},
+               files={"file": ("lote.zip", data, "application/zip")})
+    assert r.status_code == 200, r.text
+    assert r.json() == {"status": "queued", "job_id": "lote", "email": "ana@example.com"}
+    (path, checksum, email, entries), = enqueued
+    assert open(path, "rb").read() == data
+    assert checksum == spool.file_sha256(path)
+    assert [name for name, _ in entries] == ["0.xml", "1.xml"]
+
+
+def test_render_zip_without_content_length_stops_at_the_limit(client, monkeypatch):
+    from service import main
+
+    c, enqueued, tmp_path = client
+    monkeypatch.setattr(main, "MAX_ZIP_SIZE", 1000)
+    def body():
+        yield (b'--xx\r\nContent-Disposition: form-data; name="email"\r\n\r\nana@example.com\r\n'
+               b'--xx\r\nContent-Disposition: form-data; name="file"; filename="a.zip"\r\n'
+               b"Content-Type: application/zip\r\n\r\n")
+        for _ in range(100):
+            yield b"x" * 500
+        yield b"\r\n--xx--\r\n"
+
+    r = c.post("/render-zip", headers={**AUTH, "Content-Type": "multipart/form-data; boundary=xx"},
+               content=body())
+    assert r.status_code == 413
+    assert not enqueued
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spool_multipart_writes_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import hashlib
+
+    from service import spool
+
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(spool, "CHUNK_SIZE", 4096)
+    blocks = []
+    write_block = spool._write_block
+
+    def off_loop(f, h, data):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        blocks.append(len(data))
+        write_block(f, h, data)
+    monkeypatch.setattr(spool, "_write_block", off_loop)
+
+    payload = bytes(range(256)) * 100
+
+    class Request:
+        headers = {"content-type": "multipart/form-data; boundary=xx"}
+
+        async def stream(self):
+            yield b'--xx\r\nContent-Disposition: form-data; name="file"; filename="a.zip"\r\n\r\n'
+            for i in range(0, len(payload), 700):
+                yield payload[i:i + 700]
+            yield b'\r\n--xx\r\nContent-Disposition: form-data; name="email"\r\n\r\nana@example.com\r\n--xx--\r\n'
+
+    path, size, digest, fields = asyncio.run(spool.spool_multipart(Request(), "file", 1 << 20))
+    assert open(path, "rb").read() == payload and size == len(payload)
+    assert digest == hashlib.sha256(payload).hexdigest() and fields == {"email": "ana@example.com"}
+    # Por bloques: pocas idas al hilo, no una por cada pedazo del cuerpo
+    assert len(blocks) <= len(payload) // 4096 + 1 and all(n >= 4096 for n in blocks[:-1])
+
+
+def test_render_zip_rejects_bad_requests(client):
+    c, enqueued, tmp_path = client
+    r = c.post("/render-zip", headers=AUTH, files={"file": ("a.zip", _zip(), "application/zip")})
+    assert r.status_code == 422
+    r = c.post("/render-zip", headers=AUTH, data={"email": "ana@example.com"},
+               files={"file": ("a.zip", b"no es zip", "application/zip")})
+    assert r.status_code == 400
+    r = c.post("/render-zip", headers=AUTH, data={"email": "ana@example.com"})
+    assert r.status_code == 400
+    assert c.post("/render-zip", data={"email": "x"}).status_code == 401
+    assert not enqueued
+    assert list(tmp_path.iterdir()) == []
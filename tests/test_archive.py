@@ -0,0 +1,126 @@
+import csv
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import threading
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from conftest import make_dte_xml
+from sii_xml_pdf.archive import TarSink, ZipSink, iter_xml_members
+from sii_xml_pdf.cli import convert_archive
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+FILES = {
+    "a.xml": make_dte_xml(33, folio=1),
+    "sub/b.xml": make_dte_xml(34, folio=2),
+    "malo.xml": b"<DTE><Documento>",
+    "leeme.txt": b"no es XML",
+}
+
+
+def _zip_bytes(files=FILES) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def _tar_gz(path, files=FILES):
+    with tarfile.open(path, "w:gz") as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+def _check_output(names, errors_csv: bytes):
+    pdfs = [n for n in names if n != "errors.csv"]
+    assert len(pdfs) == 2 and all(n.endswith(".pdf") for n in pdfs)
+    rows = list(csv.DictReader(io.StringIO(errors_csv.decode("utf-8-sig"))))
+    assert [(r["archivo"], r["tipo"]) for r in rows] == [("malo.xml", "xml_mal_formado")]
+
+
+def test_iter_xml_members_reads_zip_and_tar(tmp_path):
+    names = ["a.xml", "sub/b.xml", "malo.xml"]
+    assert [n for n, _ in iter_xml_members(io.BytesIO(_zip_bytes()))] == names
+    with open(_tar_gz(tmp_path / "in.tar.gz"), "rb") as f:
+        assert [n for n, _ in iter_xml_members(f)] == names
+    with pytest.raises(ValueError):
+        iter_xml_members(io.BytesIO(b"ni zip ni tar" * 100))
+
+
+def test_convert_archive_zip_to_zip(tmp_path):
+    src = tmp_path / "in.zip"
+    src.write_bytes(_zip_bytes())
+    out = tmp_path / "out.zip"
+    convert_archive(str(src), out=str(out), jobs=1, engine="fast")
+
+    with zipfile.ZipFile(out) as zf:
+        _check_output(zf.namelist(), zf.read("errors.csv"))
+        pdf = next(n for n in zf.namelist() if n.endswith(".pdf"))
+        assert zf.read(pdf).startswith(b"%PDF")
+
+
+def test_convert_archive_tar_gz_to_tar_gz(tmp_path):
+    src = _tar_gz(tmp_path / "in.tar.gz")
+    out = tmp_path / "out.tgz"
+    convert_archive(str(src), out=str(out), jobs=2, engine="fast")
+
+    with tarfile.open(out, "r:gz") as tf:
+        _check_output(tf.getnames(), tf.extractfile("errors.csv").read())
+
+
+def _pipe_sink(sink_factory):
+    """Escribe dos PDFs falsos con el sink sobre un pipe (sin seek) y devuelve lo que salió."""
+    r, w = os.pipe()
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.extend(iter(lambda: os.read(r, 1 << 16), b"")))
+    reader.start()
+    with os.fdopen(w, "wb") as fileobj:
+        assert not fileobj.seekable()
+        sink = sink_factory(fileobj)
+        sink.write("1.pdf", b"%PDF uno")
+        sink.write("2.pdf", b"%PDF dos")
+        sink.close()
+    reader.join()
+    os.close(r)
+    return b"".join(chunks)
+
+
+def test_zip_sink_writes_to_a_pipe():
+    data = _pipe_sink(lambda f: ZipSink(f, close_file=False))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read("2.pdf") == b"%PDF dos"
+
+
+@pytest.mark.parametrize("gzip", [False, True])
+def test_tar_sink_streams_to_a_pipe(gzip):
+    data = _pipe_sink(lambda f: TarSink(f, gzip=gzip, close_file=False))
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tf:
+        assert tf.extractfile("1.pdf").read() == b"%PDF uno"
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar.gz"])
+def test_convert_archive_stdin_to_stdout(fmt):
+    env = dict(os.environ, PYTHONPATH=str(SRC))
+    proc = subprocess.run(
+        [sys.executable, "-m", "sii_xml_pdf.cli", "convert-archive", "-", "-o", "-",
+         "--format", fmt, "-j", "1", "--engine", "fast"],
+        input=_zip_bytes(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, timeout=120)
+    assert proc.returncode == 0, proc.stderr.decode()
+    assert b"malo.xml" in proc.stderr  # los mensajes van a stderr, no al archivo
+
+    if fmt == "zip":
+        with zipfile.ZipFile(io.BytesIO(proc.stdout)) as zf:
+            _check_output(zf.namelist(), zf.read("errors.csv"))
+    else:
+        with tarfile.open(fileobj=io.BytesIO(proc.stdout), mode="r:gz") as tf:
+            _check_output(tf.getnames(), tf.extractfile("errors.csv").read())
@@ -0,0 +1,57 @@
+import re
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import EXAMPLES
+from sii_xml_pdf.barcode import pdf417_markup_from_ted, pdf417_runs
+from sii_xml_pdf.parser import parse_xml
+
+
+@pytest.fixture(scope="module")
+def ted():
+    return parse_xml(EXAMPLES[0].read_bytes()).timbre_xml
+
+
+def _modules_from_runs(runs):
+    return {(col + i, row) for col, row, n in runs for i in range(n)}
+
+
+def test_path_markup_draws_the_same_modules_as_svg_rects(ted):
+    scale, ratio = 2, 3
+    svg = ET.fromstring(pdf417_markup_from_ted(ted, scale=scale, ratio=ratio, mode="svg"))
+    rects = {(int(float(r.get("x"))) // scale, int(float(r.get("y"))) // (scale * ratio))
+             for r in svg.iter("{http://www.w3.org/2000/svg}rect")
+             if r.get("fill", "#000000") in ("#000000", "black")}
+
+    path = pdf417_markup_from_ted(ted, scale=scale, ratio=ratio, mode="path")
+    runs = [(int(x) // scale, int(y) // (scale * ratio), int(w) // scale)
+            for x, y, w in re.findall(r"M(\d+) (\d+)h(\d+)", path)]
+    assert _modules_from_runs(runs) == rects
+
+
+def test_png_markup_has_the_same_modules(ted):
+    import base64
+    import io
+
+    from PIL import Image
+
+    markup = pdf417_markup_from_ted(ted, mode="png")
+    data = base64.b64decode(re.search(r"base64,([^\"]+)", markup).group(1))
+    image = Image.open(io.BytesIO(data)).convert("1")
+    (cols, rows), runs = pdf417_runs(ted)
+    ratio = image.height // rows
+    black = {(x, y // ratio) for y in range(0, image.height, ratio) for x in range(image.width)
+             if image.getpixel((x, y)) == 0}
+    assert black == _modules_from_runs(runs)
+
+
+def test_markup_is_memoized_and_ignores_whitespace(ted):
+    assert pdf417_markup_from_ted(ted) is pdf417_markup_from_ted(ted)
+    spaced = ted.replace("><", ">\n  <")
+    assert pdf417_markup_from_ted(spaced) == pdf417_markup_from_ted(ted)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        pdf417_markup_from_ted("<TED/>", mode="gif")
@@ -0,0 +1,119 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from conftest import InlinePool, make_dte_xml
+
+
+def _write_zip(path, files):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def test_zip_members_checks_the_directory_before_reading(tmp_path):
+    from service import spool
+    from service.batch import zip_members
+
+    path = _write_zip(tmp_path / "a.zip", {"a.xml": b"x" * 5000, "b.XML": b"y", "c.txt": b"z"})
+    assert zip_members(path, 10, 10_000) == ["a.xml", "b.XML"]
+    with pytest.raises(spool.UploadTooLarge, match="Máximo 1"):
+        zip_members(path, 1, 10_000)
+    with pytest.raises(spool.UploadTooLarge, match="a.xml"):
+        zip_members(path, 10, 1000)
+    (tmp_path / "b.zip").write_bytes(b"PK\x03\x04 roto")
+    with pytest.raises(ValueError):
+        zip_members(str(tmp_path / "b.zip"), 10, 1000)
+
+
+def test_stream_batch_caps_slots_and_cleans_the_spool(tmp_path):
+    from service.batch import stream_batch
+
+    files = {f"{n}.xml": make_dte_xml(33, folio=n + 1) for n in range(6)}
+    files["malo.xml"] = b"<DTE>"
+    path = _write_zip(tmp_path / "lote.zip", files)
+    members = [(name, path, name) for name in files]
+    pool = InlinePool()
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_batch(pool, members, "fast", 2, [path])])
+
+    data = asyncio.run(collect())
+    assert pool.peak == 2
+    assert not (tmp_path / "lote.zip").exists()
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        assert len([n for n in zf.namelist() if n.endswith(".pdf")]) == 6
+    assert manifest["total"] == 7 and manifest["fallidos"] == 1
+    bad, = [m for m in manifest["archivos"] if not m["ok"]]
+    assert bad["archivo"] == "malo.xml" and bad["tipo"] == "xml_mal_formado"
+
+
+def test_stream_batch_default_slots_render_in_parallel(tmp_path):
+    from service import config
+    from service.batch import stream_batch
+
+    files = {f"{n}.xml": make_dte_xml(33, folio=n + 1) for n in range(6)}
+    path = _write_zip(tmp_path / "lote.zip", files)
+    pool = InlinePool()
+    pool.workers = 2
+
+    async def collect():
+        members = [(name, path, name) for name in files]
+        return [chunk async for chunk in stream_batch(pool, members, "fast", config.RENDER_BATCH_SLOTS, [])]
+
+    asyncio.run(collect())
+    # Con 2 workers un lote no puede quedar en un solo cupo
+    assert config.RENDER_BATCH_SLOTS >= config.RENDER_WORKERS
+    assert pool.peak == 2 and len(pool.calls) == 6
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    from service import config, spool
+    monkeypatch.setattr(config, "redis_conn", fakeredis.FakeRedis())
+    from service import main
+
+    monkeypatch.setattr(main, "API_TOKEN", "secreto")
+    monkeypatch.setattr(main, "render_pool", InlinePool())
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path / "spool"))
+    return TestClient(main.app), main, tmp_path / "spool"
+
+
+def test_render_batch_endpoint(client, tmp_path):
+    c, _, spool_dir = client
+    zip_path = _write_zip(tmp_path / "x.zip", {"a.xml": make_dte_xml(33, folio=1)})
+    r = c.post("/render-batch?engine=fast", headers={"Authorization": "Bearer secreto"}, files=[
+        ("files", ("b.xml", make_dte_xml(34, folio=2), "text/xml")),
+        ("files", ("x.zip", open(zip_path, "rb").read(), "application/zip")),
+    ])
+    assert r.status_code == 200, r.text
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert len([n for n in zf.namelist() if n.endswith(".pdf")]) == 2
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_render_batch_limits(client, tmp_path, monkeypatch):
+    c, main, spool_dir = client
+    monkeypatch.setattr(main, "MAX_BATCH_FILES", 2)
+    monkeypatch.setattr(main, "MAX_XML_SIZE", 100_000)
+    auth = {"Authorization": "Bearer secreto"}
+    zip_path = _write_zip(tmp_path / "x.zip", {f"{n}.xml": b"<a/>" for n in range(3)})
+    r = c.post("/render-batch", headers=auth, files=[("files", ("x.zip", open(zip_path, "rb").read()))])
+    assert r.status_code == 413
+    big = _write_zip(tmp_path / "big.zip", {"big.xml": b" " * 200_000})
+    r = c.post("/render-batch", headers=auth, files=[("files", ("big.zip", open(big, "rb").read()))])
+    assert r.status_code == 413 and "big.xml" in r.text
+    r = c.post("/render-batch", headers=auth, files=[("files", ("c.xml", b" " * 200_000))])
+    assert r.status_code == 413
+    assert list(spool_dir.iterdir()) == []
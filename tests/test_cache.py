@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import make_dte_xml
+from sii_xml_pdf.cache import DiskCache, cache_key, dte_cache_key, render_fingerprint
+from sii_xml_pdf.parser import parse_xml
+
+
+def test_cache_key_depends_on_barcode_mode_and_fast_engine(tmp_path, monkeypatch):
+    import os
+
+    from sii_xml_pdf import barcode, cache
+
+    xml = make_dte_xml(33, folio=1)
+    html, fast = cache_key(xml), cache_key(xml, engine="fast")
+    monkeypatch.setattr(barcode, "DEFAULT_BARCODE_MODE", "png")
+    assert cache_key(xml) != html
+    assert cache_key(xml, engine="fast") == fast  # el motor rápido no usa el modo
+
+    # Un cambio en fast.py cambia solo las claves del motor rápido
+    fake = tmp_path / "fast.py"
+    fake.write_text("v1")
+    template_files = cache._template_files
+    monkeypatch.setattr(cache, "_template_files",
+                        lambda engine="html": [fake] if engine == "fast" else template_files(engine))
+    before, html = cache_key(xml, engine="fast"), cache_key(xml)
+    fake.write_text("v2")
+    os.utime(fake, ns=(0, fake.stat().st_mtime_ns + 1))
+    assert cache_key(xml, engine="fast") != before
+    assert cache_key(xml) == html
+
+
+def test_cache_key_rejects_malformed_xml():
+    from sii_xml_pdf.errors import MalformedXMLError
+
+    with pytest.raises(MalformedXMLError):
+        cache_key(b"<DTE><Documento>")
+
+
+def test_cache_key_ignores_serialization_details():
+    a = b'<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0"><Documento ID="X" a="1"></Documento></DTE>'
+    b = b'<?xml version="1.0"?>\n<DTE version="1.0" xmlns="http://www.sii.cl/SiiDte"><Documento a="1"  ID="X"/></DTE>'
+    assert cache_key(a) == cache_key(b)
+
+
+def test_cache_key_depends_on_content_engine_and_css(tmp_path):
+    xml = make_dte_xml(33, folio=1)
+    assert cache_key(xml) != cache_key(make_dte_xml(33, folio=2))
+    assert cache_key(xml) != cache_key(xml, engine="fast")
+    # El motor html conserva las claves de antes de existir "fast"
+    assert not cache_key(xml).endswith("-html")
+
+    css = tmp_path / "extra.css"
+    css.write_text("body { color: red }")
+    with_css = cache_key(xml, str(css))
+    assert with_css != cache_key(xml)
+    css.write_text("body { color: blue }")
+    assert cache_key(xml, str(css)) != with_css
+
+
+def test_dte_cache_key_is_stable():
+    xml = make_dte_xml(33, items=4)
+    assert dte_cache_key(parse_xml(xml)) == dte_cache_key(parse_xml(xml))
+    assert dte_cache_key(parse_xml(xml)).endswith(render_fingerprint())
+
+
+def test_disk_cache_roundtrip_and_eviction(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1000)
+    assert cache.get("ab" * 20) is None
+    for n in range(5):
+        cache.set(f"{n:02d}" * 20, bytes([n]) * 300)
+    assert cache.get("04" * 20) == bytes([4]) * 300
+    stored = sum(p.stat().st_size for p in tmp_path.glob("*/*.pdf"))
+    assert stored <= 1000
+    assert cache.get("00" * 20) is None  # el menos usado se fue primero
+
+
+def test_disk_cache_size_does_not_overcount(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=10_000)
+    for _ in range(20):
+        cache.set("ab" * 20, b"x" * 1000)  # siempre la misma clave
+    assert cache._size == 1000
+    assert cache.get("ab" * 20) == b"x" * 1000
+
+
+def test_disk_cache_counts_existing_files_once(tmp_path, monkeypatch):
+    DiskCache(tmp_path).set("cd" * 20, b"y" * 500)
+    cache = DiskCache(tmp_path, max_bytes=10_000)
+    assert cache._size == 500  # se cuenta al crearla, antes del fork
+    # Los set siguientes (p.ej. en un work-horse) no vuelven a recorrer el directorio
+    monkeypatch.setattr(DiskCache, "_entries", lambda self: pytest.fail("recorrió el directorio"))
+    cache.set("ef" * 20, b"z" * 200)
+    assert cache._size == 700
+
+
+def test_render_cache_is_built_once_per_process(monkeypatch):
+    config = pytest.importorskip("service.config")
+    built = []
+    monkeypatch.setattr(config, "_render_cache", False)
+    monkeypatch.setattr(config, "build_render_cache", lambda: built.append(1) or object())
+    assert config.get_render_cache() is config.get_render_cache()
+    assert built == [1]
@@ -0,0 +1,153 @@
+import csv
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from conftest import envelope, make_dte_xml, without
+from sii_xml_pdf.cli import extract_excel
+
+
+@pytest.fixture
+def folder(tmp_path):
+    src = tmp_path / "xml"
+    src.mkdir()
+    (src / "a.xml").write_bytes(make_dte_xml(33, items=2, folio=1))
+    # El segundo documento del sobre falla: el primero no debe quedar exportado
+    (src / "b.xml").write_bytes(envelope([make_dte_xml(33, items=3, folio=2),
+                                          without(make_dte_xml(33, folio=3), "RUTEmisor")]))
+    (src / "c.xml").write_bytes(b"<DTE><Documento>")
+    (src / "d.xml").write_bytes(make_dte_xml(34, items=1, folio=4))
+    return src
+
+
+def _rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize("jobs", [None, 1, 2])
+def test_extract_skips_whole_files_that_fail(folder, tmp_path, jobs):
+    out = tmp_path / f"out-{jobs}"
+    extract_excel(folder, out=out, jobs=jobs, fmt="csv")
+
+    documents = _rows(out / "documentos.csv")
+    assert [d["archivo"] for d in documents] == ["a.xml", "d.xml"]
+    errors = _rows(out / "errors.csv")
+    assert [(e["archivo"], e["tipo"]) for e in errors] == [
+        ("b.xml", "campos_faltantes"), ("c.xml", "xml_mal_formado")]
+
+
+def test_xlsx_errors_go_next_to_the_workbook(folder, tmp_path):
+    pytest.importorskip("openpyxl")
+    out = tmp_path / "listado.xlsx"
+    extract_excel(folder, out=out, fmt="xlsx")
+    assert out.exists()
+    assert [e["archivo"] for e in _rows(tmp_path / "listado_errors.csv")] == ["b.xml", "c.xml"]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_watch_reuses_the_pool_and_sees_in_place_edits(tmp_path, monkeypatch, jobs):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from sii_xml_pdf import cli, pool
+
+    src = tmp_path / "xml"
+    src.mkdir()
+    xml = src / "a.xml"
+    xml.write_bytes(make_dte_xml(33, folio=1))
+    out = tmp_path / "pdf"
+    out.mkdir()
+
+    created = []
+
+    class CountingExecutor(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            created.append(1)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(cli, "ProcessPoolExecutor", CountingExecutor)
+    monkeypatch.setattr(pool, "ProcessPoolExecutor", CountingExecutor)
+
+    steps = iter([
+        # Edición en el mismo archivo: el mtime del directorio no cambia
+        lambda: xml.write_bytes(make_dte_xml(33, folio=2)),
+        lambda: None,  # vuelta en que el archivo ya quedó estable
+        lambda: (src / "b.xml").write_bytes(make_dte_xml(34, folio=3)),
+        lambda: None,
+    ])
+
+    def fake_sleep(_):
+        step = next(steps, None)
+        if step is None:
+            raise KeyboardInterrupt
+        step()
+    monkeypatch.setattr(cli.time, "sleep", fake_sleep)
+
+    cli.convert_folder(src, out=out, jobs=jobs, watch=True, engine="fast")
+
+    folios = sorted(p.stem.rsplit(" ", 1)[1] for p in out.glob("*.pdf"))
+    assert folios == ["1", "2", "3"]
+    assert len(created) == (1 if jobs > 1 else 0)
+
+
+def test_combine_without_documents_exits_with_the_errors(tmp_path, monkeypatch):
+    from sii_xml_pdf import renderer
+    from sii_xml_pdf.cli import convert_folder
+
+    def render_pdf_batch(dtes, combined=False, errors=None, **kwargs):
+        # Como el real sin WeasyPrint: sin documentos no hay PDF combinado
+        if not list(dtes):
+            raise ValueError("No hay documentos para renderizar")
+        return b"%PDF"
+
+    monkeypatch.setattr(renderer, "render_pdf_batch", render_pdf_batch)
+
+    src = tmp_path / "xml"
+    src.mkdir()
+    (src / "malo.xml").write_bytes(b"<DTE><Documento>")
+    (src / "vacio.xml").write_bytes(envelope([]))
+    out = tmp_path / "out"
+    with pytest.raises(SystemExit) as exc:
+        convert_folder(src, out=out, combine=True)
+    assert exc.value.code != 0
+    assert [(e["archivo"], e["tipo"]) for e in _rows(out / "errors.csv")] == [
+        ("malo.xml", "xml_mal_formado"), ("vacio.xml", "xml_mal_formado")]
+    assert not (out / "combinado.pdf").exists()
+
+
+def test_xlsx_rolls_over_to_a_new_sheet_at_the_row_limit(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    from sii_xml_pdf.export import XlsxExporter
+
+    exporter = XlsxExporter(tmp_path / "listado.xlsx", max_rows=2)
+    for n in range(5):
+        exporter.write("items", ("1-9", 33, str(n), 1, "", f"item {n}", 1.0, 10.0, 10))
+    exporter.close()
+
+    wb = openpyxl.load_workbook(tmp_path / "listado.xlsx", read_only=True)
+    assert [name for name in wb.sheetnames if name.startswith("items")] == [
+        "items", "items (2)", "items (3)"]
+    rows = [r for name in ("items", "items (2)", "items (3)") for r in wb[name].iter_rows(values_only=True)]
+    assert [r[5] for r in rows if r[0] != "rut"] == [f"item {n}" for n in range(5)]
+    assert sum(r[0] == "rut" for r in rows) == 3  # cada hoja con su cabecera
+
+
+def test_help_does_not_import_weasyprint_or_pydantic():
+    src = Path(__file__).resolve().parents[1] / "src"
+    code = (
+        "import sys\n"
+        "from sii_xml_pdf import cli\n"
+        "sys.argv = ['sii-xml-pdf', '--help']\n"
+        "try:\n"
+        "    cli.main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(m for m in ('weasyprint', 'pydantic') if m in sys.modules), file=sys.stderr)\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=str(src)),
+                          capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    assert "usage" in proc.stdout.lower()
+    assert proc.stderr.strip() == ""
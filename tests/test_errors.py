@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import envelope, make_dte_xml, without
+from sii_xml_pdf.errors import MalformedXMLError, MissingFieldsError, error_row, errors_csv
+from sii_xml_pdf.parser import iter_dtes, parse_xml
+
+
+def test_missing_required_field():
+    with pytest.raises(MissingFieldsError, match="Folio"):
+        parse_xml(without(make_dte_xml(33), "Folio"))
+
+
+def test_malformed_xml():
+    with pytest.raises(MalformedXMLError):
+        parse_xml(b"<DTE><Documento>")
+
+
+def test_iter_dtes_collects_bad_documents_and_continues():
+    docs = [make_dte_xml(33, folio=1), without(make_dte_xml(33, folio=2), "FchEmis"),
+            make_dte_xml(33, folio=3)]
+    errors = []
+    assert [d.numero_factura for d in iter_dtes(envelope(docs), errors=errors)] == ["1", "3"]
+    assert len(errors) == 1 and isinstance(errors[0], MissingFieldsError)
+    assert "Documento 2" in str(errors[0])
+
+    with pytest.raises(MissingFieldsError):
+        list(iter_dtes(envelope(docs)))
+
+
+def test_iter_dtes_truncated_envelope():
+    data = envelope([make_dte_xml(33, folio=n) for n in (1, 2)])
+    with pytest.raises(MalformedXMLError):
+        list(iter_dtes(data[: len(data) - 200]))
+
+
+def test_errors_csv_rows():
+    rows = [error_row("a.xml", MissingFieldsError("faltan campos")),
+            error_row("b.xml", ValueError("otro"), "FAC 3")]
+    data = errors_csv(rows)
+    assert data.startswith(b"\xef\xbb\xbf")
+    lines = data.decode("utf-8-sig").splitlines()
+    assert lines == ["archivo,documento,tipo,detalle", "a.xml,,campos_faltantes,faltan campos",
+                     "b.xml,FAC 3,error,ValueError: otro"]
@@ -0,0 +1,72 @@
+import re
+import zlib
+
+import pytest
+
+from conftest import make_dte_xml
+from sii_xml_pdf.models import Item
+from sii_xml_pdf.parser import parse_xml
+from sii_xml_pdf.renderer import render_pdf
+
+
+def _pages(pdf: bytes) -> int:
+    return len(re.findall(rb"/Type /Page\b", pdf))
+
+
+def _text(pdf: bytes) -> bytes:
+    streams = re.findall(rb"stream\r?\n(.*?)\r?\nendstream", pdf, re.S)
+    return b"\n".join(zlib.decompress(s) for s in streams)
+
+
+def _render(items: int, descripcion: str = None) -> bytes:
+    dte = parse_xml(make_dte_xml(33, items=items, refs=1))
+    if descripcion is not None:
+        dte.items = [Item(qty=1, rate=100, descripcion=descripcion, total=100)
+                     for _ in range(items)]
+    return render_pdf(dte, engine="fast")
+
+
+def test_short_invoice_is_one_page():
+    pdf = _render(3)
+    assert pdf.startswith(b"%PDF")
+    assert _pages(pdf) == 1
+    assert b"Suma y sigue" not in _text(pdf)
+    assert b"(P\xe1gina 1 de 1)" in _text(pdf)
+
+
+def test_long_invoice_paginates_with_carry_rows():
+    pdf = _render(200)
+    pages = _pages(pdf)
+    text = _text(pdf)
+    assert pages > 2
+    assert text.count(b"(Suma y sigue)") == pages - 1
+    assert text.count(b"(Transporte)") == pages - 1
+    # Ninguna línea se pierde: aparece el número de la última
+    assert b"(200)" in text
+    assert b"(P\xe1gina %d de %d)" % (pages, pages) in text
+
+
+def test_wrapped_descriptions_take_more_pages():
+    short = _pages(_render(120, "TORNILLO"))
+    long = _pages(_render(120, "TORNILLO AUTOPERFORANTE " * 8))
+    assert long > short
+
+
+def test_separate_batch_collects_errors_and_continues(monkeypatch):
+    from sii_xml_pdf import fast
+    from sii_xml_pdf.errors import RenderError
+    from sii_xml_pdf.renderer import render_pdf_batch
+
+    dtes = [parse_xml(make_dte_xml(33, folio=n)) for n in (1, 2, 3)]
+    real = fast.render_pdf_fast
+    monkeypatch.setattr(fast, "render_pdf_fast",
+                        lambda dte: real(dte) if dte.numero_factura != "2" else 1 / 0)
+
+    errors = []
+    pdfs = render_pdf_batch(dtes, combined=False, errors=errors, engine="fast")
+    assert len(pdfs) == 2 and all(p.startswith(b"%PDF") for p in pdfs)
+    (dte, exc), = errors
+    assert dte.numero_factura == "2" and isinstance(exc, RenderError)
+
+    with pytest.raises(RenderError):
+        render_pdf_batch(dtes, combined=False, engine="fast")
@@ -0,0 +1,23 @@
+import io
+
+from conftest import envelope, make_dte_xml
+from sii_xml_pdf.parser import iter_dtes, parse_xml
+
+
+def test_iter_dtes_matches_parse_of_each_document():
+    docs = [make_dte_xml(33, items=3, folio=n) for n in range(1, 6)]
+    got = [d.model_dump() for d in iter_dtes(envelope(docs))]
+    assert got == [parse_xml(d).model_dump() for d in docs]
+
+
+def test_iter_dtes_single_dte():
+    assert [d.numero_factura for d in iter_dtes(make_dte_xml(33, folio=7))] == ["7"]
+
+
+def test_iter_dtes_streams_the_source():
+    data = envelope([make_dte_xml(33, items=5, folio=n) for n in range(1, 301)])
+    src = io.BytesIO(data)
+    first = next(iter_dtes(src))
+    assert first.numero_factura == "1"
+    # Con el primer documento entregado solo se leyó una parte del sobre
+    assert src.tell() < len(data) / 4
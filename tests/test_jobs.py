@@ -0,0 +1,260 @@
+import email
+import email.policy
+import io
+import os
+import zipfile
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("rq")
+
+from conftest import make_dte_xml, without
+from sii_xml_pdf.renderer import render_pdf
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, smtp_server):
+    from service import jobs, mailer, spool
+
+    conn = fakeredis.FakeRedis()
+    monkeypatch.setattr(jobs, "redis_conn", conn)
+    monkeypatch.setattr(mailer, "redis_conn", conn)
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setattr(mailer, "MAIL_COALESCE_SECONDS", 0)
+    # WeasyPrint no siempre está disponible: el motor rápido basta para el flujo
+    monkeypatch.setattr(jobs, "render_pdf_cached",
+                        lambda dte, cache=None, timings=None: render_pdf(dte, engine="fast"))
+    monkeypatch.setattr(mailer, "_pool", mailer.SMTPPool("127.0.0.1", smtp_server.port,
+                                                         starttls=False, timeout=5))
+    return jobs, conn, smtp_server
+
+
+def _run_mail_worker(conn):
+    """Atiende la cola de correos como el servicio mailer (sin fork) hasta vaciarla."""
+    from rq import Queue
+    from service.config import QUEUE_MAIL
+    from service.worker import MetricsSimpleWorker
+
+    MetricsSimpleWorker([Queue(QUEUE_MAIL, connection=conn)], connection=conn).work(burst=True)
+
+
+def _sent(smtp_server):
+    """[(destinatario, asunto, cuerpo, [(adjunto, bytes)])] de lo que recibió el SMTP de prueba."""
+    sent = []
+    for envelope, data in smtp_server.messages:
+        msg = email.message_from_bytes(data, policy=email.policy.default)
+        sent.append((msg["To"], msg["Subject"], msg.get_body().get_content(),
+                     [(p.get_filename(), p.get_content()) for p in msg.iter_attachments()]))
+    return sent
+
+
+def _upload(tmp_path, files) -> str:
+    from service import spool
+
+    path = tmp_path / "upload.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return str(path), spool.file_sha256(str(path))
+
+
+def test_batch_flow_keeps_pdfs_out_of_redis(service, tmp_path):
+    jobs, conn, smtp_server = service
+    bad = without(make_dte_xml(33, folio=3), "MntTotal")
+    zip_path, checksum = _upload(tmp_path, {
+        "a.xml": make_dte_xml(33, folio=1), "b.xml": make_dte_xml(34, folio=2),
+        "c.xml": bad, "d.xml": b"<DTE>",
+    })
+    names = jobs.zip_xml_names(zip_path)
+    batch_id = "b" * 32
+    conn.hset(jobs._batch_key(batch_id), mapping={"status": "queued", "total": len(names),
+                                                 "done": 0, "failed": 0})
+
+    jobs.render_chunk(batch_id, 0, zip_path, checksum, names[:2])
+    jobs.render_chunk(batch_id, 2, zip_path, checksum, names[2:])
+
+    # En Redis solo hay rutas, no PDFs
+    paths = conn.hvals(jobs._pdfs_key(batch_id))
+    assert len(paths) == 2 and all(p.endswith(b".pdf") and len(p) < 512 for p in paths)
+    assert jobs.get_batch_progress(batch_id)["done"] == 2
+    assert jobs.get_batch_progress(batch_id)["failed"] == 2
+
+    jobs.process_zip_and_send(batch_id, "ana@example.com", zip_path)
+    assert jobs.get_batch_progress(batch_id)["status"] == "mailing"
+    assert smtp_server.messages == []  # el envío queda en la cola de correos
+    _run_mail_worker(conn)
+
+    (to, _, body, attachments), = _sent(smtp_server)
+    assert to == "ana@example.com" and "2 documento(s) con error" in body
+    (name, data), = attachments
+    assert name == "pdfs.zip"
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        out = zf.namelist()
+        # En el orden del ZIP subido
+        assert [n[-6:] for n in out if n.endswith(".pdf")] == [" 1.pdf", " 2.pdf"]
+        assert "errors.csv" in out
+        assert zf.read("quarantine/c.xml") == bad
+        assert b"campos_faltantes" in zf.read("errors.csv")
+        assert b"xml_mal_formado" in zf.read("errors.csv")
+
+    # Todo se limpia: claves de Redis, PDFs del lote y ZIP subido
+    assert not conn.exists(jobs._pdfs_key(batch_id), jobs._errors_key(batch_id))
+    assert not (tmp_path / "spool" / batch_id).exists()
+    assert not (tmp_path / "upload.zip").exists()
+    assert jobs.get_batch_progress(batch_id)["status"] == "sent"
+    assert [p.name for p in (tmp_path / "spool").iterdir()] == []
+
+
+def _finished_batch(jobs, conn, tmp_path, batch_id, folio):
+    from service import spool
+
+    zip_path = str(tmp_path / f"{batch_id}.zip")
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("a.xml", make_dte_xml(33, folio=folio))
+    conn.hset(jobs._batch_key(batch_id), mapping={"total": 1, "done": 0, "failed": 0})
+    jobs.render_chunk(batch_id, 0, zip_path, spool.file_sha256(zip_path), ["a.xml"])
+    return zip_path
+
+
+def test_mail_worker_reuses_the_smtp_connection(service, tmp_path):
+    jobs, conn, smtp_server = service
+    for n in range(3):
+        batch_id = f"{n}" * 32
+        jobs.process_zip_and_send(batch_id, f"u{n}@example.com", _finished_batch(jobs, conn, tmp_path, batch_id, n + 1))
+    _run_mail_worker(conn)
+
+    assert [to for to, *_ in _sent(smtp_server)] == ["u0@example.com", "u1@example.com", "u2@example.com"]
+    assert smtp_server.connections == 1
+
+
+def test_coalesced_batches_go_in_one_mail(service, tmp_path, monkeypatch):
+    from rq import Queue
+    from service import mailer
+    from service.config import QUEUE_MAIL
+
+    jobs, conn, smtp_server = service
+    monkeypatch.setattr(mailer, "MAIL_COALESCE_SECONDS", 30)
+    for n in range(2):
+        batch_id = f"{n}" * 32
+        jobs.process_zip_and_send(batch_id, "ana@example.com", _finished_batch(jobs, conn, tmp_path, batch_id, n + 1))
+
+    # Un solo flush programado en la cola de correos para los dos lotes
+    scheduled = Queue(QUEUE_MAIL, connection=conn).scheduled_job_registry.get_job_ids()
+    assert len(scheduled) == 1
+    jobs.flush_outbox("ana@example.com")
+
+    (_, _, body, attachments), = _sent(smtp_server)
+    assert "(2 lotes)" in body
+    assert [name for name, _ in attachments] == ["pdfs.zip", "pdfs (2).zip"]
+    assert [p.name for p in (tmp_path / "spool").iterdir()] == []
+
+
+def test_failed_send_keeps_the_files_until_the_last_retry(service, tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from rq import Queue
+    from service.config import QUEUE_MAIL
+
+    jobs, conn, smtp_server = service
+    batch_id = "f" * 32
+    jobs.process_zip_and_send(batch_id, "ana@example.com", _finished_batch(jobs, conn, tmp_path, batch_id, 1))
+    assert jobs.get_batch_progress(batch_id)["status"] == "mailing"
+    job, = Queue(QUEUE_MAIL, connection=conn).jobs
+    assert job.retries_left == 3
+    attachments = job.args[3]
+
+    smtp_server.fail_data = ["550 rechazado", "550 rechazado"]
+    monkeypatch.setattr(jobs, "get_current_job", lambda: SimpleNamespace(retries_left=1))
+    with pytest.raises(Exception):
+        jobs.send_batch(*job.args)
+    # Quedan reintentos: el ZIP sigue en el spool y el lote no está en error
+    assert all(os.path.exists(path) for path, _ in attachments)
+    assert jobs.get_batch_progress(batch_id)["status"] == "mailing"
+
+    monkeypatch.setattr(jobs, "get_current_job", lambda: SimpleNamespace(retries_left=0))
+    with pytest.raises(Exception):
+        jobs.send_batch(*job.args)
+    assert not any(os.path.exists(path) for path, _ in attachments)
+    assert jobs.get_batch_progress(batch_id)["status"] == "error"
+
+
+def test_failed_assembly_keeps_the_pdfs_for_the_retry(service, tmp_path, monkeypatch):
+    from types import SimpleNamespace
+
+    jobs, conn, smtp_server = service
+    batch_id = "9" * 32
+    zip_path = _finished_batch(jobs, conn, tmp_path, batch_id, 1)
+
+    write_volumes = jobs._write_volumes
+
+    def boom(*args):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(jobs, "_write_volumes", boom)
+    monkeypatch.setattr(jobs, "get_current_job", lambda: SimpleNamespace(retries_left=2))
+    with pytest.raises(OSError):
+        jobs.process_zip_and_send(batch_id, "ana@example.com", zip_path)
+    assert os.path.exists(zip_path) and (tmp_path / "spool" / batch_id).exists()
+    assert conn.exists(jobs._pdfs_key(batch_id))
+
+    # El reintento arma y envía el lote completo
+    monkeypatch.setattr(jobs, "_write_volumes", write_volumes)
+    monkeypatch.setattr(jobs, "get_current_job", lambda: None)
+    jobs.process_zip_and_send(batch_id, "ana@example.com", zip_path)
+    _run_mail_worker(conn)
+    (_, _, _, attachments), = _sent(smtp_server)
+    assert attachments[0][0] == "pdfs.zip"
+    assert not os.path.exists(zip_path) and not (tmp_path / "spool" / batch_id).exists()
+
+
+def test_failed_flush_puts_the_batches_back_in_the_outbox(service, tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from service import mailer
+
+    jobs, conn, smtp_server = service
+    monkeypatch.setattr(mailer, "MAIL_COALESCE_SECONDS", 30)
+    batch_id = "7" * 32
+    jobs.process_zip_and_send(batch_id, "ana@example.com", _finished_batch(jobs, conn, tmp_path, batch_id, 1))
+
+    smtp_server.fail_data = ["550 rechazado"]
+    monkeypatch.setattr(jobs, "get_current_job", lambda: SimpleNamespace(retries_left=1))
+    with pytest.raises(Exception):
+        jobs.flush_outbox("ana@example.com")
+    entry, = mailer.outbox_take("ana@example.com")
+    assert entry["batch_id"] == batch_id
+    assert all(os.path.exists(path) for path, _ in entry["attachments"])
+
+
+def test_render_chunk_rejects_a_changed_upload(service, tmp_path):
+    jobs, conn, _ = service
+    zip_path, _ = _upload(tmp_path, {"a.xml": make_dte_xml(33)})
+    with pytest.raises(ValueError, match="no coincide"):
+        jobs.render_chunk("c" * 32, 0, zip_path, "0" * 64, ["a.xml"])
+
+
+def test_sweep_removes_stale_batch_dirs(service, tmp_path):
+    from service import spool
+
+    old = spool.batch_dir("d" * 32)
+    open(f"{old}/000000.0000.pdf", "wb").close()
+    assert spool.sweep(max_age=-1) >= 1
+    assert not (tmp_path / "spool" / ("d" * 32)).exists()
+
+
+def test_write_volumes_splits_files_from_disk(service, tmp_path):
+    jobs, _, _ = service
+    entries = []
+    for n in range(6):
+        path = tmp_path / f"{n}.pdf"
+        path.write_bytes(bytes([n]) * 4000)
+        entries.append((f"doc {n}.pdf", str(path)))
+    entries.append(("errors.csv", b"archivo\n"))
+
+    volumes = jobs._write_volumes("e" * 32, iter(entries), max_bytes=10_000)
+    assert [name for _, name in volumes] == ["pdfs-1.zip", "pdfs-2.zip", "pdfs-3.zip"]
+    names = []
+    for path, _ in volumes:
+        with zipfile.ZipFile(path) as zf:
+            names += zf.namelist()
+            assert zf.read(zf.namelist()[0])[:1] in {bytes([n]) for n in range(6)} | {b"a"}
+    assert names == [name for name, _ in entries]
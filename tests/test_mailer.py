@@ -0,0 +1,78 @@
+import email
+import email.policy
+import socket
+
+import pytest
+
+pytest.importorskip("fastapi_mail")
+
+from service import mailer
+
+
+@pytest.fixture
+def pool(smtp_server):
+    return mailer.SMTPPool("127.0.0.1", smtp_server.port, starttls=False, timeout=5)
+
+
+def _files(tmp_path, sizes):
+    paths = []
+    for n, size in enumerate(sizes):
+        path = tmp_path / f"pdfs-{n + 1}.zip"
+        path.write_bytes(b"\x00" * size)
+        paths.append((str(path), path.name))
+    return paths
+
+
+def test_encoded_size_matches_base64_in_the_message(tmp_path):
+    att = _files(tmp_path, [10_000])
+    msg = mailer.build_message("ana@example.com", "x", "y", att)
+    part, = msg.iter_attachments()
+    assert len(part.get_payload().encode().replace(b"\n", b"\r\n")) == mailer.encoded_size(10_000)
+    assert mailer.encoded_size(mailer.raw_budget(1_000_000)) <= 1_000_000
+
+
+def test_split_attachments_counts_base64(tmp_path):
+    # 700 KB en disco, ~950 KB en base64: dos no caben en un mensaje de 1,5 MB
+    atts = _files(tmp_path, [700_000, 700_000, 100_000])
+    groups = mailer.split_attachments(atts, 1_500_000)
+    assert [[name for _, name in g] for g in groups] == [["pdfs-1.zip"], ["pdfs-2.zip", "pdfs-3.zip"]]
+    assert len(mailer.split_attachments(atts, 3_000_000)) == 1
+
+
+def test_send_files_reuses_one_connection(tmp_path, pool, smtp_server):
+    atts = _files(tmp_path, [700_000, 700_000])
+    assert mailer.send_files("ana@example.com", "PDFs", "hola", atts, max_bytes=1_500_000, pool=pool) == 2
+    assert mailer.send_files("beto@example.com", "PDFs", "hola", atts[:1], pool=pool) == 1
+    assert smtp_server.connections == 1
+    subjects = [email.message_from_bytes(data, policy=email.policy.default)["Subject"]
+                for _, data in smtp_server.messages]
+    assert subjects == ["PDFs (1/2)", "PDFs (2/2)", "PDFs"]
+    assert smtp_server.messages[2][0]["to"] == ["<beto@example.com>"]
+    msg = email.message_from_bytes(smtp_server.messages[0][1], policy=email.policy.default)
+    part, = msg.iter_attachments()
+    assert part.get_filename() == "pdfs-1.zip" and len(part.get_content()) == 700_000
+
+
+def test_transient_errors_are_retried(pool, smtp_server):
+    smtp_server.fail_data = ["421 Try again later"]
+    pool.send(mailer.build_message("ana@example.com", "x", "y"), retries=2, backoff=0)
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.connections == 2  # tras el 421 abre otra conexión
+
+
+def test_permanent_errors_are_not_retried(pool, smtp_server):
+    import smtplib
+
+    smtp_server.fail_data = ["550 Mailbox unavailable", "550 Mailbox unavailable"]
+    with pytest.raises(smtplib.SMTPDataError):
+        pool.send(mailer.build_message("ana@example.com", "x", "y"), retries=2, backoff=0)
+    assert smtp_server.fail_data == ["550 Mailbox unavailable"]
+    assert smtp_server.messages == []
+
+
+def test_dead_connection_is_replaced(pool, smtp_server):
+    pool.send(mailer.build_message("ana@example.com", "x", "y"))
+    pool._conn.sock.shutdown(socket.SHUT_RDWR)  # el servidor cortó la conexión mientras estaba ociosa
+    pool.send(mailer.build_message("ana@example.com", "x", "y"))
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from conftest import make_dte_xml
+from sii_xml_pdf import cli
+from sii_xml_pdf.manifest import MANIFEST_NAME
+
+
+@pytest.fixture
+def folder(tmp_path):
+    src = tmp_path / "xml"
+    src.mkdir()
+    (src / "a.xml").write_bytes(make_dte_xml(33, folio=1))
+    (src / "b.xml").write_bytes(make_dte_xml(34, folio=2))
+    (src / "malo.xml").write_bytes(b"<DTE><Documento>")
+    return src
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """Nombres de los XML que se mandan a convertir en cada pasada."""
+    calls = []
+    convert_files = cli._convert_files
+
+    def spy(files, *args, **kwargs):
+        calls.append(sorted(f.name for f in files))
+        return convert_files(files, *args, **kwargs)
+    monkeypatch.setattr(cli, "_convert_files", spy)
+    return calls
+
+
+def _manifest(out):
+    return json.loads((out / MANIFEST_NAME).read_text(encoding="utf-8"))
+
+
+def test_incremental_skips_unchanged_and_retries_failures(folder, tmp_path, converted):
+    out = tmp_path / "pdf"
+    cli.convert_folder(folder, out=out, jobs=1, incremental=True, engine="fast")
+    assert converted == [["a.xml", "b.xml", "malo.xml"]]
+    # El que falló no queda anotado: la pasada siguiente lo vuelve a intentar
+    assert sorted(_manifest(out)["files"]) == ["a.xml", "b.xml"]
+
+    (folder / "b.xml").write_bytes(make_dte_xml(34, folio=3))
+    cli.convert_folder(folder, out=out, jobs=1, incremental=True, engine="fast")
+    assert converted[1] == ["b.xml", "malo.xml"]
+
+
+def test_incremental_prunes_deleted_files(folder, tmp_path, converted):
+    out = tmp_path / "pdf"
+    cli.convert_folder(folder, out=out, jobs=1, incremental=True, engine="fast")
+    (folder / "a.xml").unlink()
+    cli.convert_folder(folder, out=out, jobs=1, incremental=True, engine="fast")
+
+    manifest = _manifest(out)
+    assert sorted(manifest["files"]) == ["b.xml"]
+    assert len(manifest["outputs"]) == 1
+
+
+def test_watch_retries_failures_and_prunes_deleted_files(folder, tmp_path, converted, monkeypatch):
+    out = tmp_path / "pdf"
+    cycles = []
+
+    def sleep(_):
+        cycles.append(1)
+        if len(cycles) == 3:
+            (folder / "a.xml").unlink()
+        if len(cycles) == 5:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(cli.time, "sleep", sleep)
+
+    cli.convert_folder(folder, out=out, jobs=1, watch=True, engine="fast")
+    # Vuelta inicial con todo; malo.xml se reintenta cada vez que se asienta
+    assert converted[0] == ["a.xml", "b.xml", "malo.xml"]
+    assert converted[1:] and all(names == ["malo.xml"] for names in converted[1:])
+    assert sorted(_manifest(out)["files"]) == ["b.xml"]
@@ -0,0 +1,97 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("httpx")
+
+from prometheus_client import REGISTRY
+
+from conftest import InlinePool, make_dte_xml
+
+AUTH = {"Authorization": "Bearer secreto"}
+
+
+def boom():
+    raise RuntimeError("job de prueba que falla")
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from service import config
+    monkeypatch.setattr(config, "redis_conn", fakeredis.FakeRedis())
+    from service import main
+
+    monkeypatch.setattr(main, "API_TOKEN", "secreto")
+    monkeypatch.setattr(main, "render_pool", InlinePool())
+    monkeypatch.setattr(main, "render_cache", None)
+    return TestClient(main.app), main
+
+
+def test_render_is_measured_and_exposed(api):
+    client, main = api
+    latency = "xml2pdf_http_request_duration_seconds_count"
+    before = _value(latency, method="POST", route="/render", status="200")
+    pdfs = _value("xml2pdf_pdf_size_bytes_count")
+    stage = _value("xml2pdf_render_stage_seconds_count", stage="pdf")
+
+    r = client.post("/render?engine=fast", headers=AUTH,
+                    files={"file": ("a.xml", make_dte_xml(33), "text/xml")})
+    assert r.status_code == 200
+    assert _value(latency, method="POST", route="/render", status="200") == before + 1
+    assert _value("xml2pdf_pdf_size_bytes_count") == pdfs + 1
+    assert _value("xml2pdf_render_stage_seconds_count", stage="pdf") == stage + 1
+
+    text = client.get("/metrics").text
+    assert 'xml2pdf_http_request_duration_seconds_count{method="POST",route="/render",status="200"}' in text
+    assert "xml2pdf_render_in_flight 0.0" in text
+
+
+def test_queue_depth_is_read_on_each_scrape(api):
+    from service.config import QUEUE_SMALL
+
+    client, main = api
+    queue = main.queues[QUEUE_SMALL]
+    queue.connection.delete(queue.key)
+    queue.enqueue("os.getpid")
+    try:
+        text = client.get("/metrics").text
+        assert f'xml2pdf_queue_depth{{queue="{QUEUE_SMALL}"}} 1.0' in text
+    finally:
+        queue.connection.delete(queue.key)
+
+
+def test_queue_collector_survives_redis_errors():
+    from service.metrics import QueueDepthCollector
+
+    class Down:
+        name = "caida"
+
+        def __len__(self):
+            raise ConnectionError("Redis caído")
+
+    depth, failed = QueueDepthCollector([Down()]).collect()
+    assert depth.samples == [] and failed.samples == []
+
+
+def test_worker_records_job_duration_and_failures():
+    from rq import Queue
+
+    from service.worker import MetricsSimpleWorker
+
+    conn = fakeredis.FakeRedis()
+    queue = Queue("metricas", connection=conn)
+    queue.enqueue(boom)
+    queue.enqueue("os.getpid")
+    failures = _value("xml2pdf_job_failures_total", job="boom")
+    runs = _value("xml2pdf_job_duration_seconds_count", job="getpid")
+
+    MetricsSimpleWorker([queue], connection=conn).work(burst=True)
+    assert _value("xml2pdf_job_failures_total", job="boom") == failures + 1
+    assert _value("xml2pdf_job_duration_seconds_count", job="getpid") == runs + 1
+    assert _value("xml2pdf_job_failures_total", job="getpid") == 0
@@ -0,0 +1,25 @@
+import pytest
+
+from conftest import EXAMPLES, make_dte_xml
+from sii_xml_pdf.parser import parse_xml
+
+
+@pytest.mark.parametrize("path", EXAMPLES, ids=lambda p: p.name)
+def test_parses_the_examples(path):
+    dte = parse_xml(path.read_bytes())
+    assert dte.numero_factura and dte.rut_proveedor and dte.items
+    assert dte.monto_total > 0
+
+
+def test_parse_reads_totals_and_items():
+    dte = parse_xml(make_dte_xml(33, items=7, folio=42))
+    assert dte.numero_factura == "42"
+    assert dte.tipo_dte == 33
+    assert len(dte.items) == 7
+    assert dte.monto_total == dte.monto_neto + dte.monto_iva
+
+
+def test_parse_reads_references_and_taxes():
+    dte = parse_xml(make_dte_xml(61, items=2, refs=3, taxes=2))
+    assert len(dte.referencias) == 3
+    assert len(dte.impuestos) == 2
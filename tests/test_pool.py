@@ -0,0 +1,40 @@
+import pytest
+
+from sii_xml_pdf.errors import MalformedXMLError
+from sii_xml_pdf.pool import BatchSummary, run_tasks
+
+
+def _square(n):
+    if n < 0:
+        raise MalformedXMLError(f"negativo: {n}")
+    if n == 13:
+        raise RuntimeError("mala suerte")
+    return n * n
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run_tasks_keeps_input_order(jobs):
+    items = [(f"f{n}", n) for n in range(40)]
+    results = list(run_tasks(_square, items, jobs=jobs))
+    assert [r.name for r in results] == [name for name, _ in items]
+    assert [r.value for r in results if r.ok] == [n * n for n in range(40) if n != 13]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_tasks_reports_errors_without_aborting(jobs):
+    summary = BatchSummary()
+    for result in run_tasks(_square, [("a", 2), ("b", -1), ("c", 13), ("d", 3)], jobs=jobs):
+        summary.add(result)
+
+    assert summary.total == 4
+    failed = {r.name: r for r in summary.failures}
+    assert set(failed) == {"b", "c"}
+    assert failed["b"].error == "MalformedXMLError: negativo: -1"
+    assert failed["b"].kind == "xml_mal_formado"
+    assert failed["c"].kind == "error"
+    assert [row["archivo"] for row in summary.error_rows()] == ["b", "c"]
+
+
+def test_run_tasks_accepts_a_generator():
+    results = list(run_tasks(_square, ((str(n), n) for n in range(100)), jobs=2))
+    assert len(results) == 100
@@ -0,0 +1,108 @@
+import random
+import zipfile
+from collections import Counter
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("rq")
+
+from conftest import make_dte_xml
+from service import jobs
+from service.config import (QUEUE_BULK, QUEUE_LEGACY, QUEUE_MEDIUM, QUEUE_NAMES, QUEUE_SMALL,
+                            parse_queue_weights)
+
+MB = 1024 * 1024
+
+
+def test_select_queue_thresholds(monkeypatch):
+    monkeypatch.setattr(jobs, "QUEUE_SMALL_MAX_XML", 50)
+    monkeypatch.setattr(jobs, "QUEUE_SMALL_MAX_MB", 5)
+    monkeypatch.setattr(jobs, "QUEUE_MEDIUM_MAX_XML", 1000)
+    monkeypatch.setattr(jobs, "QUEUE_MEDIUM_MAX_MB", 100)
+
+    assert jobs.select_queue(50, 5 * MB) == QUEUE_SMALL
+    assert jobs.select_queue(51, 1) == QUEUE_MEDIUM
+    assert jobs.select_queue(1, 5 * MB + 1) == QUEUE_MEDIUM  # pocos XML pero pesados
+    assert jobs.select_queue(1000, 100 * MB) == QUEUE_MEDIUM
+    assert jobs.select_queue(1001, 1) == QUEUE_BULK
+    assert jobs.select_queue(1, 100 * MB + 1) == QUEUE_BULK
+
+
+def test_estimate_timeout_scales_and_is_capped(monkeypatch):
+    monkeypatch.setattr(jobs, "TIMEOUT_BASE", 60)
+    monkeypatch.setattr(jobs, "TIMEOUT_PER_XML", 2)
+    monkeypatch.setattr(jobs, "TIMEOUT_PER_MB", 30)
+    monkeypatch.setattr(jobs, "CHUNK_TIMEOUT", 600)
+
+    assert jobs.estimate_timeout(0, 0) == 60
+    assert jobs.estimate_timeout(20, 0) == 100
+    assert jobs.estimate_timeout(20, 2 * MB) == 160
+    assert jobs.estimate_timeout(20, 1000 * MB) == 600
+
+
+def test_parse_queue_weights():
+    assert parse_queue_weights("a=6, b=3 ,c,") == {"a": 6.0, "b": 3.0, "c": 1.0}
+    assert parse_queue_weights("a=0") == {"a": 0.0}
+    assert parse_queue_weights("") == {}
+    for bad in ("a=x", "a=-1", "=3", "a=nan"):
+        with pytest.raises(ValueError, match="QUEUE_WEIGHTS"):
+            parse_queue_weights(bad)
+
+
+def _worker(weights):
+    from rq import Queue
+    from service.worker import MetricsSimpleWorker
+
+    conn = fakeredis.FakeRedis()
+    queues = [Queue(name, connection=conn) for name in QUEUE_NAMES]
+    return MetricsSimpleWorker(queues, connection=conn, queue_weights=weights)
+
+
+def test_weighted_mixin_orders_queues_by_weight():
+    random.seed(1)
+    worker = _worker({QUEUE_SMALL: 6, QUEUE_MEDIUM: 3, QUEUE_BULK: 1})
+    firsts = Counter()
+    for _ in range(2000):
+        worker.reorder_queues(None)
+        order = [q.name for q in worker._ordered_queues]
+        assert sorted(order) == sorted(QUEUE_NAMES)
+        firsts[order[0]] += 1
+    # Cada cola sale primera en proporción a su peso, y bulk no se queda sin turno
+    assert firsts[QUEUE_SMALL] > firsts[QUEUE_MEDIUM] > firsts[QUEUE_BULK] > 0
+    assert 0.5 < firsts[QUEUE_SMALL] / 2000 < 0.7
+
+
+def test_weighted_mixin_zero_weight_goes_last():
+    worker = _worker({QUEUE_SMALL: 1, QUEUE_MEDIUM: 1, QUEUE_BULK: 0})
+    for _ in range(50):
+        worker.reorder_queues(None)
+        assert worker._ordered_queues[-1].name == QUEUE_BULK
+
+
+def test_legacy_queue_jobs_become_new_batches(tmp_path, monkeypatch):
+    import io
+
+    from rq import Queue
+    from service import spool
+
+    conn = fakeredis.FakeRedis()
+    monkeypatch.setattr(jobs, "redis_conn", conn)
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path / "spool"))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("a.xml", make_dte_xml(33, folio=1))
+    # Como lo encolaba la versión anterior: el ZIP completo y el email
+    legacy = Queue(QUEUE_LEGACY, connection=conn)
+    old = legacy.enqueue("service.jobs.process_zip_and_send", buf.getvalue(), "ana@example.com")
+    legacy.enqueue("service.jobs.process_zip_and_send", b"no es un zip", "beto@example.com")
+
+    queues = {name: Queue(name, connection=conn) for name in QUEUE_NAMES}
+    assert jobs.drain_legacy_queue(queues) == 1
+    assert legacy.count == 0 and not conn.exists(old.key)
+
+    batch, = [key for key in conn.scan_iter(f"{jobs.BATCH_PREFIX}*")]
+    progress = jobs.get_batch_progress(batch.decode()[len(jobs.BATCH_PREFIX):])
+    assert progress["total"] == 1 and progress["status"] == "queued"
+    assert queues[QUEUE_SMALL].count == 1  # el render_chunk; el final espera su dependencia
+    assert [p.name for p in (tmp_path / "spool").iterdir()] == [f"{old.id}.zip"]
@@ -0,0 +1,61 @@
+import signal
+
+import pytest
+
+from service import recycle
+
+MB = recycle.MB
+
+# Árbol falso: 1 -> (2, 3), 3 -> 4; PSS en MB por pid
+TREE = {1: [2, 3], 2: [], 3: [4], 4: []}
+PSS = {1: 100, 2: 50, 3: 30, 4: 20}
+
+
+@pytest.fixture
+def fake_proc(monkeypatch):
+    pss = dict(PSS)
+    monkeypatch.setattr(recycle, "process_rss", lambda pid: pss[pid] * MB)
+    monkeypatch.setattr(recycle, "_children", lambda pid: iter(TREE[pid]))
+    return pss
+
+
+def test_tree_rss_sums_the_whole_tree(fake_proc):
+    assert recycle.tree_rss(1) == 200 * MB
+    assert recycle.tree_rss(3) == 50 * MB
+
+
+def test_over_limit_threshold(fake_proc):
+    assert recycle.over_limit(199, pid=1)
+    assert not recycle.over_limit(200, pid=1)
+    assert not recycle.over_limit(0, pid=1)  # 0 = desactivado
+
+
+def test_watchdog_signals_the_process_once_over_the_limit(fake_proc, monkeypatch):
+    sent = []
+    monkeypatch.setattr(recycle.os, "getpid", lambda: 1)
+    monkeypatch.setattr(recycle.os, "kill", lambda pid, sig: sent.append((pid, sig)))
+
+    assert recycle.start_rss_watchdog(max_mb=0) is None
+    thread = recycle.start_rss_watchdog(max_mb=250, interval=0.01)
+    fake_proc[4] = 100  # el pool de render crece: 280 MB
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert sent == [(1, signal.SIGTERM)]
+
+
+def test_worker_stops_after_the_job_that_crosses_the_limit(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from rq import Queue
+
+    from service import worker
+
+    conn = fakeredis.FakeRedis()
+    queue = Queue("reciclaje", connection=conn)
+    queue.enqueue("os.getpid")
+    queue.enqueue("os.getpid")
+    monkeypatch.setattr(worker, "over_limit", lambda max_mb: True)
+    monkeypatch.setattr(worker, "tree_rss", lambda: 300 * MB)
+
+    worker.MetricsSimpleWorker([queue], connection=conn).work(burst=True)
+    # Terminó el primero y se detuvo: el segundo queda para el worker nuevo
+    assert len(queue) == 1
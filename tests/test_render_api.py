@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("httpx")
+
+from conftest import InlinePool, make_dte_xml
+from sii_xml_pdf.cache import DiskCache, cache_key
+
+AUTH = {"Authorization": "Bearer secreto"}
+XML = make_dte_xml(33, items=3)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from service import config
+    monkeypatch.setattr(config, "redis_conn", fakeredis.FakeRedis())
+    from service import main
+
+    pool = InlinePool()
+    monkeypatch.setattr(main, "API_TOKEN", "secreto")
+    monkeypatch.setattr(main, "render_pool", pool)
+    monkeypatch.setattr(main, "render_cache", None)
+
+    # La clave nunca debe calcularse en el event loop
+    def off_loop_key(*args, **kwargs):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return cache_key(*args, **kwargs)
+    monkeypatch.setattr(main, "cache_key", off_loop_key)
+    return TestClient(main.app), main, pool
+
+
+def _post(client, **headers):
+    return client.post("/render?engine=fast", headers={**AUTH, **headers},
+                       files={"file": ("a.xml", XML, "text/xml")})
+
+
+def test_without_cache_the_pool_computes_the_etag(api):
+    client, _, pool = api
+    r = _post(client)
+    assert r.status_code == 200 and r.content.startswith(b"%PDF")
+    assert r.headers["ETag"] == f'W/"{cache_key(XML, engine="fast")}"'
+    assert pool.calls == ["render_with_key"]
+
+
+def test_if_none_match_returns_304_without_rendering(api):
+    client, _, pool = api
+    etag = _post(client).headers["ETag"]
+    r = _post(client, **{"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["ETag"] == etag
+    assert pool.calls == ["render_with_key"]
+
+
+def test_cache_hit_skips_the_pool(api, tmp_path, monkeypatch):
+    client, main, pool = api
+    monkeypatch.setattr(main, "render_cache", DiskCache(tmp_path))
+    first = _post(client)
+    second = _post(client)
+    assert first.content == second.content
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert pool.calls == ["render_with_timings"]
+
+
+def test_malformed_xml_is_422(api):
+    client, _, _ = api
+    r = client.post("/render?engine=fast", headers=AUTH, files={"file": ("a.xml", b"<DTE>", "text/xml")})
+    assert r.status_code == 422
+
+
+def test_malformed_xml_with_if_none_match_is_422_not_304(api):
+    client, _, pool = api
+    r = client.post("/render?engine=fast", headers={**AUTH, "If-None-Match": "*"},
+                    files={"file": ("a.xml", b"<DTE><Documento>", "text/xml")})
+    assert r.status_code == 422 and pool.calls == []
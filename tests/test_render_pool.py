@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+httpx = pytest.importorskip("httpx")
+
+from conftest import make_dte_xml
+from service.render_pool import RenderPool, RenderPoolSaturated
+
+AUTH = {"Authorization": "Bearer secreto"}
+
+
+def slow_render(data, css=None, engine="html"):
+    """Render de prueba que se cuelga (corre en el pool: tiene que ser importable)."""
+    time.sleep(30)
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_timeout_recycles_the_stuck_worker():
+    async def scenario():
+        pool = RenderPool(workers=1, max_in_flight=1, timeout=0.5)
+        pool.start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(nap, 30)
+            assert pool.recycled == 1
+            # El único cupo vuelve apenas muere el proceso colgado
+            start = time.monotonic()
+            assert await pool.run(nap, 0, wait=True) == 0
+            assert time.monotonic() - start < 10
+            assert pool.in_flight == 0
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_timeout_waits_for_the_other_renders_of_the_old_executor():
+    async def scenario():
+        pool = RenderPool(workers=2, max_in_flight=2, timeout=1)
+        pool.start()
+        try:
+            ok = asyncio.ensure_future(pool.run(nap, 0.8))
+            await asyncio.sleep(0.3)
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(nap, 30)
+            # El render sano del executor viejo termina bien aunque se haya reciclado
+            assert await ok == 0.8
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from service import config
+    monkeypatch.setattr(config, "redis_conn", fakeredis.FakeRedis())
+    from service import main
+
+    pool = RenderPool(workers=1, max_in_flight=1, timeout=1)
+    monkeypatch.setattr(main, "API_TOKEN", "secreto")
+    monkeypatch.setattr(main, "render_pool", pool)
+    monkeypatch.setattr(main, "render_cache", None)
+    monkeypatch.setattr(main, "render_with_key", slow_render)
+    return main, pool
+
+
+async def _post(client):
+    return await client.post("/render?engine=fast", headers=AUTH,
+                             files={"file": ("a.xml", make_dte_xml(33), "text/xml")})
+
+
+def test_render_api_saturation_is_503_and_timeout_is_504(api):
+    main, pool = api
+
+    async def scenario():
+        pool.start()
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = asyncio.ensure_future(_post(client))
+                while not pool.saturated:
+                    await asyncio.sleep(0.01)
+                busy = await _post(client)
+                assert busy.status_code == 503 and busy.headers["Retry-After"] == str(main.RENDER_RETRY_AFTER)
+                assert (await first).status_code == 504
+                # El worker colgado se recicla: el cupo queda libre otra vez
+                while pool.in_flight:
+                    await asyncio.sleep(0.05)
+                assert not pool.saturated and pool.recycled == 1
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_saturated_pool_without_wait_raises():
+    async def scenario():
+        pool = RenderPool(workers=1, max_in_flight=1, timeout=5)
+        pool.start()
+        try:
+            first = asyncio.ensure_future(pool.run(nap, 0.5))
+            await asyncio.sleep(0.1)
+            with pytest.raises(RenderPoolSaturated):
+                await pool.run(nap, 0)
+            assert await first == 0.5
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
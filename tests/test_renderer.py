@@ -0,0 +1,73 @@
+from sii_xml_pdf import renderer
+from sii_xml_pdf.models import Item
+from sii_xml_pdf.renderer import item_lines, item_pages
+
+
+def _items(n, descripcion="TORNILLO", codigo="0"):
+    return [Item(qty=1, rate=10, descripcion=descripcion, codigo=codigo, total=10 + i)
+            for i in range(n)]
+
+
+def _cost(page):
+    return sum(item_lines(it) + renderer.ROW_PADDING_LINES for it in page.rows)
+
+
+def test_short_invoice_is_one_table():
+    items = _items(renderer.LONG_INVOICE_ITEMS)
+    (page,) = item_pages(items)
+    assert page.rows == items and page.transporte is None
+
+
+def test_one_line_rows_fill_each_page():
+    pages = item_pages(_items(200))
+    assert [len(p.rows) for p in pages] == [24, 42, 42, 42, 42, 8]
+
+
+def test_wrapped_descriptions_make_smaller_pages():
+    pages = item_pages(_items(200, descripcion="TORNILLO AUTOPERFORANTE CABEZA HEXAGONAL " * 3))
+    assert item_lines(pages[0].rows[0]) == 3
+    assert len(pages[1].rows) < 42
+    budgets = [renderer.LINES_FIRST_PAGE] + [renderer.LINES_PER_PAGE] * (len(pages) - 1)
+    assert all(_cost(p) <= b for p, b in zip(pages, budgets))
+
+
+def test_long_codes_also_wrap():
+    assert item_lines(Item(qty=1, rate=1, descripcion="X", codigo="A" * 30, total=1)) == 3
+
+
+def test_pages_keep_order_and_carry_subtotals():
+    items = _items(90) + _items(5, descripcion="X " * 2000) + _items(90)
+    pages = item_pages(items)
+    assert [it for p in pages for it in p.rows] == items
+    assert [p.start for p in pages] == [sum(len(q.rows) for q in pages[:i]) for i in range(len(pages))]
+    for prev, page in zip(pages, pages[1:]):
+        assert page.transporte == prev.subtotal
+    assert pages[-1].subtotal == sum(it.total for it in items)
+    # Una descripción que no cabe en una página va sola, sin arrastrar a otras filas
+    assert any(len(p.rows) == 1 and _cost(p) > renderer.LINES_PER_PAGE for p in pages)
+
+
+def test_get_stylesheets_parses_once_and_reloads_after_touching_the_css(tmp_path, monkeypatch):
+    import os
+
+    parsed = []
+    monkeypatch.setattr(renderer, "_stylesheets", {})
+    monkeypatch.setattr(renderer, "get_font_config", lambda: "fuentes")
+    monkeypatch.setattr(renderer, "_default_css_list",
+                        lambda css_path, font_config=None: parsed.append(css_path) or [object()])
+    css = tmp_path / "extra.css"
+    css.write_text("body { color: red }")
+
+    first = renderer.get_stylesheets(str(css))
+    assert renderer.get_stylesheets(str(css)) is first  # mismo proceso: no se vuelve a parsear
+    assert parsed == [str(css)]
+
+    st = css.stat()
+    os.utime(css, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    reloaded = renderer.get_stylesheets(str(css))
+    assert reloaded is not first and parsed == [str(css), str(css)]
+    assert renderer.get_stylesheets(str(css)) is reloaded
+
+    # El CSS del paquete tiene su propia entrada
+    renderer.get_stylesheets()
+    assert parsed[-1] is None
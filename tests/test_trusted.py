@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import EXAMPLES, make_dte_xml
+from sii_xml_pdf.parser import parse_xml
+
+SYNTHETIC = [make_dte_xml(tipo, items=items, refs=refs, taxes=taxes, folio=n)
+             for n, (tipo, items, refs, taxes) in enumerate(
+                 [(33, 1, 0, 0), (33, 25, 2, 1), (34, 10, 1, 0), (52, 5, 0, 2), (61, 3, 3, 0)], start=1)]
+
+
+@pytest.mark.parametrize("xml", [p.read_bytes() for p in EXAMPLES] + SYNTHETIC)
+def test_trusted_and_strict_parse_agree(xml):
+    trusted = parse_xml(xml)
+    strict = parse_xml(xml, validate=True)
+    assert trusted.model_dump() == strict.model_dump()
+    assert type(trusted.items[0].qty) is float
+    assert type(trusted.monto_total) is int
+
+
+def _instances():
+    dte = parse_xml(make_dte_xml(61, items=2, refs=2, taxes=2), validate=True)
+    return [dte, dte.items[0], dte.referencias[0], dte.impuestos[0]]
+
+
+@pytest.mark.parametrize("strict", _instances(), ids=lambda m: type(m).__name__)
+def test_trusted_builder_matches_model_validate(strict):
+    # _trusted arma el modelo a mano: si pydantic cambia sus internos, esto falla
+    from sii_xml_pdf.parser import _TRUSTED
+
+    model = type(strict)
+    assert model in _TRUSTED
+    trusted = _TRUSTED[model](**{name: getattr(strict, name) for name in model.model_fields})
+    assert type(trusted) is model
+    assert trusted == strict and repr(trusted) == repr(strict)
+    assert trusted.model_dump() == strict.model_dump()
+    assert trusted.model_dump_json() == strict.model_dump_json()
+    assert trusted.model_fields_set == strict.model_fields_set
+    assert trusted.model_copy() == strict